@@ -1,115 +1,546 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Request, Depends, Header, Query
+from fastapi.responses import Response, StreamingResponse
 import asyncio
+import time
 import uuid
 import logging
 import json
-from typing import Dict
-from backend.models import ArchitectureRequest, ArchitectureResponse, InvokeRequest, InvokeResponse, JobStatus
-from backend.prompt_generator import generate_architecture_details, generate_prompt
+from typing import Dict, List, Optional, Tuple
+from backend.models import TERMINAL_STATUSES, ArchitectureRequest, ArchitectureResponse, BatchGenerateRequest, InvokeRequest, InvokeResponse, JobPriority, JobStatus, JobStatusBatchRequest, RevisionRequest, RevisionResponse
+from backend.prompt_generator import PROMPT_VERSION, build_requirement, cached_architecture, generate_architecture_details, generate_prompt, primary_target, provider_router, registry_stats, request_key, revise_prompt, revision_plan
+from backend.precompute import precompute_index
+from backend import precompute_job
+from backend.failover import ProvidersUnavailableError
+from backend.limiter import client_identity, enforce_batch_rate_limit, enforce_rate_limit, enforce_request_limit
+from backend.prompt_builder import PromptBudgetError, desired_completion_tokens
+from backend.cache import result_cache
+from backend.singleflight import single_flight
+from backend.scheduler import QueueFullError, create_scheduler
 from backend.config import settings
+from backend.job_store import UnsupportedOperation, job_store
+from backend import deadlines, metrics, streams
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-# Use Redis for job persistence if available; otherwise, fallback to an in-memory store.
-try:
-    import redis
-    redis_client = redis.Redis(host=settings.redis_host, port=settings.redis_port, decode_responses=True)
-    _redis_available = True
-except Exception as e:
-    logger.warning("Redis not available, using in-memory job store. Error: %s", e)
-    _redis_available = False
-    jobs = {}
+MAX_WAIT_SECONDS = 60
+MAX_PAGE_SIZE = 200  # GET /jobs
+
+def request_deadline(x_request_timeout: Optional[float] = Header(None, gt=0)) -> Optional[float]:
+    # Absolute deadline from the client's timeout in seconds, carried into jobs and provider calls.
+    return deadlines.deadline_after(
+        x_request_timeout or settings.default_request_timeout, settings.max_request_timeout
+    )
+
+async def _within_deadline(deadline: Optional[float], func, *args):
+    # Runs a generation off the event loop under the request's budget.
+    try:
+        return await _in_budget(deadlines.Budget(deadline), func, *args)
+    except deadlines.DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+async def _in_budget(budget: deadlines.Budget, func, *args):
+    # Answers at the deadline itself rather than when the thread next checks the budget; the
+    # thread is told to stop so it spends no more tokens, and its late outcome is dropped.
+    with deadlines.scope(budget):
+        generation = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.wait_for(asyncio.shield(generation), budget.remaining())
+    except asyncio.TimeoutError:
+        raise deadlines.DeadlineExceeded()
+    finally:
+        if not generation.done():
+            budget.cancel.set()
+            generation.add_done_callback(_consume_result)
+
+def _resolve_mode(payload: ArchitectureRequest) -> str:
+    if payload.functional_requirement and payload.functional_requirement.strip():
+        return "functional"
+    if payload.architecture:
+        return "guided"
+    raise HTTPException(status_code=400, detail="Insufficient input provided.")
 
 @router.post("/generate-prompt", response_model=ArchitectureResponse)
-async def generate_prompt_endpoint(request: Request, payload: ArchitectureRequest):
+async def generate_prompt_endpoint(request: Request, response: Response, payload: ArchitectureRequest, deadline: Optional[float] = Depends(request_deadline)):
+    logger.info("Received generate-prompt request.")
+    with metrics.timed("request_parse"):
+        mode = _resolve_mode(payload)
+        inputs = payload.dict()
+    await _charge(request, response, mode, inputs)
     try:
-        logger.info("Received generate-prompt request.")
-        if payload.functional_requirement and payload.functional_requirement.strip():
-            mode = "functional"
-        elif payload.architecture:
-            mode = "guided"
-        else:
-            raise HTTPException(status_code=400, detail="Insufficient input provided.")
-        prompt_output = generate_prompt(mode, payload.dict())
+        # Off the event loop, so concurrent identical requests can coalesce onto one generation.
+        prompt_output = await _within_deadline(deadline, generate_prompt, mode, inputs)
         logger.info("Architecture generation complete.")
         return ArchitectureResponse(architecture=prompt_output)
+    except PromptBudgetError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProvidersUnavailableError as e:
+        raise _providers_unavailable(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error generating architecture.")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/generate-prompt/revisions", response_model=RevisionResponse)
+async def revise_prompt_endpoint(request: Request, response: Response, payload: RevisionRequest, deadline: Optional[float] = Depends(request_deadline)):
+    # Edits of a previous request regenerate only the plan sections the changed fields affect.
+    logger.info("Received generate-prompt revision request.")
+    with metrics.timed("request_parse"):
+        mode = _resolve_mode(payload.request)
+        inputs = payload.request.dict()
+    base_mode, base_inputs, base_architecture = await _load_revision_base(payload)
+    plan = revision_plan(mode, inputs, base_mode, base_inputs, base_architecture)
+    await enforce_rate_limit(
+        request, response, build_requirement(mode, inputs), settings.section_max_tokens * len(plan["regenerated"])
+    )
+    try:
+        result = await _within_deadline(deadline, revise_prompt, mode, inputs, base_mode, base_inputs, base_architecture)
+    except PromptBudgetError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProvidersUnavailableError as e:
+        raise _providers_unavailable(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error revising architecture.")
+        raise HTTPException(status_code=500, detail=str(e))
+    # Stored as a completed job so the revision can itself be the base_job_id of the next one.
+    job_id = str(uuid.uuid4())
+    await job_store.create(job_id, _job_record(
+        request, status=JobStatus.COMPLETED, result=result["architecture"], progress=100, mode=mode, inputs=inputs
+    ))
+    logger.info("Revision %s complete: regenerated %s, reused %s.", job_id, result["regenerated"], result["reused"])
+    return RevisionResponse(job_id=job_id, **result)
+
+async def _charge(request: Request, response: Response, mode: str, inputs: dict):
+    # Precomputed and cached results cost no provider tokens, so only a miss is charged its
+    # completion budget.
+    if await asyncio.to_thread(cached_architecture, mode, inputs) is not None:
+        await enforce_request_limit(request, response)
+    else:
+        await enforce_rate_limit(request, response, build_requirement(mode, inputs), desired_completion_tokens(mode, inputs))
+
+def _providers_unavailable(error: ProvidersUnavailableError) -> HTTPException:
+    # Every breaker is open: fail fast instead of waiting out provider timeouts.
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+
+async def _load_revision_base(payload: RevisionRequest) -> Tuple[str, dict, str]:
+    if payload.base_job_id:
+        job = await _load_job(payload.base_job_id)
+        if job["status"] != JobStatus.COMPLETED or not job.get("inputs"):
+            raise HTTPException(status_code=409, detail="Base job has no completed architecture request to revise.")
+        return job["mode"], job["inputs"], job["result"]
+    if payload.base_request is None or not payload.base_architecture:
+        raise HTTPException(status_code=400, detail="Provide base_job_id, or base_request with base_architecture.")
+    return _resolve_mode(payload.base_request), payload.base_request.dict(), payload.base_architecture
+
+@router.post("/generate-batch")
+async def generate_batch_endpoint(request: Request, response: Response, payload: BatchGenerateRequest, deadline: Optional[float] = Depends(request_deadline)):
+    # Streams one NDJSON line per input request in completion order. Identical requests
+    # (by canonical form) are generated once; per-item failures never abort the batch.
+    logger.info("Received generate-batch request with %d items.", len(payload.requests))
+    concurrency = min(payload.concurrency or settings.batch_concurrency, settings.batch_concurrency)
+    groups: Dict[str, List[int]] = {}
+    work: Dict[str, Tuple[str, dict]] = {}
+    rejected: List[Tuple[int, str]] = []
+    for index, item in enumerate(payload.requests):
+        try:
+            mode = _resolve_mode(item)
+        except HTTPException as e:
+            rejected.append((index, e.detail))
+            continue
+        inputs = item.dict()
+        key = request_key(mode, inputs)
+        groups.setdefault(key, []).append(index)
+        work.setdefault(key, (mode, inputs))
+    # Charged up front for the distinct generations that miss the cache only, as duplicates
+    # are generated once and cached results cost no provider tokens.
+    cached = await asyncio.to_thread(lambda: {key for key, item in work.items() if cached_architecture(*item) is not None})
+    await enforce_batch_rate_limit(
+        request, response,
+        [(build_requirement(mode, inputs), desired_completion_tokens(mode, inputs))
+         for key, (mode, inputs) in work.items() if key not in cached],
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    budget = deadlines.Budget(deadline)
+
+    async def run(key: str):
+        async with semaphore:
+            try:
+                return key, await _in_budget(budget, generate_prompt, *work[key]), None
+            except Exception as e:
+                logger.warning("Batch item failed: %s", e)
+                return key, None, str(e)
+
+    async def lines():
+        for index, error in rejected:
+            yield json.dumps({"index": index, "status": "error", "error": error}) + "\n"
+        tasks = [asyncio.create_task(run(key)) for key in groups]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                key, result, error = await next_done
+                for index in groups[key]:
+                    line = {"index": index, "status": "error", "error": error} if error else {
+                        "index": index, "status": "ok", "architecture": result
+                    }
+                    yield json.dumps(line) + "\n"
+        finally:
+            # Client went away: drop items still waiting for a slot and stop running generations.
+            budget.cancel.set()
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers=dict(response.headers))
+
 @router.post("/invoke-ai", response_model=InvokeResponse)
-async def invoke_ai_endpoint(request: Request, payload: InvokeRequest, background_tasks: BackgroundTasks):
+async def invoke_ai_endpoint(request: Request, response: Response, payload: InvokeRequest, priority: JobPriority = JobPriority.NORMAL, deadline: Optional[float] = Depends(request_deadline)):
     logger.info("Received invoke-ai request.")
     if not payload.prompt.strip():
         raise HTTPException(status_code=400, detail="Prompt cannot be empty.")
-    
-    job_id = str(uuid.uuid4())
-    job_data = {
+    await enforce_rate_limit(
+        request, response, payload.prompt, desired_completion_tokens("functional", {"functional_requirement": payload.prompt})
+    )
+    return await _start_job(request, priority, deadline, prompt=payload.prompt)
+
+@router.post("/generate-prompt/jobs", response_model=InvokeResponse)
+async def generate_prompt_job_endpoint(request: Request, response: Response, payload: ArchitectureRequest, priority: JobPriority = JobPriority.NORMAL, deadline: Optional[float] = Depends(request_deadline)):
+    logger.info("Received generate-prompt job request.")
+    with metrics.timed("request_parse"):
+        mode = _resolve_mode(payload)
+        inputs = payload.dict()
+    await _charge(request, response, mode, inputs)
+    return await _start_job(request, priority, deadline, mode=mode, inputs=inputs)
+
+def _job_record(request: Request, **fields) -> dict:
+    return {
         "status": JobStatus.PENDING,
         "result": None,
         "error": None,
-        "progress": 0
+        "progress": 0,
+        "trace_id": metrics.trace_id_var.get() or metrics.new_trace_id(),
+        "deadline": None,
+        # Indexed for GET /jobs (backend/job_store.py).
+        "client": client_identity(request),
+        "provider": "/".join(primary_target()),
+        "created_at": time.time(),
+        **fields,
     }
+
+async def _start_job(request: Request, priority: JobPriority, deadline: Optional[float], prompt: str = None, mode: str = None, inputs: dict = None) -> InvokeResponse:
+    job_id = str(uuid.uuid4())
+    job_data = _job_record(request, deadline=deadline)
+    trace_id = job_data["trace_id"]
+    if mode:
+        # Kept so a completed job can be the base of a revision.
+        job_data.update(mode=mode, inputs=inputs)
     
-    if _redis_available:
-        redis_client.setex(job_id, 86400, json.dumps(job_data))  # 24h TTL
-    else:
-        jobs[job_id] = job_data
+    await job_store.create(job_id, job_data)
     
-    background_tasks.add_task(process_architecture_generation, job_id, payload.prompt)
+    streams.open_stream(job_id)
+    payload = {
+        "prompt": prompt, "mode": mode, "inputs": inputs, "trace_id": trace_id, "enqueued_at": time.time(), "deadline": deadline
+    }
+    try:
+        position = await scheduler.submit(job_id, payload, priority)
+    except QueueFullError as e:
+        await job_store.delete(job_id)
+        await streams.close_stream(job_id)
+        raise HTTPException(
+            status_code=503,
+            detail="Generation queue is full, retry later.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     
-    return InvokeResponse(job_id=job_id, status=JobStatus.PENDING, message="Architecture generation started")
+    return InvokeResponse(job_id=job_id, status=JobStatus.PENDING, message=f"Architecture generation queued at position {position}")
+
+def require_admin(x_admin_token: str = Header(None)):
+    if settings.admin_token and x_admin_token != settings.admin_token:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+@router.get("/admin/generators", dependencies=[Depends(require_admin)])
+async def get_generator_stats():
+    return registry_stats()
+
+@router.get("/admin/providers", dependencies=[Depends(require_admin)])
+async def get_provider_health():
+    return provider_router.health()
+
+@router.get("/admin/precompute", dependencies=[Depends(require_admin)])
+async def get_precompute_stats():
+    return {"index": precompute_index.stats(PROMPT_VERSION, *primary_target()), "last_pass": precompute_job.last_pass()}
+
+@router.post("/admin/precompute", dependencies=[Depends(require_admin)])
+async def start_precompute_pass():
+    if not precompute_job.start_pass():
+        raise HTTPException(status_code=409, detail="A precompute pass is already running.")
+    return {"status": "started"}
+
+@router.post("/admin/compression/dictionary", dependencies=[Depends(require_admin)])
+async def train_compression_dictionary(samples: int = Query(None, ge=2, le=5000)):
+    # Trains the preset dictionary for stored results from up to `samples` completed results.
+    limit = samples or settings.compression_dictionary_samples
+    results: List[str] = []
+    try:
+        async for _, job in job_store.iter_jobs():
+            if job.get("status") == JobStatus.COMPLETED and isinstance(job.get("result"), str):
+                results.append(job["result"])
+                if len(results) >= limit:
+                    break
+        return await job_store.train_dictionary(results)
+    except UnsupportedOperation as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/admin/jobs", dependencies=[Depends(require_admin)])
+async def list_all_jobs(
+    client: Optional[str] = None,
+    status: Optional[JobStatus] = None,
+    provider: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+):
+    # Every client's jobs; `client` takes the identities stored with jobs ("key:..." / "ip:...").
+    return await _list_jobs({"client": client, "status": status, "provider": provider}, since, until, cursor, limit)
+
+@router.get("/admin/queue", dependencies=[Depends(require_admin)])
+async def get_queue_stats():
+    return await scheduler.stats()
+
+@router.get("/admin/cache", dependencies=[Depends(require_admin)])
+async def get_cache_stats():
+    return {"prompt_version": PROMPT_VERSION, "tiers": result_cache.stats(), "coalescing": single_flight.stats()}
+
+@router.delete("/admin/cache", dependencies=[Depends(require_admin)])
+async def invalidate_cache(prompt_version: str = PROMPT_VERSION):
+    removed = await asyncio.to_thread(result_cache.invalidate_version, prompt_version)
+    return {"prompt_version": prompt_version, "removed": removed}
+
+@router.get("/jobs")
+async def list_jobs(
+    request: Request,
+    status: Optional[JobStatus] = None,
+    provider: Optional[str] = None,
+    since: Optional[float] = Query(None, description="Created at or after (epoch seconds)"),
+    until: Optional[float] = Query(None, description="Created before (epoch seconds)"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+):
+    # The caller's jobs, newest first, without results; provider is "<provider>/<model>".
+    filters = {"client": client_identity(request), "status": status, "provider": provider}
+    return await _list_jobs(filters, since, until, cursor, limit)
+
+async def _list_jobs(filters: dict, since: Optional[float], until: Optional[float], cursor: Optional[str], limit: int) -> dict:
+    if cursor is not None and not _is_cursor(cursor):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    jobs, next_cursor = await job_store.list_jobs(filters, since, until, cursor, limit)
+    return {"jobs": jobs, "next_cursor": next_cursor}
+
+def _is_cursor(cursor: str) -> bool:
+    created_ms, _, job_id = cursor.partition(":")
+    return len(created_ms) == 13 and created_ms.isdigit() and bool(job_id)
 
 @router.get("/jobs/{job_id}")
-async def get_job_status(job_id: str):
-    if _redis_available:
-        job_str = redis_client.get(job_id)
-        if not job_str:
-            raise HTTPException(status_code=404, detail="Job not found")
-        job = json.loads(job_str)
-    else:
-        job = jobs.get(job_id)
-        if not job:
-            raise HTTPException(status_code=404, detail="Job not found")
+async def get_job_status(job_id: str, wait: float = Query(0, ge=0, le=MAX_WAIT_SECONDS)):
+    # With wait > 0 the request is held until the job changes status or the timeout expires.
+    job = await _load_job(job_id)
+    if wait and job["status"] not in TERMINAL_STATUSES:
+        changed = await job_store.watch(job_id)
+        current = await _load_job(job_id)
+        if current["status"] == job["status"]:
+            await _wait_any([changed], wait)
+            current = await _load_job(job_id)
+        job = current
+    return await _with_queue_position(job_id, job)
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    # Queued jobs leave the queue; a running generation stops at its next streamed chunk and
+    # its worker slot is released immediately (see _until_stopped).
+    job = await _load_job(job_id)
+    error = str(deadlines.JobCancelled())
+    if job["status"] in TERMINAL_STATUSES or not await job_store.update(
+        job_id, status=JobStatus.CANCELLED, error=error, progress=100
+    ):
+        current = await _load_job(job_id)
+        raise HTTPException(status_code=409, detail=f"Job already {current['status']}.")
+    dequeued = await scheduler.cancel(job_id)
+    metrics.JOBS_TOTAL.labels(JobStatus.CANCELLED.value).inc()
+    await streams.publish_async(job_id, "error", {"error": error, "status": JobStatus.CANCELLED})
+    logger.info("Job %s cancelled (%s)", job_id, "dequeued" if dequeued else "stopping generation")
+    return await _load_job(job_id)
+
+@router.post("/jobs/status")
+async def get_jobs_status(payload: JobStatusBatchRequest, wait: float = Query(0, ge=0, le=MAX_WAIT_SECONDS)):
+    # Batch lookup; with wait > 0 it returns as soon as any listed job changes status.
+    job_ids = list(dict.fromkeys(payload.job_ids))
+    found = await job_store.get_many(job_ids)
+    active = [job_id for job_id, job in found.items() if job and job["status"] not in TERMINAL_STATUSES]
+    if wait and active:
+        events = [await job_store.watch(job_id) for job_id in active]
+        current = await job_store.get_many(job_ids)
+        if all(current[job_id] and current[job_id]["status"] == found[job_id]["status"] for job_id in active):
+            await _wait_any(events, wait)
+            current = await job_store.get_many(job_ids)
+        found = current
+    return {
+        "jobs": {
+            job_id: await _with_queue_position(job_id, job) if job else None
+            for job_id, job in found.items()
+        }
+    }
+
+async def _load_job(job_id: str) -> dict:
+    job = await job_store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+async def _with_queue_position(job_id: str, job: dict) -> dict:
+    if job["status"] == JobStatus.PENDING:
+        job["queue_position"] = await scheduler.position(job_id)
     return job
 
-async def process_architecture_generation(job_id: str, prompt: str):
+async def _wait_any(events: List[asyncio.Event], timeout: float):
+    waiters = [asyncio.create_task(event.wait()) for event in events]
     try:
-        if _redis_available:
-            job = json.loads(redis_client.get(job_id))
-        else:
-            job = jobs[job_id]
-        job["status"] = JobStatus.PROCESSING
-        job["progress"] = 10  # Start progress
-        
-        # Run generation in a background thread for real processing.
-        architecture_details = await asyncio.to_thread(generate_architecture_details, prompt)
-        
-        job["status"] = JobStatus.COMPLETED
-        job["result"] = architecture_details
-        job["progress"] = 100
-        
-        if _redis_available:
-            with redis_client.pipeline() as pipe:
-                while True:
-                    try:
-                        pipe.watch(job_id)
-                        pipe.multi()
-                        pipe.setex(job_id, 86400, json.dumps(job))
-                        pipe.execute()
-                        break
-                    except redis.WatchError:
-                        continue
-        else:
-            jobs[job_id] = job
-    except Exception as e:
-        logger.error(f"Job {job_id} failed: {str(e)}")
-        job["status"] = JobStatus.FAILED
-        job["error"] = str(e)
-        job["progress"] = 100
-        if _redis_available:
-            redis_client.setex(job_id, 86400, json.dumps(job))
-        else:
-            jobs[job_id] = job
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    job = await _load_job(job_id)
+
+    async def event_source():
+        finished = job["status"] in TERMINAL_STATUSES
+        if finished and not await streams.has_stream(job_id):
+            # The stream has expired; replay the stored outcome as a single event.
+            if job["status"] == JobStatus.COMPLETED:
+                yield _sse("done", json.dumps({"result": job.get("result")}))
+            else:
+                yield _sse("error", json.dumps({"error": job["error"]}))
+            return
+        async for event, data in streams.subscribe(job_id):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield _sse(event, data)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+async def process_architecture_generation(
+    job_id: str,
+    prompt: str = None,
+    mode: str = None,
+    inputs: dict = None,
+    trace_id: str = None,
+    enqueued_at: float = None,
+    deadline: float = None,
+):
+    metrics.trace_id_var.set(trace_id or "")
+    metrics.JOBS_IN_FLIGHT.inc()
+    budget = deadlines.Budget(deadline)
+    status = JobStatus.FAILED
+    # Everything timed inside this scope, including the generation thread, lands in the job record.
+    with metrics.collect_timings() as timings:
+        usage = {}
+        if enqueued_at:
+            metrics.observe("queue_wait", max(0.0, time.time() - enqueued_at))
+        try:
+            budget.check()  # Out of time while queued: free the slot without generating.
+            if not await job_store.update(job_id, status=JobStatus.PROCESSING, progress=10):  # Start progress
+                raise deadlines.JobCancelled()  # Cancelled while queued
+            
+            # Run generation in a background thread for real processing, relaying tokens as they arrive.
+            callbacks = {
+                "on_token": lambda text: streams.publish(job_id, "token", {"text": text}),
+                "on_reset": lambda: streams.publish(job_id, "reset", {}),
+            }
+            with deadlines.scope(budget):
+                if mode:
+                    generation = asyncio.ensure_future(asyncio.to_thread(generate_prompt, mode, inputs, **callbacks))
+                else:
+                    generation = asyncio.ensure_future(asyncio.to_thread(generate_architecture_details, prompt, **callbacks))
+            architecture_details = await _until_stopped(job_id, budget, generation)
+            
+            status = JobStatus.COMPLETED
+            usage = _split_usage(timings)
+            if await job_store.update(job_id, status=status, result=architecture_details, progress=100, timings=timings, usage=usage):
+                await streams.publish_async(job_id, "done", {"result": architecture_details})
+            else:
+                status = JobStatus.CANCELLED  # Cancelled just as it finished
+        except deadlines.JobCancelled:
+            status = JobStatus.CANCELLED  # Recorded and announced by DELETE /jobs/{id}
+        except deadlines.DeadlineExceeded as e:
+            status = JobStatus.EXPIRED
+            usage = _split_usage(timings)
+            if await job_store.update(job_id, status=status, error=str(e), progress=100, timings=timings, usage=usage):
+                await streams.publish_async(job_id, "error", {"error": str(e), "status": status})
+        except Exception as e:
+            logger.error("Job %s failed (trace %s): %s", job_id, trace_id, e)
+            usage = _split_usage(timings)
+            await job_store.update(job_id, status=JobStatus.FAILED, error=str(e), progress=100, timings=timings, usage=usage)
+            await streams.publish_async(job_id, "error", {"error": str(e)})
+        finally:
+            metrics.JOBS_IN_FLIGHT.dec()
+            if status != JobStatus.CANCELLED:
+                metrics.JOBS_TOTAL.labels(status.value).inc()
+    logger.info("Job %s %s (trace %s): %s %s", job_id, status.value, trace_id, timings, usage)
+
+async def _until_stopped(job_id: str, budget: deadlines.Budget, generation: asyncio.Future) -> str:
+    # Waits for the generation unless the job is cancelled (by any API process) or its deadline
+    # passes first. Then the generation thread is told to stop at its next chunk, and the worker
+    # slot is released now rather than when the thread notices.
+    generation.add_done_callback(_consume_result)
+    try:
+        while not generation.done():
+            changed = await job_store.watch(job_id)
+            job = await job_store.get(job_id)
+            if job is None or job["status"] == JobStatus.CANCELLED:
+                raise deadlines.JobCancelled()
+            if budget.expired():
+                raise deadlines.DeadlineExceeded()
+            watcher = asyncio.ensure_future(changed.wait())
+            try:
+                await asyncio.wait([generation, watcher], timeout=budget.remaining(), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                watcher.cancel()
+        return generation.result()
+    except deadlines.GenerationStopped:
+        budget.cancel.set()
+        raise
+
+def _consume_result(future: asyncio.Future):
+    # An abandoned generation still finishes on its thread; its outcome is dropped.
+    if not future.cancelled():
+        future.exception()
+
+async def fail_abandoned_job(job_id: str):
+    # The queue gave up on a job whose workers kept dying mid-generation.
+    error = f"Job was interrupted {settings.job_max_deliveries} times and will not be retried."
+    if await job_store.update(job_id, status=JobStatus.FAILED, error=error, progress=100):
+        await streams.publish_async(job_id, "error", {"error": error})
+        metrics.JOBS_TOTAL.labels(JobStatus.FAILED.value).inc()
+
+def _split_usage(timings: dict) -> dict:
+    # Token counts share the timings scope; they are stored separately as the job's usage.
+    return {key: timings.pop(key) for key in metrics.USAGE_KEYS if key in timings}
+
+scheduler = create_scheduler(process_architecture_generation, on_abandoned=fail_abandoned_job)
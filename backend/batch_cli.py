@@ -0,0 +1,53 @@
+import argparse
+import json
+import sys
+import requests
+from backend.config import settings
+
+# Generate architectures for a JSONL file of ArchitectureRequest payloads through /generate-batch:
+#   python -m backend.batch_cli portfolio.jsonl -o results.jsonl
+# Each output line carries the input's 1-based "line" number; results arrive in completion order.
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Batch architecture generation")
+    parser.add_argument("input", help="JSONL file, one ArchitectureRequest per line")
+    parser.add_argument("-o", "--output", help="Results file (defaults to stdout)")
+    parser.add_argument("--url", default=settings.backend_url, help="Backend base URL")
+    parser.add_argument("--concurrency", type=int, help="Concurrent generations (capped by the server)")
+    args = parser.parse_args(argv)
+
+    line_numbers, batch, failures = [], [], 0
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        with open(args.input, encoding="utf-8") as source:
+            for number, line in enumerate(source, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    batch.append(json.loads(line))
+                    line_numbers.append(number)
+                except json.JSONDecodeError as e:
+                    failures += 1
+                    output.write(json.dumps({"line": number, "status": "error", "error": f"Invalid JSON: {e}"}) + "\n")
+        if not batch:
+            return 1 if failures else 0
+        body = {"requests": batch}
+        if args.concurrency:
+            body["concurrency"] = args.concurrency
+        with requests.post(f"{args.url}/generate-batch", json=body, stream=True, timeout=(10, None)) as response:
+            response.raise_for_status()
+            for raw in response.iter_lines(decode_unicode=True):
+                if not raw:
+                    continue
+                item = json.loads(raw)
+                item["line"] = line_numbers[item.pop("index")]
+                failures += item["status"] != "ok"
+                output.write(json.dumps(item) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"Processed {len(batch)} requests, {failures} failed.", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
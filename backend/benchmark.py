@@ -0,0 +1,357 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from backend.models import TERMINAL_STATUSES, JobStatus
+
+# Offline end-to-end benchmark of the service's own overhead (routing, validation, job store,
+# prompt building, sanitization, middleware) against the fake provider:
+#   python -m backend.benchmark --concurrency 32 --requests 500 -o results.json
+# The app runs in-process under uvicorn on a loopback port with its own event loop, which is
+# sampled for lag while the scenarios run. Results are JSON so runs can be diffed across commits.
+#
+# --cold-start instead measures startup in fresh interpreters: import time of the heavy modules
+# and, for a uvicorn subprocess, the time until /healthz and /readyz first answer 200:
+#   python -m backend.benchmark --cold-start --runs 5 --max-ready-ms 3000
+
+SCENARIOS = ("generate-prompt", "invoke-ai", "jobs")
+LAG_INTERVAL_SECONDS = 0.01
+JOB_WAIT_SECONDS = 30
+JOB_TIMEOUT_SECONDS = 300  # Give up on a job that has not finished by then
+COLD_START_MODULES = ("backend.config", "backend.prompt_generator", "backend.api", "backend.main")
+COLD_START_ENV = {"AI_PROVIDER": "fake", "REDIS_ENABLED": "false"}
+READY_TIMEOUT_SECONDS = 60
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+
+    def pick(pct: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))], 3)
+
+    return {
+        "p50": pick(50),
+        "p95": pick(95),
+        "p99": pick(99),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class LagMonitor:
+    # Sleeps LAG_INTERVAL_SECONDS on the server loop and records how late each wake-up was.
+    def __init__(self):
+        self.samples: List[Tuple[float, float]] = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LAG_INTERVAL_SECONDS
+            await asyncio.sleep(LAG_INTERVAL_SECONDS)
+            self.samples.append((time.perf_counter(), max(0.0, loop.time() - expected) * 1000))
+
+    def between(self, start: float, end: float) -> List[float]:
+        return [lag for at, lag in list(self.samples) if start <= at <= end]
+
+class InProcessServer:
+    def __init__(self, port: int):
+        import uvicorn
+        from backend.main import app
+        self.monitor = LagMonitor()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=asyncio.run, args=(self._serve(),), name="benchmark-server", daemon=True)
+
+    async def _serve(self):
+        monitor = asyncio.create_task(self.monitor.run())
+        try:
+            await self.server.serve()
+        finally:
+            monitor.cancel()
+
+    def start(self, timeout: float = 30):
+        from backend.lifecycle import readiness
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        # Serving starts before warm-up finishes; measure the warmed-up service.
+        while not (self.server.started and readiness.started):
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("Benchmark server failed to start")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+def _architecture_payload(index: int, reuse: bool) -> dict:
+    tag = "shared" if reuse else f"{index}-{uuid.uuid4().hex[:8]}"
+    return {"functional_requirement": f"Benchmark request {tag}: an online marketplace with search, carts and payments."}
+
+def _invoke_payload(index: int, reuse: bool) -> dict:
+    tag = "shared" if reuse else f"{index}-{uuid.uuid4().hex[:8]}"
+    return {"prompt": f"Benchmark request {tag}. Design the architecture of an online marketplace with search, carts and payments."}
+
+async def _run_scenario(
+    client, name: str, total: int, concurrency: int, reuse: bool, job_ids: List[str], job_timeout: float = JOB_TIMEOUT_SECONDS
+) -> dict:
+    latencies: List[float] = []
+    end_to_end: List[float] = []
+    errors: Dict[str, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def fail(reason: str):
+        errors[reason] = errors.get(reason, 0) + 1
+
+    async def one(index: int):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                if name == "generate-prompt":
+                    response = await client.post("/generate-prompt", json=_architecture_payload(index, reuse))
+                elif name == "invoke-ai":
+                    response = await client.post("/invoke-ai", json=_invoke_payload(index, reuse))
+                else:
+                    response = await client.get(f"/jobs/{job_ids[index % len(job_ids)]}")
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    fail(f"http_{response.status_code}")
+                    return
+                if name != "invoke-ai":
+                    return
+                job_id = response.json()["job_id"]
+                job_ids.append(job_id)
+                give_up = time.monotonic() + job_timeout
+                while True:
+                    remaining = give_up - time.monotonic()
+                    if remaining <= 0:
+                        fail("job_timeout")
+                        return
+                    wait = min(JOB_WAIT_SECONDS, remaining)
+                    job = (await client.get(f"/jobs/{job_id}", params={"wait": wait})).json()
+                    if job["status"] in TERMINAL_STATUSES:
+                        break
+                end_to_end.append((time.perf_counter() - started) * 1000)
+                if job["status"] != JobStatus.COMPLETED:
+                    fail(f"job_{job['status']}")
+            except Exception as e:
+                fail(type(e).__name__)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(total)))
+    duration = time.perf_counter() - started
+    result = {
+        "requests": total,
+        "errors": sum(errors.values()),
+        "error_kinds": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(total / duration, 2) if duration else 0.0,
+        "latency_ms": _percentiles(latencies),
+    }
+    if end_to_end:
+        result["job_latency_ms"] = _percentiles(end_to_end)
+    return result
+
+async def _drive(base_url: str, args, monitor: LagMonitor) -> Dict[str, dict]:
+    import httpx
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results: Dict[str, dict] = {}
+    job_ids: List[str] = []
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=JOB_WAIT_SECONDS * 2) as client:
+        for name in args.scenarios:
+            if name == "jobs" and not job_ids:
+                # Status polling needs jobs to look up; seed a few finished ones.
+                await _run_scenario(
+                    client, "invoke-ai", min(args.requests, args.concurrency), args.concurrency, False, job_ids, args.job_timeout
+                )
+            if args.warmup:
+                await _run_scenario(client, name, args.warmup, args.concurrency, args.reuse_payloads, [*job_ids], args.job_timeout)
+            window_start = time.perf_counter()
+            results[name] = await _run_scenario(
+                client, name, args.requests, args.concurrency, args.reuse_payloads, job_ids, args.job_timeout
+            )
+            results[name]["event_loop_lag_ms"] = _percentiles(monitor.between(window_start, time.perf_counter()))
+    return results
+
+def _import_seconds(module: str, env: dict) -> float:
+    code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def _time_to_ready(env: dict) -> Dict[str, float]:
+    # Seconds from spawning uvicorn until /healthz and /readyz first return 200.
+    import httpx
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    marks: Dict[str, float] = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as client:
+            while len(marks) < 2:
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with {process.returncode} before becoming ready")
+                if time.perf_counter() - started > READY_TIMEOUT_SECONDS:
+                    raise RuntimeError("Service not ready within the cold-start timeout")
+                for path in ("/healthz", "/readyz"):
+                    if path in marks:
+                        continue
+                    try:
+                        if client.get(path).status_code == 200:
+                            marks[path] = time.perf_counter() - started
+                    except httpx.TransportError:
+                        pass
+                time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return marks
+
+def cold_start(args) -> dict:
+    env = {**os.environ, **COLD_START_ENV}
+    imports: Dict[str, List[float]] = {module: [] for module in COLD_START_MODULES}
+    healthz: List[float] = []
+    readyz: List[float] = []
+    for _ in range(args.runs):
+        for module in COLD_START_MODULES:
+            imports[module].append(_import_seconds(module, env) * 1000)
+        marks = _time_to_ready(env)
+        healthz.append(marks["/healthz"] * 1000)
+        readyz.append(marks["/readyz"] * 1000)
+    return {
+        "import_ms": {module: _percentiles(samples) for module, samples in imports.items()},
+        "time_to_healthz_ms": _percentiles(healthz),
+        "time_to_readyz_ms": _percentiles(readyz),
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline service overhead benchmark (fake provider)")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--reuse-payloads", action="store_true", help="Send identical payloads (exercises the result cache)")
+    parser.add_argument("--job-timeout", type=float, default=JOB_TIMEOUT_SECONDS, help="Seconds to wait for each invoke-ai job")
+    parser.add_argument("--latency-ms", type=float, help="Fake provider mean time to first token")
+    parser.add_argument("--distribution", choices=("constant", "uniform", "exponential", "lognormal"))
+    parser.add_argument("--jitter", type=float)
+    parser.add_argument("--tokens-per-second", type=float)
+    parser.add_argument("--failure-rate", type=float)
+    parser.add_argument("--invalid-rate", type=float)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--log-level", default="WARNING", help="Service log level during the run")
+    parser.add_argument("--cold-start", action="store_true", help="Measure import and time-to-ready in fresh processes instead")
+    parser.add_argument("--runs", type=int, default=5, help="Cold-start repetitions")
+    parser.add_argument("--max-import-ms", type=float, help="Fail if importing backend.main exceeds this (p50)")
+    parser.add_argument("--max-ready-ms", type=float, help="Fail if /readyz takes longer than this (p50)")
+    parser.add_argument("-o", "--output", help="Results file (defaults to stdout)")
+    args = parser.parse_args(argv)
+
+    if args.cold_start:
+        results = cold_start(args)
+        report = {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "config": {"runs": args.runs, "env": COLD_START_ENV},
+            "cold_start": results,
+        }
+        _write_report(report, args.output)
+        regressions = [
+            budget_name
+            for budget_name, budget, measured in (
+                ("max_import_ms", args.max_import_ms, results["import_ms"]["backend.main"]["p50"]),
+                ("max_ready_ms", args.max_ready_ms, results["time_to_readyz_ms"]["p50"]),
+            )
+            if budget is not None and measured > budget
+        ]
+        for budget_name in regressions:
+            print(f"Cold-start budget exceeded: {budget_name}", file=sys.stderr)
+        return 1 if regressions else 0
+
+    # backend/__init__ has already loaded settings; override them before any module that reads
+    # them at import time (redis_client, the generator registry, the app) is loaded.
+    from backend.config import settings
+    overrides = {
+        "ai_provider": "fake",
+        "redis_enabled": False,
+        "warm_generators_on_startup": True,
+        # One loopback client would exhaust a real budget; keep the limiter in the path, unbounded.
+        "rate_limit_per_minute": 10 ** 9,
+        "rate_limit_tokens_per_minute": 10 ** 12,
+        "fake_latency_ms": args.latency_ms,
+        "fake_latency_distribution": args.distribution,
+        "fake_latency_jitter": args.jitter,
+        "fake_tokens_per_second": args.tokens_per_second,
+        "fake_failure_rate": args.failure_rate,
+        "fake_invalid_rate": args.invalid_rate,
+        "fake_seed": args.seed,
+    }
+    for name, value in overrides.items():
+        if value is not None:
+            setattr(settings, name, value)
+
+    server = InProcessServer(_free_port())
+    logging.disable(getattr(logging, args.log_level.upper()) - 1)
+    server.start()
+    try:
+        scenarios = asyncio.run(_drive(f"http://127.0.0.1:{server.server.config.port}", args, server.monitor))
+    finally:
+        server.stop()
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "reuse_payloads": args.reuse_payloads,
+            "generation_workers": settings.generation_workers,
+            "fake": {
+                "latency_ms": settings.fake_latency_ms,
+                "distribution": settings.fake_latency_distribution,
+                "jitter": settings.fake_latency_jitter,
+                "tokens_per_second": settings.fake_tokens_per_second,
+                "failure_rate": settings.fake_failure_rate,
+                "invalid_rate": settings.fake_invalid_rate,
+                "seed": settings.fake_seed,
+            },
+        },
+        "scenarios": scenarios,
+    }
+    _write_report(report, args.output)
+    return 1 if any(result["errors"] for result in scenarios.values()) else 0
+
+def _write_report(report: dict, path: Optional[str]):
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from backend.config import settings
+from backend.redis_client import redis_client, redis_available
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+CACHE_PREFIX = "archigenie:cache"
+# Processes re-read a version's invalidation generation at most this often, so a
+# DELETE /admin/cache handled by one worker empties every worker's LRU within this time.
+GENERATION_CHECK_SECONDS = 1.0
+# Fields that never change the generated plan.
+_IGNORED_FIELDS = ("provider",)
+
+def _normalize_text(value: str) -> str:
+    return re.sub(r"\s+", " ", value).strip()
+
+def canonicalize_request(mode: str, inputs: dict) -> dict:
+    # Canonical form of an ArchitectureRequest: whitespace-normalized strings, sorted and
+    # de-duplicated multiselect lists, and empty fields dropped.
+    if mode == "functional":
+        return {"functional_requirement": _normalize_text(inputs.get("functional_requirement") or "")}
+    canonical = {}
+    for field, value in inputs.items():
+        if field in _IGNORED_FIELDS or field == "functional_requirement":
+            continue
+        if isinstance(value, str):
+            value = _normalize_text(value)
+        elif isinstance(value, (list, tuple)):
+            value = sorted({_normalize_text(item) for item in value if item and _normalize_text(item)})
+        if value in (None, "", []):
+            continue
+        canonical[field] = value
+    return canonical
+
+def cache_key(mode: str, canonical: dict, provider: str, model_name: str, prompt_version: str) -> str:
+    material = json.dumps(
+        {"mode": mode, "request": canonical, "provider": provider, "model": model_name, "version": prompt_version},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return f"{prompt_version}:{hashlib.sha256(material.encode()).hexdigest()}"
+
+def prompt_key(prompt: str, provider: str, model_name: str, prompt_version: str) -> str:
+    material = "\n".join((prompt_version, provider, model_name, _normalize_text(prompt)))
+    return f"{prompt_version}:prompt:{hashlib.sha256(material.encode()).hexdigest()}"
+
+class LRUTier:
+    # In-process tier bounded by the total size of cached results. Entries expire like their
+    # Redis copies, and carry the invalidation generation they were stored under.
+    def __init__(self, max_bytes: int, ttl_seconds: int):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()  # value, expires_at, generation
+        self._lock = threading.Lock()
+
+    def get(self, key: str, generation: int = 0) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] <= time.monotonic() or entry[2] != generation):
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: str, generation: int = 0, ttl_seconds: float = None):
+        size = len(value.encode())
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (value, expires_at, generation)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= len(entry[0].encode())
+
+    def invalidate_version(self, prompt_version: str) -> int:
+        prefix = f"{prompt_version}:"
+        with self._lock:
+            stale = [key for key in self._entries if key.startswith(prefix)]
+            for key in stale:
+                self._drop(key)
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+class RedisTier:
+    # Shared tier across workers and hosts; every key is indexed under its prompt version.
+    def __init__(self, client, ttl_seconds: int):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key: str) -> Tuple[Optional[str], Optional[float]]:
+        # The value and its remaining TTL in seconds, so the LRU copy expires with it.
+        try:
+            with self.client.pipeline(transaction=False) as pipe:
+                pipe.get(f"{CACHE_PREFIX}:{key}")
+                pipe.pttl(f"{CACHE_PREFIX}:{key}")
+                value, ttl_ms = pipe.execute()
+        except Exception as e:
+            logger.warning("Redis cache read failed: %s", e)
+            self._count("errors")
+            return None, None
+        self._count("hits" if value is not None else "misses")
+        return value, ttl_ms / 1000 if ttl_ms and ttl_ms > 0 else None
+
+    def generation(self, prompt_version: str) -> int:
+        try:
+            return int(self.client.get(f"{CACHE_PREFIX}:generation:{prompt_version}") or 0)
+        except Exception as e:
+            logger.warning("Redis cache generation read failed: %s", e)
+            self._count("errors")
+            return 0
+
+    def set(self, key: str, value: str):
+        prompt_version = key.split(":", 1)[0]
+        index_key = f"{CACHE_PREFIX}:index:{prompt_version}"
+        try:
+            with self.client.pipeline() as pipe:
+                pipe.setex(f"{CACHE_PREFIX}:{key}", self.ttl_seconds, value)
+                pipe.sadd(index_key, key)
+                pipe.expire(index_key, self.ttl_seconds)
+                pipe.execute()
+        except Exception as e:
+            logger.warning("Redis cache write failed: %s", e)
+            self._count("errors")
+
+    def invalidate_version(self, prompt_version: str) -> int:
+        # Bumping the generation first retires every process's LRU copies of this version.
+        self.client.incr(f"{CACHE_PREFIX}:generation:{prompt_version}")
+        index_key = f"{CACHE_PREFIX}:index:{prompt_version}"
+        removed = 0
+        for batch in self._batched(self.client.sscan_iter(index_key, count=500), 500):
+            removed += self.client.delete(*[f"{CACHE_PREFIX}:{key}" for key in batch])
+        self.client.delete(index_key)
+        return removed
+
+    @staticmethod
+    def _batched(iterable, size: int):
+        batch = []
+        for item in iterable:
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "errors": self.errors, "ttl_seconds": self.ttl_seconds}
+
+class ResultCache:
+    def __init__(self):
+        self.lru = LRUTier(settings.cache_lru_max_bytes, settings.cache_ttl_seconds)
+        self.redis = RedisTier(redis_client, settings.cache_ttl_seconds) if redis_available else None
+        self._generations: Dict[str, Tuple[int, float]] = {}  # version -> (generation, checked_at)
+
+    def _generation(self, key: str) -> int:
+        # Invalidation generation of the key's prompt version, re-read from Redis at most every
+        # GENERATION_CHECK_SECONDS. Without Redis there is only this process to invalidate.
+        if self.redis is None:
+            return 0
+        prompt_version = key.split(":", 1)[0]
+        generation, checked_at = self._generations.get(prompt_version, (0, float("-inf")))
+        if time.monotonic() - checked_at >= GENERATION_CHECK_SECONDS:
+            generation = self.redis.generation(prompt_version)
+            self._generations[prompt_version] = (generation, time.monotonic())
+        return generation
+
+    def get(self, key: str) -> Optional[str]:
+        generation = self._generation(key)
+        value = self.lru.get(key, generation)
+        if value is None and self.redis is not None:
+            value, ttl_seconds = self.redis.get(key)
+            if value is not None:
+                self.lru.set(key, value, generation, ttl_seconds)
+        return value
+
+    def set(self, key: str, value: str):
+        self.lru.set(key, value, self._generation(key))
+        if self.redis is not None:
+            self.redis.set(key, value)
+
+    def invalidate_version(self, prompt_version: str) -> dict:
+        removed = {"lru": self.lru.invalidate_version(prompt_version)}
+        if self.redis is not None:
+            removed["redis"] = self.redis.invalidate_version(prompt_version)
+            self._generations.pop(prompt_version, None)
+        logger.info("Invalidated cache entries for prompt version %s: %s", prompt_version, removed)
+        return removed
+
+    def stats(self) -> dict:
+        stats = {"lru": self.lru.stats()}
+        if self.redis is not None:
+            stats["redis"] = self.redis.stats()
+        return stats
+
+result_cache = ResultCache()
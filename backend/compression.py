@@ -0,0 +1,142 @@
+import base64
+import gzip
+import hashlib
+import logging
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import Response
+from backend.config import settings
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Compressed job results at rest and negotiated compression / ETags on the wire.
+#
+# Results are deflated, optionally against a preset dictionary (zlib's zdict) built from past
+# plans: plans share their section headings and much of their boilerplate, which a 32 KB
+# dictionary captures. Dictionaries are immutable and identified by a digest that is stored in
+# every value, so retraining never breaks older results. Values are base85 text because the
+# shared Redis clients decode responses.
+
+VALUE_PREFIX = "~z1:"  # Never the first characters of a JSON-encoded field
+MAX_DICTIONARY_BYTES = 32 * 1024  # zlib window size
+_CODING_RE = re.compile(r"^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$")
+
+try:
+    import brotli
+except ImportError:  # br is offered only where the optional brotli package is installed
+    brotli = None
+
+class ResultCodec:
+    def __init__(self, level: int = None):
+        self.level = settings.result_compression_level if level is None else level
+        self.dictionaries: Dict[str, bytes] = {}
+        self.current: Optional[str] = None
+
+    def encode(self, text: str) -> Optional[str]:
+        # Compressed form of text, or None when compressing would not make it smaller.
+        raw = text.encode()
+        zdict = self.dictionaries.get(self.current) if self.current else None
+        if zdict:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, zlib.MAX_WBITS, 9, zlib.Z_DEFAULT_STRATEGY, zdict)
+        else:
+            compressor = zlib.compressobj(self.level)
+        data = compressor.compress(raw) + compressor.flush()
+        value = f"{VALUE_PREFIX}{self.current if zdict else ''}:{base64.b85encode(data).decode()}"
+        return value if len(value) < len(raw) else None
+
+    @staticmethod
+    def is_encoded(value: str) -> bool:
+        return value.startswith(VALUE_PREFIX)
+
+    @staticmethod
+    def dictionary_id(value: str) -> str:
+        return value[len(VALUE_PREFIX):].split(":", 1)[0]
+
+    def decode(self, value: str) -> str:
+        dictionary_id, _, payload = value[len(VALUE_PREFIX):].partition(":")
+        if dictionary_id:
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS, self.dictionaries[dictionary_id])
+        else:
+            decompressor = zlib.decompressobj()
+        data = base64.b85decode(payload)
+        return (decompressor.decompress(data) + decompressor.flush()).decode()
+
+    def add_dictionary(self, zdict: bytes) -> str:
+        dictionary_id = hashlib.sha256(zdict).hexdigest()[:12]
+        self.dictionaries[dictionary_id] = zdict
+        return dictionary_id
+
+def train_dictionary(samples: Iterable[str], max_bytes: int = MAX_DICTIONARY_BYTES) -> bytes:
+    # Lines repeated across samples, weighted by how much they would save; deflate reaches the
+    # end of a preset dictionary most cheaply, so the most valuable lines go last.
+    counts: Counter = Counter()
+    for sample in samples:
+        counts.update({line.strip() for line in sample.splitlines() if len(line.strip()) >= 8})
+    scored = sorted(
+        ((count * len(line), line) for line, count in counts.items() if count >= 2),
+        reverse=True,
+    )
+    chosen: List[str] = []
+    size = 0
+    for _, line in scored:
+        encoded_size = len(line.encode()) + 1
+        if size + encoded_size > max_bytes:
+            continue
+        chosen.append(line)
+        size += encoded_size
+    return "\n".join(reversed(chosen)).encode()
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    # Best of br/gzip the client accepts (q > 0), or None for identity.
+    offered = {"br": brotli is not None, "gzip": True}
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        match = _CODING_RE.match(part)
+        if match:
+            accepted[match.group(1).lower()] = float(match.group(2)) if match.group(2) else 1.0
+    best: Tuple[float, str] = (0.0, "")
+    for coding in ("br", "gzip"):
+        quality = accepted.get(coding, accepted.get("*", 0.0))
+        if offered[coding] and quality > best[0]:
+            best = (quality, coding)
+    return best[1] or None
+
+def etag_for(body: bytes) -> str:
+    # Weak: the same representation is served under every content coding.
+    return f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:]
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+async def compress_response(request: Request, response: Response) -> Response:
+    # Buffered JSON responses get an ETag (GETs answer 304 on a matching If-None-Match) and the
+    # negotiated content coding. Streams (SSE, NDJSON) pass through untouched.
+    if not response.headers.get("content-type", "").startswith("application/json") or "content-encoding" in response.headers:
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    headers = {
+        key: value for key, value in response.headers.items() if key.lower() not in ("content-length", "content-type")
+    }
+    headers["Vary"] = "Accept-Encoding"
+    if request.method == "GET" and response.status_code == 200:
+        etag = etag_for(body)
+        headers["ETag"] = etag
+        if etag_matches(request.headers.get("if-none-match", ""), etag):
+            metrics.NOT_MODIFIED.inc()
+            metrics.RESPONSE_BYTES.labels("raw").inc(len(body))
+            return Response(status_code=304, headers=headers)
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    metrics.RESPONSE_BYTES.labels("raw").inc(len(body))
+    if encoding and len(body) >= settings.http_compression_min_bytes:
+        body = brotli.compress(body, quality=5) if encoding == "br" else gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = encoding
+    metrics.RESPONSE_BYTES.labels("sent").inc(len(body))
+    return Response(body, status_code=response.status_code, headers=headers, media_type=response.media_type or "application/json")
@@ -1,26 +1,104 @@
 from pydantic_settings import BaseSettings  # For Pydantic v2
-import openai
 
-# Updated import for OpenAI errors (for openai>=1.0.0)
-from openai import (
-    APIError,
-    APIConnectionError,
-    RateLimitError,
-    APITimeoutError
-)
-from openai import OpenAI  # For modern OpenAI client initialization
-client = OpenAI(api_key="")  # Placeholder; will be set via settings
+# Importing this module only reads the environment: provider SDKs are imported by the code that
+# builds their clients, and validate_settings() runs in the app lifespan / worker entry points.
 
 class Settings(BaseSettings):
     openai_api_key: str
     huggingfacehub_api_token: str
-    ai_provider: str = "huggingface"  # Options: "openai" or "huggingface"
+    ai_provider: str = "huggingface"  # Options: "openai", "huggingface", "local" or "fake" (offline benchmarking)
     app_env: str
     allowed_origins: str  # Comma-separated list of allowed origins
     model_name: str = "google/flan-t5-xl"  # Change this in .env to a smaller model (e.g., tiiuae/falcon-7b-instruct)
+    redis_enabled: bool = True  # Set False to force the in-memory stores
     redis_host: str = "localhost"
     redis_port: int = 6379
-    rate_limit_per_minute: int = 30
+    redis_max_connections: int = 100  # Per connection pool (sync and asyncio)
+    rate_limit_enabled: bool = True
+    rate_limit_per_minute: int = 30  # Generation requests per client per minute
+    rate_limit_tokens_per_minute: int = 100000  # Estimated LLM tokens (prompt + max tokens) per client per minute
+    rate_limit_lease_requests: int = 5  # Budget each process leases per Redis round trip
+    rate_limit_lease_tokens: int = 15000
+    rate_limit_lease_seconds: float = 2.0  # Unused lease budget is refunded after this
+    llm_pool_max_connections: int = 20  # Keep-alive connections per warm LLM client
+    llm_pool_keepalive_expiry: float = 30.0  # Seconds an idle pooled connection is kept
+    warm_generators_on_startup: bool = True  # Build every PROVIDER_ORDER client (in parallel) before reporting ready
+    startup_check_providers: bool = True  # Also make one cheap authenticated call per provider at startup
+    startup_timeout_seconds: float = 20.0  # Budget for startup checks; slower checks are reported as failed
+    redis_connect_timeout: float = 2.0  # Seconds before a Redis connection attempt fails
+    cache_lru_max_bytes: int = 64 * 1024 * 1024  # In-process result cache budget
+    cache_ttl_seconds: int = 86400  # Redis result cache TTL
+    singleflight_lock_ttl_seconds: int = 300  # Upper bound on a coalesced generation
+    singleflight_wait_seconds: int = 300  # How long followers wait before generating themselves
+    singleflight_result_ttl_seconds: int = 60  # How long a leader's result stays visible to followers
+    local_max_batch_size: int = 8  # Local provider: prompts grouped into one generate() call
+    local_max_wait_ms: int = 25  # Local provider: how long the first prompt waits for batch-mates
+    local_quantize_int8: bool = False  # Local provider: dynamic int8 quantization of Linear layers
+    local_max_input_tokens: int = 1024  # Local provider: prompt truncation length
+    local_max_new_tokens: int = 512  # Local provider: completion cap (bounds the KV cache)
+    local_num_threads: int = 0  # Local provider: torch intra-op threads (0 keeps the torch default)
+    fake_seed: int = 1234  # Fake provider: seed for latency/failure/invalid-output draws
+    fake_latency_ms: float = 50.0  # Fake provider: mean time to first token
+    fake_latency_distribution: str = "lognormal"  # Fake provider: "constant", "uniform", "exponential" or "lognormal"
+    fake_latency_jitter: float = 0.5  # Fake provider: lognormal sigma / uniform relative spread
+    fake_tokens_per_second: float = 0.0  # Fake provider: streaming rate (0 emits instantly)
+    fake_failure_rate: float = 0.0  # Fake provider: fraction of calls raising FakeProviderError
+    fake_invalid_rate: float = 0.0  # Fake provider: fraction of calls returning an invalid plan
+    fake_lines_per_section: int = 12  # Fake provider: plan length
+    generation_max_tokens: int = 2048  # Upper bound on the per-request completion budget
+    min_completion_tokens: int = 512  # Lower bound; requests that cannot leave this much room are rejected
+    model_context_window: int = 0  # Prompt + completion tokens the model accepts (0 = look up by model name)
+    generation_mode: str = "single"  # "single" (one call per plan) or "sections" (sections generated concurrently)
+    section_max_tokens: int = 512  # Completion budget per section in sections mode
+    section_workers: int = 24  # Concurrent section calls per process
+    provider_order: str = ""  # Failover order, e.g. "openai:gpt-4,huggingface:tiiuae/falcon-7b-instruct" (empty = AI_PROVIDER only)
+    breaker_failure_threshold: int = 5  # Consecutive availability failures that open a provider's breaker
+    breaker_error_rate: float = 0.5  # Error rate over the rolling window that opens the breaker
+    breaker_window: int = 50  # Calls kept per provider for error rate and p95 latency
+    breaker_min_samples: int = 10  # Calls required before error rate / p95 are trusted
+    breaker_open_seconds: float = 30.0  # Open time before a single half-open probe is allowed
+    failover_p95_seconds: float = 0.0  # Prefer other providers while p95 exceeds this (0 disables)
+    precompute_enabled: bool = False  # Run precompute passes from the API process (one replica at a time)
+    precompute_requests_path: str = ""  # JSON or JSONL file of popular ArchitectureRequest payloads
+    precompute_mine_jobs: bool = True  # Also pick the most requested combinations from job records
+    precompute_top_n: int = 50  # Mined combinations kept per pass
+    precompute_min_requests: int = 3  # Mined combinations need at least this many requests
+    precompute_hours: str = "2-5"  # Off-peak UTC hours "start-end" for passes (empty = any time)
+    precompute_interval_seconds: int = 3600  # Minimum time between passes
+    precompute_max_age_seconds: int = 7 * 86400  # Entries older than this are regenerated (0 = never)
+    precompute_concurrency: int = 2  # Generations in flight during a pass
+    precompute_sync_seconds: int = 60  # How often processes reload the shared index
+    stream_validation: bool = True  # Validate partial output while streaming and abort doomed attempts
+    validation_check_interval_chars: int = 256  # Re-run partial-output checks after this many new chars
+    validation_section_tokens: int = 1500  # By now scalability/security/technology must all be mentioned
+    validation_marker_tokens: int = 0  # Abort if MARKER hasn't appeared after N tokens (0 disables)
+    validation_min_loop_chars: int = 20  # Shortest repeated block treated as a decoding loop
+    validation_max_loop_chars: int = 200  # Longest repeated block checked
+    hedge_mode: str = "off"  # Options: "off", "parallel" (fan out at once) or "delayed" (hedge after a latency percentile)
+    hedge_fanout: int = 2  # Maximum concurrent candidates per generation
+    hedge_percentile: float = 95.0  # "delayed" mode hedges once an attempt outlives this latency percentile
+    hedge_min_delay_ms: int = 15000  # Hedge delay until enough latency samples are collected
+    hedge_min_samples: int = 20
+    hedge_max_workers: int = 16  # Threads shared by all hedged candidates
+    job_queue_backend: str = "memory"  # Options: "memory" or "redis"
+    generation_workers: int = 4  # Concurrent generation jobs per worker process
+    max_pending_jobs: int = 100  # Queued jobs beyond this are rejected with 503 + Retry-After
+    job_workers_in_api: bool = True  # Set False to run workers only via `python -m backend.worker`
+    job_visibility_seconds: int = 60  # Redis queue: a claimed job whose worker stops renewing this is re-enqueued
+    job_max_deliveries: int = 3  # Redis queue: claims before a job whose workers keep dying is failed
+    batch_concurrency: int = 8  # Concurrent generations per /generate-batch call
+    provider_request_timeout: float = 30.0  # Per provider call; capped by the request's remaining budget
+    default_request_timeout: float = 0.0  # Budget for requests without X-Request-Timeout (0 = none)
+    max_request_timeout: float = 900.0  # Upper bound on X-Request-Timeout (0 = unbounded)
+    result_compression: bool = True  # Store job results deflated in Redis
+    result_compression_level: int = 6  # zlib level 1-9
+    compression_dictionary_samples: int = 200  # Completed results used to train the preset dictionary
+    http_compression_min_bytes: int = 1024  # JSON responses smaller than this are sent uncompressed
+    job_retention_seconds: int = 7 * 86400  # Job records (metadata) are deleted after this
+    job_result_retention_seconds: int = 86400  # Results and inputs are pruned after this; metadata stays listable
+    job_compaction_interval_seconds: int = 300  # Time between compaction passes (one replica per interval)
+    job_compaction_batch: int = 500  # Jobs pruned or deleted per Redis round trip
+    admin_token: str = ""  # When set, /admin endpoints require a matching X-Admin-Token header
     backend_url: str
 
     class Config:
@@ -29,19 +107,19 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-if settings.openai_api_key:
-    openai.api_key = settings.openai_api_key
-    client = OpenAI(api_key=settings.openai_api_key)
-
 def validate_settings():
     provider = settings.ai_provider.lower().strip()
-    if provider not in ("openai", "huggingface"):
-        raise ValueError("Unsupported provider in environment. Use 'openai' or 'huggingface'.")
+    if provider not in ("openai", "huggingface", "local", "fake"):
+        raise ValueError("Unsupported provider in environment. Use 'openai', 'huggingface', 'local' or 'fake'.")
     if provider == "openai" and not settings.openai_api_key:
         raise ValueError("OpenAI API key is required when using the OpenAI provider.")
     if provider == "huggingface" and not settings.huggingfacehub_api_token:
         raise ValueError("HuggingFace Hub token is required when using the HuggingFace provider.")
     if provider == "huggingface" and "gpt" in settings.model_name.lower():
         raise ValueError("GPT models require the OpenAI provider.")
-
-validate_settings()
+    if provider == "local" and settings.model_name.lower().startswith("gpt-"):
+        raise ValueError("GPT models require the OpenAI provider.")
+    for item in settings.provider_order.split(","):
+        listed = item.strip().partition(":")[0].strip().lower()
+        if listed and listed not in ("openai", "huggingface", "local", "fake"):
+            raise ValueError(f"Unsupported provider '{listed}' in PROVIDER_ORDER.")
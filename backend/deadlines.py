@@ -0,0 +1,77 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Per-request time budgets and cancellation. The API turns X-Request-Timeout into an absolute
+# deadline stored with the job; the worker runs the generation inside scope(budget), so every
+# thread it starts (asyncio.to_thread, hedged attempts, sections) sees the same budget. Provider
+# streams poll it between chunks, retry loops skip attempts that no longer fit, and a DELETE on
+# the job sets its cancel event.
+
+class GenerationStopped(Exception):
+    # Not a provider failure: never retried, never counted against a breaker.
+    status = None
+
+class JobCancelled(GenerationStopped):
+    status = "cancelled"
+
+    def __init__(self):
+        super().__init__("Job was cancelled")
+
+class DeadlineExceeded(GenerationStopped):
+    status = "expired"
+
+    def __init__(self):
+        super().__init__("Request deadline exceeded")
+
+class Budget:
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline  # Epoch seconds, so it survives the trip through the queue
+        self.cancel = threading.Event()
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def check(self):
+        if self.cancel.is_set():
+            raise JobCancelled()
+        if self.expired():
+            raise DeadlineExceeded()
+
+    def fits(self, seconds: Optional[float]) -> bool:
+        # Whether an attempt expected to take `seconds` can finish before the deadline.
+        remaining = self.remaining()
+        return remaining is None or remaining > (seconds or 0.0)
+
+    def timeout(self, default: float) -> float:
+        # Per-call provider timeout: the configured one, capped by what is left of the budget.
+        remaining = self.remaining()
+        return default if remaining is None else max(0.001, min(default, remaining))
+
+_UNLIMITED = Budget()
+_budget_var: ContextVar[Budget] = ContextVar("archigenie_budget", default=_UNLIMITED)
+
+def current() -> Budget:
+    return _budget_var.get()
+
+def deadline_after(seconds: Optional[float], limit: float = 0) -> Optional[float]:
+    # Absolute deadline for a relative timeout (None for no timeout); `limit` caps it when set.
+    if not seconds:
+        return None
+    return time.time() + (min(seconds, limit) if limit else seconds)
+
+@contextmanager
+def scope(budget: Budget):
+    token = _budget_var.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget_var.reset(token)
@@ -0,0 +1,239 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+from backend.config import settings
+from backend import deadlines
+from backend.metrics import BREAKER_STATE, FAILOVERS
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Failures that say "this provider is unavailable right now" rather than "this request is bad".
+# Only these trip breakers and trigger failover; anything else propagates unchanged. Matched by
+# (top-level package, class name) anywhere in the exception's MRO so the provider SDKs are only
+# imported when a provider actually uses them.
+BREAKER_ERRORS = {
+    ("openai", "RateLimitError"),
+    ("openai", "APIConnectionError"),  # Includes APITimeoutError
+    ("openai", "APITimeoutError"),
+    ("httpx", "TransportError"),
+    ("requests", "ConnectionError"),
+    ("requests", "Timeout"),
+}
+
+# HTTP errors from any client (huggingface_hub's HfHubHTTPError, requests/httpx status errors)
+# carry the response; these statuses mean the endpoint is cold, overloaded or throttling us.
+def _is_unavailable_status(status_code) -> bool:
+    return isinstance(status_code, int) and (status_code == 429 or status_code >= 500)
+
+# LangChain's HuggingFaceHub wraps Inference API errors returned in a 200 body as
+# ValueError("Error raised by inference API: ...").
+HF_INFERENCE_ERROR = "Error raised by inference API"
+UNAVAILABLE_MESSAGES = ("currently loading", "rate limit", "too many requests", "service unavailable", "overloaded", "timed out")
+
+def is_availability_error(error: Exception) -> bool:
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if any((cls.__module__.split(".")[0], cls.__name__) in BREAKER_ERRORS for cls in type(error).__mro__):
+        return True
+    response = getattr(error, "response", None)
+    if _is_unavailable_status(getattr(response, "status_code", None)):
+        return True
+    message = str(error)
+    if isinstance(error, ValueError) and message.startswith(HF_INFERENCE_ERROR):
+        return any(phrase in message.lower() for phrase in UNAVAILABLE_MESSAGES)
+    return False
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+Target = Tuple[str, Optional[str]]
+
+class ProvidersUnavailableError(Exception):
+    def __init__(self, retry_after: int, last_error: Optional[Exception] = None):
+        message = "All configured LLM providers are unavailable"
+        if last_error is not None:
+            message += f" (last error: {type(last_error).__name__}: {last_error})"
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    # Rolling window of call outcomes for one provider/model. Opens after
+    # breaker_failure_threshold consecutive availability failures or when the window's error
+    # rate reaches breaker_error_rate; after breaker_open_seconds a single probe is let through
+    # (half-open) and its outcome closes or re-opens the breaker.
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.last_call_at = 0.0
+        self.probing = False
+        self.last_error: Optional[str] = None
+        self._window = deque(maxlen=settings.breaker_window)  # (ok, seconds)
+        self._lock = threading.Lock()
+        BREAKER_STATE.labels(name).set(0)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning("Provider %s breaker %s -> %s", self.name, self.state, state)
+        self.state = state
+        BREAKER_STATE.labels(self.name).set(_STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= settings.breaker_open_seconds:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self.probing:
+                    return False
+                self.probing = True
+            return self.state != OPEN
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, settings.breaker_open_seconds - (time.monotonic() - self.opened_at))
+
+    def record_success(self, seconds: float):
+        with self._lock:
+            self._window.append((True, seconds))
+            self.last_call_at = time.monotonic()
+            self.consecutive_failures = 0
+            self.probing = False
+            self._set_state(CLOSED)
+
+    def record_failure(self, error: Exception, seconds: float):
+        with self._lock:
+            self._window.append((False, seconds))
+            self.last_call_at = time.monotonic()
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            self.probing = False
+            failures = sum(1 for ok, _ in self._window if not ok)
+            error_rate = failures / len(self._window)
+            if (
+                self.state == HALF_OPEN
+                or self.consecutive_failures >= settings.breaker_failure_threshold
+                or (len(self._window) >= settings.breaker_min_samples and error_rate >= settings.breaker_error_rate)
+            ):
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release(self):
+        # A probe that ended without a provider verdict (e.g. a bad request) frees the slot.
+        with self._lock:
+            self.probing = False
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(seconds for ok, seconds in self._window if ok)
+        if len(latencies) < settings.breaker_min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+
+    def degraded(self) -> bool:
+        if not settings.failover_p95_seconds:
+            return False
+        # A target that has been passed over for a while gets traffic again to refresh its p95.
+        if time.monotonic() - self.last_call_at >= settings.breaker_open_seconds:
+            return False
+        p95 = self.p95()
+        return p95 is not None and p95 > settings.failover_p95_seconds
+
+    def snapshot(self) -> dict:
+        p95 = self.p95()
+        with self._lock:
+            outcomes = list(self._window)
+        failures = sum(1 for ok, _ in outcomes if not ok)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "window_calls": len(outcomes),
+            "error_rate": round(failures / len(outcomes), 3) if outcomes else 0.0,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "degraded": self.degraded(),
+            "retry_after_seconds": round(self.retry_after(), 1),
+            "last_error": self.last_error,
+        }
+
+def parse_provider_order(order: str) -> List[Target]:
+    # "openai:gpt-4,huggingface:tiiuae/falcon-7b-instruct" -> [(provider, model), ...];
+    # an empty order means just the configured AI_PROVIDER/MODEL_NAME.
+    targets = []
+    for item in order.split(","):
+        if not item.strip():
+            continue
+        provider, _, model_name = item.strip().partition(":")
+        targets.append((provider.strip().lower(), model_name.strip() or None))
+    return targets or [(settings.ai_provider.lower().strip(), None)]
+
+def failover_configured() -> bool:
+    # With more than one target, provider SDKs should fail fast and leave retries to failover.
+    return len(parse_provider_order(settings.provider_order)) > 1
+
+class ProviderRouter:
+    # Runs a generation against the first healthy target in PROVIDER_ORDER. Targets whose
+    # breaker is open are skipped; targets whose p95 latency exceeds failover_p95_seconds are
+    # tried after the healthy ones. Availability failures fall through to the next target.
+    def __init__(self, generator_factory: Callable, resolve_model: Callable[[str, Optional[str]], str]):
+        self.generator_factory = generator_factory
+        self.resolve_model = resolve_model
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def targets(self) -> List[Target]:
+        return [(provider, self.resolve_model(provider, model)) for provider, model in parse_provider_order(settings.provider_order)]
+
+    def breaker(self, target: Target) -> CircuitBreaker:
+        name = f"{target[0]}/{target[1]}"
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name)
+        return breaker
+
+    def run(self, call: Callable, on_reset: Callable[[], None] = None):
+        # Returns (result, generator) from the first target that answers.
+        targets = self.targets()
+        ordered = sorted(targets, key=lambda target: self.breaker(target).degraded())
+        last_error: Optional[Exception] = None
+        attempted = None
+        for target in ordered:
+            deadlines.current().check()  # No failover once the request is cancelled or out of time
+            breaker = self.breaker(target)
+            if not breaker.allow():
+                continue
+            if attempted is not None:
+                logger.warning("Failing over from %s to %s", attempted, breaker.name)
+                if on_reset:
+                    on_reset()  # Drop anything the failed target streamed.
+            started = time.perf_counter()
+            try:
+                generator = self.generator_factory(*target)
+                result = call(generator)
+            except Exception as e:
+                if not is_availability_error(e):
+                    breaker.release()
+                    raise
+                breaker.record_failure(e, time.perf_counter() - started)
+                logger.warning("Provider %s unavailable: %s", breaker.name, e)
+                last_error = e
+                attempted = attempted or breaker.name
+                continue
+            breaker.record_success(time.perf_counter() - started)
+            if attempted is not None:
+                FAILOVERS.labels(attempted, breaker.name).inc()
+            return result, generator
+        retry_after = min(self.breaker(target).retry_after() for target in targets)
+        raise ProvidersUnavailableError(max(1, math.ceil(retry_after)), last_error) from last_error
+
+    def health(self) -> dict:
+        return {
+            "order": [f"{provider}/{model}" for provider, model in self.targets()],
+            "providers": {self.breaker(target).name: self.breaker(target).snapshot() for target in self.targets()},
+        }
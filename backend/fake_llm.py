@@ -0,0 +1,102 @@
+import hashlib
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+from langchain.llms.base import LLM
+from langchain.schema.output import GenerationChunk
+from backend.config import settings
+
+SECTIONS = (
+    "Overview",
+    "Technology Stack",
+    "Data Architecture",
+    "Security and Compliance",
+    "Scalability and Resilience",
+    "Deployment and Monitoring",
+)
+
+class FakeProviderError(ConnectionError):
+    # An outage, as far as circuit breakers and failover are concerned.
+    pass
+
+class FakeLatencyModel:
+    # Seeded draws for time-to-first-token, failures and invalid outputs, so benchmark runs
+    # with the same settings replay the same sequence.
+    def __init__(self, seed: int):
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def first_token_seconds(self) -> float:
+        mean = settings.fake_latency_ms / 1000
+        jitter = settings.fake_latency_jitter
+        distribution = settings.fake_latency_distribution
+        with self._lock:
+            if distribution == "uniform":
+                return max(0.0, self._random.uniform(mean * (1 - jitter), mean * (1 + jitter)))
+            if distribution == "exponential":
+                return self._random.expovariate(1 / mean) if mean > 0 else 0.0
+            if distribution == "lognormal" and mean > 0:
+                # Parameterized so the distribution mean stays at fake_latency_ms.
+                return self._random.lognormvariate(math.log(mean) - jitter ** 2 / 2, jitter)
+            return mean
+
+    def roll(self, rate: float) -> bool:
+        with self._lock:
+            return self._random.random() < rate
+
+def render_plan(prompt: str, valid: bool = True) -> str:
+    from backend.prompt_generator import MARKER
+    digest = hashlib.sha256(prompt.encode()).hexdigest()
+    if not valid:
+        return f"{MARKER}\nOverview\nA short plan ({digest[:8]}) without the required sections.\n"
+    lines = [MARKER]
+    requested = re.search(r"Write only section \d+, ([^:]+):", prompt)
+    if requested:
+        # Section-mode prompt: just that section's body.
+        for item in range(1, settings.fake_lines_per_section + 1):
+            lines.append(f"- {requested.group(1)} decision {item} for request {digest[item % 32:item % 32 + 8]}.")
+        return "\n".join(lines) + "\n"
+    for number, section in enumerate(SECTIONS, start=1):
+        lines.append(f"{number}. {section}")
+        for item in range(1, settings.fake_lines_per_section + 1):
+            lines.append(f"- {section} decision {item} for request {digest[item % 32:item % 32 + 8]}.")
+    return "\n".join(lines) + "\n"
+
+class FakeStreamingLLM(LLM):
+    # Offline stand-in provider for load tests: no network, configurable latency
+    # distribution, token rate, failure rate and invalid-output rate.
+    seed: int = 0
+    latency: Any = None
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.latency = FakeLatencyModel(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"seed": self.seed}
+
+    def _plan(self, prompt: str) -> List[str]:
+        time.sleep(self.latency.first_token_seconds())
+        if self.latency.roll(settings.fake_failure_rate):
+            raise FakeProviderError("Simulated provider failure")
+        text = render_plan(prompt, valid=not self.latency.roll(settings.fake_invalid_rate))
+        # Whitespace-delimited pieces approximate tokens.
+        return [piece + " " for piece in text.split(" ")]
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        delay = 1 / settings.fake_tokens_per_second if settings.fake_tokens_per_second > 0 else 0
+        for token in self._plan(prompt):
+            if delay:
+                time.sleep(delay)
+            yield GenerationChunk(text=token)
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt))
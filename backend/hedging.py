@@ -0,0 +1,167 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+from backend.config import settings
+from backend import deadlines, metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# attempt(on_token, cancel) -> sanitized output. Attempts poll `cancel` between streamed
+# chunks and raise AttemptCancelled, which closes the provider stream.
+Attempt = Callable[[Optional[Callable[[str], None]], threading.Event], str]
+
+class AttemptCancelled(Exception):
+    pass
+
+class LatencyWindow:
+    # Rolling window of attempt latencies used to derive the hedge delay.
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < settings.hedge_min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+_stats = {
+    "requests": 0,
+    "attempts": 0,
+    "hedges_launched": 0,
+    "primary_wins": 0,
+    "hedge_wins": 0,
+    "cancelled": 0,
+    "no_valid_output": 0,
+}
+_stats_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=settings.hedge_max_workers, thread_name_prefix="hedge")
+
+def _count(counter: str, amount: int = 1):
+    with _stats_lock:
+        _stats[counter] += amount
+
+def hedge_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    decided = stats["primary_wins"] + stats["hedge_wins"]
+    stats["hedge_win_rate"] = round(stats["hedge_wins"] / decided, 4) if decided else 0.0
+    # Extra provider calls per request: the cost side of the latency trade-off.
+    stats["attempts_per_request"] = round(stats["attempts"] / stats["requests"], 3) if stats["requests"] else 0.0
+    return stats
+
+def run_hedged(
+    attempt: Attempt,
+    is_valid: Callable[[str], bool],
+    latencies: LatencyWindow,
+    max_attempts: int,
+    on_token: Callable[[str], None] = None,
+    on_reset: Callable[[], None] = None,
+) -> str:
+    # "parallel" launches hedge_fanout candidates at once; "delayed" starts one and adds a hedge
+    # whenever the in-flight attempts outlive the hedge_percentile latency. Either way the first
+    # valid candidate wins, the rest are cancelled, and invalid ones are replaced until
+    # max_attempts is spent. Only the first candidate streams to on_token.
+    fanout = max(1, settings.hedge_fanout)
+    parallel = settings.hedge_mode == "parallel"
+    muted = threading.Event()
+    in_flight: Dict[Future, tuple] = {}
+    launched = 0
+    last_output = ""
+    last_error: Optional[Exception] = None
+    budget = deadlines.current()
+    _count("requests")
+
+    def relay(text: str):
+        if not muted.is_set():
+            on_token(text)
+
+    def launch():
+        nonlocal launched
+        cancel = threading.Event()
+        streaming = on_token is not None and launched == 0
+        started = time.perf_counter()
+
+        def run() -> str:
+            output = attempt(relay if streaming else None, cancel)
+            latencies.record(time.perf_counter() - started)
+            return output
+
+        # Attempts inherit the caller's context, so their stage timings land on the same job.
+        in_flight[_executor.submit(contextvars.copy_context().run, run)] = (launched, cancel)
+        launched += 1
+        _count("attempts")
+
+    def can_launch() -> bool:
+        # Extra candidates must be able to finish (at median latency) within the request budget.
+        return launched < max_attempts and (launched == 0 or budget.fits(latencies.percentile(50)))
+
+    def cancel_all():
+        for future, (_, cancel) in in_flight.items():
+            cancel.set()
+            future.cancel()
+        _count("cancelled", len(in_flight))
+
+    for _ in range(min(fanout if parallel else 1, max_attempts)):
+        launch()
+
+    try:
+        while in_flight:
+            timeout = None
+            if not parallel and len(in_flight) < fanout and can_launch():
+                timeout = latencies.percentile(settings.hedge_percentile)
+                if timeout is None:
+                    timeout = settings.hedge_min_delay_ms / 1000
+            done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.info("Attempt exceeded p%s latency (%.2fs); launching hedge", settings.hedge_percentile, timeout)
+                _count("hedges_launched")
+                launch()
+                continue
+            for future in done:
+                index, _ = in_flight.pop(future)
+                try:
+                    output = future.result()
+                except AttemptCancelled:
+                    continue
+                except deadlines.GenerationStopped:
+                    cancel_all()
+                    raise
+                except Exception as e:
+                    logger.warning("Hedged attempt %d failed: %s", index + 1, e)
+                    last_error = e
+                    continue
+                if is_valid(output):
+                    _count("primary_wins" if index == 0 else "hedge_wins")
+                    logger.info("Valid output from %s attempt %d", "primary" if index == 0 else "hedged", index + 1)
+                    cancel_all()
+                    if index != 0 and on_token:
+                        # Replace whatever the primary streamed with the winning candidate.
+                        muted.set()
+                        if on_reset:
+                            on_reset()
+                        on_token(output)
+                    return output
+                logger.warning("Hedged attempt %d produced invalid output", index + 1)
+                last_output = output
+            while len(in_flight) < (fanout if parallel else 1) and can_launch():
+                launch()
+
+        _count("no_valid_output")
+        if not last_output and last_error is not None:
+            raise last_error
+        logger.error("Failed to generate valid output after %d hedged attempts", launched)
+        return last_output
+    finally:
+        metrics.record_attempts(launched)
@@ -0,0 +1,55 @@
+import asyncio
+import json
+import logging
+import sys
+import time
+from backend import metrics
+from backend.config import settings
+from backend.job_store import job_store
+from backend.redis_client import redis_client, redis_available
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Job retention: results and inputs are pruned after JOB_RESULT_RETENTION_SECONDS (the job
+# stays listable with its status, timings and usage) and records are deleted after
+# JOB_RETENTION_SECONDS. Passes run from every API process; the first replica to take the lock
+# in an interval does the work. One pass on demand:
+#   python -m backend.job_compactor
+
+LOCK_KEY = "archigenie:jobs:compaction-lock"
+
+async def run_pass(now: float = None) -> dict:
+    started = time.time()
+    counts = await job_store.compact(now, batch_size=settings.job_compaction_batch)
+    for action, count in counts.items():
+        metrics.JOBS_COMPACTED.labels(action).inc(count)
+    counts["duration_s"] = round(time.time() - started, 3)
+    logger.info("Job compaction pass: %s", counts)
+    return counts
+
+def _claim_interval() -> bool:
+    # The lock is never released: it expires with the interval, so passes stay spaced out
+    # across replicas however quickly each one finishes.
+    if not redis_available:
+        return True
+    return bool(redis_client.set(LOCK_KEY, "1", nx=True, ex=max(1, settings.job_compaction_interval_seconds)))
+
+async def maintain():
+    while True:
+        try:
+            if await asyncio.to_thread(_claim_interval):
+                await run_pass()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Job compaction failed: %s", e)
+        await asyncio.sleep(settings.job_compaction_interval_seconds)
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(asyncio.run(run_pass()), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
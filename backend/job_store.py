@@ -0,0 +1,554 @@
+import asyncio
+import base64
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from backend.compression import ResultCodec, train_dictionary
+from backend.config import settings
+from backend import metrics
+from backend.metrics import timed_async
+from backend.models import TERMINAL_STATUSES
+from backend.redis_client import async_redis_client, redis_available
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+JOB_PREFIX = "archigenie:job"
+INDEX_PREFIX = "archigenie:jobs:index"
+COMPACTED_KEY = "archigenie:jobs:compacted"  # Index member up to which results were pruned
+DIMENSIONS_KEY = "archigenie:jobs:dimensions"  # Index member -> JSON [client, provider, status]
+EVENTS_PREFIX = "archigenie:job-events"
+# Indexed job fields, in the order they appear in index keys (the Lua scripts assume it).
+INDEX_DIMENSIONS = ("client", "provider", "status")
+SUMMARY_FIELDS = ("status", "created_at", "client", "provider", "progress", "error", "trace_id", "deadline")
+PRUNED_FIELDS = ("result", "inputs")  # Dropped after job_result_retention_seconds
+RETENTION_GRACE_SECONDS = 86400  # Job hashes outlive retention by this, in case compaction stalls
+DICTIONARY_PREFIX = "archigenie:zdict"
+DICTIONARY_CHECK_SECONDS = 60  # How often writers look for a newly trained dictionary
+COMPRESSED_FIELDS = ("result",)
+# Encoded terminal statuses, delimited for a plain substring match in Lua.
+_TERMINAL_MARKERS = "|" + "|".join(json.dumps(status.value) for status in TERMINAL_STATUSES) + "|"
+
+# Job indexes are score-0 sorted sets read BYLEX: members are "<created ms, 13 digits>:<job id>",
+# so every index is in creation order and a member doubles as a pagination cursor. A job is
+# listed in one index per combination of its INDEX_DIMENSIONS (8 in all), so any combination
+# of filters is a single O(log n) range read. The scripts derive index keys from the job hash,
+# which assumes a single Redis node rather than Redis Cluster. DIMENSIONS_KEY keeps each
+# member's dimensions outside the expiring job hash, so a job whose hash expired before
+# compaction can still be dropped from all of its indexes.
+_INDEX_HELPERS = """
+local function field(name)
+    local raw = redis.call('hget', KEYS[1], name)
+    if not raw then
+        return false
+    end
+    local value = cjson.decode(raw)
+    if type(value) ~= 'string' then
+        return false
+    end
+    return value
+end
+local function dimensions(member)
+    local raw = redis.call('hget', KEYS[2], member)
+    if not raw then
+        return false, false, false
+    end
+    local values = cjson.decode(raw)
+    for i = 1, 3 do
+        if type(values[i]) ~= 'string' then
+            values[i] = false
+        end
+    end
+    return values[1], values[2], values[3]
+end
+local function index_key(prefix, client, provider, status)
+    local parts = {}
+    if client then parts[#parts + 1] = 'client=' .. client end
+    if provider then parts[#parts + 1] = 'provider=' .. provider end
+    if status then parts[#parts + 1] = 'status=' .. status end
+    if #parts == 0 then
+        return prefix
+    end
+    return prefix .. ':' .. table.concat(parts, '|')
+end
+"""
+
+# HSET that never resurrects a job which has expired or been deleted, never touches a job
+# that already reached a terminal status, moves the job between status indexes, and
+# announces status changes on the job's channel in the same round trip.
+_UPDATE_SCRIPT = _INDEX_HELPERS + """
+if redis.call('exists', KEYS[1]) == 0 then
+    return 0
+end
+local status = redis.call('hget', KEYS[1], 'status')
+if status and string.find(ARGV[2], '|' .. status .. '|', 1, true) then
+    return 0
+end
+local member = field('_index')
+if ARGV[3] ~= '' and member then
+    local old, client, provider = field('status'), field('client'), field('provider')
+    for _, c in ipairs({false, client}) do
+        for _, p in ipairs({false, provider}) do
+            if old then
+                redis.call('zrem', index_key(ARGV[4], c, p, old), member)
+            end
+            redis.call('zadd', index_key(ARGV[4], c, p, ARGV[3]), 0, member)
+        end
+    end
+    redis.call('hset', KEYS[2], member, cjson.encode({client or cjson.null, provider or cjson.null, ARGV[3]}))
+end
+redis.call('hset', KEYS[1], unpack(ARGV, 5))
+if ARGV[1] == '1' then
+    redis.call('publish', KEYS[3], '1')
+end
+return 1
+"""
+
+# Deletes a job and its index entries. ARGV[2] is the job's member, for when the hash itself
+# is already gone: its indexes then come from the dimensions record.
+_DELETE_SCRIPT = _INDEX_HELPERS + """
+local member = field('_index')
+local client, provider, status
+if member then
+    client, provider, status = field('client'), field('provider'), field('status')
+elseif ARGV[2] ~= '' then
+    member = ARGV[2]
+    client, provider, status = dimensions(member)
+else
+    return 0
+end
+for _, c in ipairs({false, client}) do
+    for _, p in ipairs({false, provider}) do
+        for _, s in ipairs({false, status}) do
+            redis.call('zrem', index_key(ARGV[1], c, p, s), member)
+        end
+    end
+end
+redis.call('hdel', KEYS[2], member)
+return redis.call('del', KEYS[1])
+"""
+
+# Replaces the heavy fields of a job that still exists with null.
+_PRUNE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('hset', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+class UnsupportedOperation(Exception):
+    # The configured store cannot do this (e.g. compression without Redis).
+    pass
+
+def index_member(created_at: float, job_id: str) -> str:
+    return f"{int(created_at * 1000):013d}:{job_id}"
+
+def _member_job_id(member: str) -> str:
+    return member.split(":", 1)[1]
+
+def _time_bound(seconds: float) -> str:
+    return f"{int(seconds * 1000):013d}"
+
+def _dimension(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value.value if isinstance(value, Enum) else str(value)
+
+def index_key(**filters) -> str:
+    parts = [f"{dim}={_dimension(filters[dim])}" for dim in INDEX_DIMENSIONS if filters.get(dim) is not None]
+    return f"{INDEX_PREFIX}:{'|'.join(parts)}" if parts else INDEX_PREFIX
+
+def _index_keys(job: dict) -> List[str]:
+    # One index per subset of the job's dimensions.
+    keys = set()
+    for mask in range(1 << len(INDEX_DIMENSIONS)):
+        keys.add(index_key(**{dim: job.get(dim) for bit, dim in enumerate(INDEX_DIMENSIONS) if mask & (1 << bit)}))
+    return sorted(keys)
+
+class JobStore(ABC):
+    # Job records are flat dicts of JSON-serializable fields. Updates touch only the
+    # fields they name, so status/progress changes never rewrite the result.
+    @abstractmethod
+    async def create(self, job_id: str, job: dict):
+        ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[dict]:
+        ...
+
+    async def get_many(self, job_ids: List[str]) -> Dict[str, Optional[dict]]:
+        return {job_id: await self.get(job_id) for job_id in job_ids}
+
+    @abstractmethod
+    async def update(self, job_id: str, **fields) -> bool:
+        # False when the job is gone or already terminal (e.g. cancelled while generating).
+        ...
+
+    @abstractmethod
+    async def delete(self, job_id: str):
+        ...
+
+    @abstractmethod
+    def iter_jobs(self, batch_size: int = 500) -> AsyncIterator[Tuple[str, dict]]:
+        # Every live job record, oldest first (used for offline mining).
+        ...
+
+    @abstractmethod
+    async def list_jobs(
+        self,
+        filters: Dict[str, Optional[str]],
+        since: float = None,
+        until: float = None,
+        cursor: str = None,
+        limit: int = 50,
+    ) -> Tuple[List[dict], Optional[str]]:
+        # Newest first: job summaries (SUMMARY_FIELDS, no results) matching every non-None
+        # INDEX_DIMENSIONS filter and created in [since, until), plus the cursor of the next
+        # page (None on the last page).
+        ...
+
+    @abstractmethod
+    async def compact(self, now: float = None, batch_size: int = 500) -> Dict[str, int]:
+        # Applies retention: nulls PRUNED_FIELDS of jobs older than job_result_retention_seconds
+        # and deletes jobs older than job_retention_seconds.
+        ...
+
+    @abstractmethod
+    async def train_dictionary(self, samples: Iterable[str]) -> dict:
+        # Trains and activates a preset compression dictionary for results written from now on.
+        ...
+
+    async def watch(self, job_id: str) -> asyncio.Event:
+        # Returns an event set on the job's next status change. Register before re-reading
+        # the job so a change in between is not missed.
+        event = self._watchers.get(job_id)
+        if event is None:
+            event = self._watchers[job_id] = asyncio.Event()
+        return event
+
+    def _notify(self, job_id: str):
+        event = self._watchers.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def close(self):
+        pass
+
+class InMemoryJobStore(JobStore):
+    def __init__(self):
+        self.jobs: Dict[str, dict] = {}
+        self._watchers: Dict[str, asyncio.Event] = {}
+
+    @timed_async("job_store_write")
+    async def create(self, job_id: str, job: dict):
+        self.jobs[job_id] = dict(job)
+
+    @timed_async("job_store_read")
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    @timed_async("job_store_write")
+    async def update(self, job_id: str, **fields) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.get("status") in TERMINAL_STATUSES:
+            return False
+        job.update(fields)
+        if "status" in fields:
+            self._notify(job_id)
+        return True
+
+    @timed_async("job_store_write")
+    async def delete(self, job_id: str):
+        self.jobs.pop(job_id, None)
+
+    async def iter_jobs(self, batch_size: int = 500) -> AsyncIterator[Tuple[str, dict]]:
+        for job_id, job in sorted(self.jobs.items(), key=lambda item: item[1].get("created_at", 0)):
+            yield job_id, dict(job)
+
+    @timed_async("job_store_read")
+    async def list_jobs(self, filters, since=None, until=None, cursor=None, limit=50):
+        upper = cursor or (_time_bound(until) if until is not None else None)
+        lower = _time_bound(since) if since is not None else None
+        matches = []
+        for job_id, job in self.jobs.items():
+            member = index_member(job.get("created_at", 0), job_id)
+            if upper is not None and member >= upper or lower is not None and member < lower:
+                continue
+            if all(value is None or _dimension(job.get(dim)) == _dimension(value) for dim, value in filters.items()):
+                matches.append((member, job_id, job))
+        matches.sort(reverse=True)
+        page = matches[:limit]
+        jobs = [{"job_id": job_id, **{field: job.get(field) for field in SUMMARY_FIELDS}} for _, job_id, job in page]
+        return jobs, page[-1][0] if len(page) == limit else None
+
+    async def compact(self, now=None, batch_size=500):
+        now = now or time.time()
+        counts = {"pruned": 0, "deleted": 0}
+        for job_id, job in list(self.jobs.items()):
+            age = now - job.get("created_at", now)
+            if age > settings.job_retention_seconds:
+                del self.jobs[job_id]
+                counts["deleted"] += 1
+            elif age > settings.job_result_retention_seconds and not job.get("pruned"):
+                job.update({field: None for field in PRUNED_FIELDS}, pruned=True)
+                counts["pruned"] += 1
+        return counts
+
+    async def train_dictionary(self, samples: Iterable[str]) -> dict:
+        # Results are kept as Python objects here; there is nothing to compress.
+        raise UnsupportedOperation("Stored results are only compressed with Redis enabled.")
+
+class RedisJobStore(JobStore):
+    # One Redis hash per job (JOB_PREFIX:<id>) with JSON-encoded field values, listed in the
+    # lex-ordered indexes described above; every operation is a single non-blocking round trip
+    # on the shared redis.asyncio connection pool. Results are stored compressed
+    # (backend/compression.py) and decompressed transparently on read.
+    def __init__(self, client, ttl_seconds: int = None):
+        self.client = client
+        self.ttl_seconds = ttl_seconds or settings.job_retention_seconds + RETENTION_GRACE_SECONDS
+        self.codec = ResultCodec() if settings.result_compression else None
+        self._dictionary_checked = 0.0
+        self._watchers: Dict[str, asyncio.Event] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._pubsub = None
+
+    def _encode(self, fields: dict) -> dict:
+        encoded = {}
+        for field, value in fields.items():
+            compressed = None
+            if self.codec is not None and field in COMPRESSED_FIELDS and isinstance(value, str):
+                compressed = self.codec.encode(value)
+                if compressed is not None:
+                    metrics.RESULT_BYTES.labels("raw").inc(len(value.encode()))
+                    metrics.RESULT_BYTES.labels("stored").inc(len(compressed))
+            encoded[field] = compressed or json.dumps(value)
+        return encoded
+
+    def _decode(self, raw: dict) -> dict:
+        # Underscore fields (the index member) are bookkeeping, not part of the job record.
+        return {
+            field: self.codec.decode(value) if ResultCodec.is_encoded(value) else json.loads(value)
+            for field, value in raw.items()
+            if not field.startswith("_")
+        }
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"{JOB_PREFIX}:{job_id}"
+
+    async def _load_dictionaries(self, rows: Iterable[dict]):
+        # Fetches the dictionaries that stored results were compressed with, once per process.
+        if self.codec is None:
+            self.codec = ResultCodec()  # Compression was switched off after results were stored
+        await self._fetch_dictionaries({
+            ResultCodec.dictionary_id(value)
+            for row in rows if row
+            for value in row.values()
+            if ResultCodec.is_encoded(value)
+        })
+
+    async def _fetch_dictionaries(self, dictionary_ids: set):
+        for dictionary_id in dictionary_ids - set(self.codec.dictionaries) - {""}:
+            encoded = await self.client.get(f"{DICTIONARY_PREFIX}:{dictionary_id}")
+            if encoded is None:
+                raise LookupError(f"Compression dictionary {dictionary_id} is missing")
+            self.codec.dictionaries[dictionary_id] = base64.b85decode(encoded)
+
+    async def _refresh_dictionary(self):
+        # Writers pick up a dictionary trained by any process within DICTIONARY_CHECK_SECONDS.
+        if self.codec is None or time.monotonic() - self._dictionary_checked < DICTIONARY_CHECK_SECONDS:
+            return
+        self._dictionary_checked = time.monotonic()
+        current = await self.client.get(f"{DICTIONARY_PREFIX}:current")
+        if current and current != self.codec.current:
+            await self._fetch_dictionaries({current})
+            self.codec.current = current
+
+    @timed_async("job_store_write")
+    async def create(self, job_id: str, job: dict):
+        member = index_member(job.get("created_at") or time.time(), job_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key(job_id), mapping={**self._encode(job), "_index": json.dumps(member)})
+            pipe.expire(self._key(job_id), self.ttl_seconds)
+            for key in _index_keys(job):
+                pipe.zadd(key, {member: 0})
+            pipe.hset(DIMENSIONS_KEY, member, json.dumps([_dimension(job.get(dim)) for dim in INDEX_DIMENSIONS]))
+            await pipe.execute()
+
+    @timed_async("job_store_read")
+    async def get(self, job_id: str) -> Optional[dict]:
+        raw = await self.client.hgetall(self._key(job_id))
+        if not raw:
+            return None
+        await self._load_dictionaries([raw])
+        return self._decode(raw)
+
+    @timed_async("job_store_read")
+    async def get_many(self, job_ids: List[str]) -> Dict[str, Optional[dict]]:
+        async with self.client.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                pipe.hgetall(self._key(job_id))
+            rows = await pipe.execute()
+        await self._load_dictionaries(rows)
+        return {job_id: self._decode(raw) if raw else None for job_id, raw in zip(job_ids, rows)}
+
+    @timed_async("job_store_write")
+    async def update(self, job_id: str, **fields) -> bool:
+        if any(field in COMPRESSED_FIELDS for field in fields):
+            await self._refresh_dictionary()
+        args = [item for pair in self._encode(fields).items() for item in pair]
+        notify = "1" if "status" in fields else "0"
+        status = _dimension(fields.get("status")) or ""
+        applied = await self.client.eval(
+            _UPDATE_SCRIPT, 3, self._key(job_id), DIMENSIONS_KEY, f"{EVENTS_PREFIX}:{job_id}",
+            notify, _TERMINAL_MARKERS, status, INDEX_PREFIX, *args,
+        )
+        return bool(applied)
+
+    @timed_async("job_store_write")
+    async def delete(self, job_id: str):
+        await self.client.eval(_DELETE_SCRIPT, 2, self._key(job_id), DIMENSIONS_KEY, INDEX_PREFIX, "")
+
+    async def _range(self, key: str, lower: str, upper: str, limit: int, newest_first: bool = False) -> List[str]:
+        if newest_first:
+            return await self.client.zrange(key, upper, lower, desc=True, bylex=True, offset=0, num=limit)
+        return await self.client.zrange(key, lower, upper, bylex=True, offset=0, num=limit)
+
+    async def iter_jobs(self, batch_size: int = 500) -> AsyncIterator[Tuple[str, dict]]:
+        lower = "-"
+        while True:
+            members = await self._range(INDEX_PREFIX, lower, "+", batch_size)
+            if not members:
+                return
+            for item in (await self.get_many([_member_job_id(member) for member in members])).items():
+                if item[1] is not None:
+                    yield item
+            lower = "(" + members[-1]
+
+    @timed_async("job_store_read")
+    async def list_jobs(self, filters, since=None, until=None, cursor=None, limit=50):
+        key = index_key(**filters)
+        if cursor:
+            upper = "(" + cursor
+        else:
+            upper = "(" + _time_bound(until) if until is not None else "+"
+        lower = "[" + _time_bound(since) if since is not None else "-"
+        members = await self._range(key, lower, upper, limit, newest_first=True)
+        async with self.client.pipeline(transaction=False) as pipe:
+            for member in members:
+                pipe.hmget(self._key(_member_job_id(member)), SUMMARY_FIELDS)
+            rows = await pipe.execute()
+        jobs, orphans = [], []
+        for member, values in zip(members, rows):
+            if values[0] is None:
+                orphans.append(member)  # Hash expired before compaction got to it
+                continue
+            summary = {field: json.loads(value) if value is not None else None for field, value in zip(SUMMARY_FIELDS, values)}
+            jobs.append({"job_id": _member_job_id(member), **summary})
+        if orphans:
+            await self.client.zrem(key, *orphans)
+        return jobs, members[-1] if len(members) == limit else None
+
+    async def compact(self, now=None, batch_size=500):
+        now = now or time.time()
+        counts = {"pruned": 0, "deleted": 0}
+        # Expired jobs first, so their results aren't pruned just before they are deleted.
+        delete_before = "(" + _time_bound(now - settings.job_retention_seconds)
+        while True:
+            members = await self._range(INDEX_PREFIX, "-", delete_before, batch_size)
+            async with self.client.pipeline(transaction=False) as pipe:
+                for member in members:
+                    pipe.eval(_DELETE_SCRIPT, 2, self._key(_member_job_id(member)), DIMENSIONS_KEY, INDEX_PREFIX, member)
+                counts["deleted"] += sum(await pipe.execute())
+            if len(members) < batch_size:
+                break
+        # Results are pruned once, oldest first, resuming after the last pruned member.
+        prune_before = "(" + _time_bound(now - settings.job_result_retention_seconds)
+        pruned_fields = [item for field in PRUNED_FIELDS for item in (field, "null")] + ["pruned", "true"]
+        while True:
+            watermark = await self.client.get(COMPACTED_KEY)
+            members = await self._range(INDEX_PREFIX, "(" + watermark if watermark else "-", prune_before, batch_size)
+            if not members:
+                break
+            async with self.client.pipeline(transaction=False) as pipe:
+                for member in members:
+                    pipe.eval(_PRUNE_SCRIPT, 1, self._key(_member_job_id(member)), *pruned_fields)
+                pipe.set(COMPACTED_KEY, members[-1])
+                counts["pruned"] += sum((await pipe.execute())[:-1])
+            if len(members) < batch_size:
+                break
+        return counts
+
+    async def train_dictionary(self, samples: Iterable[str]) -> dict:
+        samples = list(samples)
+        zdict = train_dictionary(samples)
+        if not zdict:
+            raise ValueError("Not enough repeated content in the samples to train a dictionary")
+        codec = self.codec or ResultCodec()
+        dictionary_id = codec.add_dictionary(zdict)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(f"{DICTIONARY_PREFIX}:{dictionary_id}", base64.b85encode(zdict).decode())
+            pipe.set(f"{DICTIONARY_PREFIX}:current", dictionary_id)
+            await pipe.execute()
+        # Savings on the samples themselves, without and with the new dictionary.
+        plain = ResultCodec(codec.level)
+        trained = ResultCodec(codec.level)
+        trained.current = trained.add_dictionary(zdict)
+        raw_bytes = sum(len(sample.encode()) for sample in samples)
+        plain_bytes = sum(len(plain.encode(sample) or sample) for sample in samples)
+        trained_bytes = sum(len(trained.encode(sample) or sample) for sample in samples)
+        if self.codec is not None:
+            self.codec.current = dictionary_id
+        return {
+            "dictionary_id": dictionary_id,
+            "dictionary_bytes": len(zdict),
+            "samples": len(samples),
+            "raw_bytes": raw_bytes,
+            "stored_bytes_without_dictionary": plain_bytes,
+            "stored_bytes_with_dictionary": trained_bytes,
+        }
+
+    async def watch(self, job_id: str) -> asyncio.Event:
+        await self._ensure_listener()
+        return await super().watch(job_id)
+
+    async def _ensure_listener(self):
+        # One pattern subscription per process fans status changes out to local waiters,
+        # instead of a pub/sub connection per long-poll request.
+        if self._listener is not None and not self._listener.done():
+            return
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.psubscribe(f"{EVENTS_PREFIX}:*")
+        self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        prefix_length = len(EVENTS_PREFIX) + 1
+        try:
+            async for message in self._pubsub.listen():
+                if message["type"] == "pmessage":
+                    self._notify(message["channel"][prefix_length:])
+        except Exception as e:
+            logger.warning("Job event listener stopped: %s", e)
+        finally:
+            # Wake everyone so they fall back to re-reading the store.
+            for job_id in list(self._watchers):
+                self._notify(job_id)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            await self._pubsub.aclose()
+            self._listener = None
+
+def create_job_store() -> JobStore:
+    if redis_available:
+        return RedisJobStore(async_redis_client)
+    return InMemoryJobStore()
+
+job_store = create_job_store()
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Tuple
+from backend.config import settings, validate_settings
+from backend.prompt_generator import warm_generators
+from backend.redis_client import ping_redis, redis_available
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Startup checks run by the app lifespan, and the readiness state /readyz reports. A process is
+# live as soon as it serves /healthz; it is ready once warm-up finished, Redis (when enabled)
+# answers a ping, and at least one PROVIDER_ORDER target was built and reached. An unreachable
+# Redis keeps the process unready rather than switching it to per-process stores, which would
+# split job state between replicas.
+
+class Readiness:
+    def __init__(self):
+        self.started = False
+        self.warm_up_seconds = None
+        self.providers: Dict[str, str] = {}  # "provider/model" -> "ok" or the startup error
+
+    def providers_ready(self) -> bool:
+        return any(status == "ok" for status in self.providers.values())
+
+readiness = Readiness()
+
+async def check_redis() -> str:
+    if not redis_available:
+        return "disabled"
+    try:
+        await asyncio.wait_for(ping_redis(), timeout=settings.redis_connect_timeout)
+        return "ok"
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+async def check_providers() -> Dict[str, str]:
+    if not settings.warm_generators_on_startup:
+        return {}
+    results = await asyncio.to_thread(
+        warm_generators, check=settings.startup_check_providers, timeout=settings.startup_timeout_seconds
+    )
+    return {name: error or "ok" for name, error in results.items()}
+
+def startup():
+    # Configuration errors abort startup; unreachable dependencies only keep the process unready.
+    validate_settings()
+
+async def warm_up():
+    # Runs in the background while the server already accepts connections.
+    started = time.perf_counter()
+    redis_status, readiness.providers = await asyncio.gather(check_redis(), check_providers())
+    readiness.warm_up_seconds = round(time.perf_counter() - started, 3)
+    readiness.started = True
+    logger.info("Warm-up finished in %.3f s: redis %s, providers %s", readiness.warm_up_seconds, redis_status, readiness.providers)
+
+async def ready() -> Tuple[bool, dict]:
+    redis_status = await check_redis()
+    checks = {
+        "warm_up": "ok" if readiness.started else "pending",
+        "redis": redis_status,
+        "providers": readiness.providers or ("skipped" if readiness.started else "pending"),
+    }
+    ok = readiness.started and redis_status in ("ok", "disabled") and (
+        readiness.providers_ready() or not readiness.providers
+    )
+    return ok, {"status": "ready" if ok else "not_ready", "warm_up_seconds": readiness.warm_up_seconds, "checks": checks}
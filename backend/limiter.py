@@ -1,5 +1,250 @@
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+import hashlib
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+from fastapi import HTTPException, Request, Response
+from backend.config import settings
+from backend.redis_client import async_redis_client, redis_available
+from backend.validation import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+KEY_PREFIX = "archigenie:ratelimit"
+PROMPT_OVERHEAD_TOKENS = 100  # Instruction template wrapped around every requirement
+
+# Two token buckets per client, refilled continuously to a one-minute budget: one counts
+# requests, the other estimated LLM tokens. A call is granted only if both buckets cover its
+# need; it may take more (a lease) so following requests are served from process memory.
+# Unused lease tokens come back as a refund on the next call. A refusal reports which bucket
+# (1 requests, 2 tokens) limited it.
+_TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[12])
+local levels = {}
+local capacities = {tonumber(ARGV[2]), tonumber(ARGV[4])}
+local rates = {tonumber(ARGV[3]), tonumber(ARGV[5])}
+local needs = {tonumber(ARGV[6]), tonumber(ARGV[7])}
+local wants = {tonumber(ARGV[8]), tonumber(ARGV[9])}
+local refunds = {tonumber(ARGV[10]), tonumber(ARGV[11])}
+local retry_after = 0
+local limited = 0
+for i = 1, 2 do
+    local state = redis.call('hmget', KEYS[i], 'level', 'ts')
+    local level = tonumber(state[1]) or capacities[i]
+    local ts = tonumber(state[2]) or now
+    level = math.min(capacities[i], level + math.max(0, now - ts) * rates[i] + refunds[i])
+    levels[i] = level
+    if needs[i] > capacities[i] then
+        if retry_after >= 0 then
+            limited = i
+        end
+        retry_after = -1
+    elseif needs[i] > level and retry_after >= 0 then
+        local wait = (needs[i] - level) / rates[i]
+        if wait > retry_after then
+            retry_after = wait
+            limited = i
+        end
+    end
+end
+local granted = {0, 0}
+if retry_after == 0 then
+    for i = 1, 2 do
+        granted[i] = math.max(needs[i], math.min(wants[i], math.floor(levels[i])))
+        levels[i] = levels[i] - granted[i]
+    end
+end
+for i = 1, 2 do
+    redis.call('hset', KEYS[i], 'level', tostring(levels[i]), 'ts', tostring(now))
+    redis.call('expire', KEYS[i], ttl)
+end
+return {granted[1], granted[2], tostring(levels[1]), tostring(levels[2]), tostring(retry_after), limited}
+"""
+
+@dataclass
+class Grant:
+    requests: int
+    tokens: int
+    remaining_requests: float
+    remaining_tokens: float
+    retry_after: float  # 0 when granted, -1 when the need exceeds the bucket capacity
+    limited: int = 0  # Bucket that refused: 1 requests, 2 tokens
+
+@dataclass
+class Lease:
+    requests: int
+    tokens: int
+    remaining_requests: float
+    remaining_tokens: float
+    expires_at: float
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    resource: str  # Bucket the figures below describe: "tokens", or "requests" when it refused
+    limit: int
+    remaining: int
+    reset_seconds: int
+    retry_after: Optional[int] = None
+
+class MemoryBucketStore:
+    # Single-process fallback with the same arithmetic as _TAKE_SCRIPT.
+    def __init__(self):
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def take(self, keys, capacities, rates, needs, wants, refunds) -> Grant:
+        now = time.time()
+        levels, retry_after, limited = [], 0.0, 0
+        for bucket, (key, capacity, rate, need, refund) in enumerate(zip(keys, capacities, rates, needs, refunds), start=1):
+            level, ts = self.buckets.get(key, (capacity, now))
+            level = min(capacity, level + max(0.0, now - ts) * rate + refund)
+            levels.append(level)
+            if need > capacity:
+                if retry_after >= 0:
+                    limited = bucket
+                retry_after = -1
+            elif need > level and retry_after >= 0 and (need - level) / rate > retry_after:
+                retry_after = (need - level) / rate
+                limited = bucket
+        granted = [0, 0]
+        if retry_after == 0:
+            granted = [max(need, min(want, math.floor(level))) for need, want, level in zip(needs, wants, levels)]
+            levels = [level - amount for level, amount in zip(levels, granted)]
+        for key, level in zip(keys, levels):
+            self.buckets[key] = (level, now)
+        return Grant(granted[0], granted[1], levels[0], levels[1], retry_after, limited)
+
+class RedisBucketStore:
+    def __init__(self, client):
+        self.client = client
+
+    async def take(self, keys, capacities, rates, needs, wants, refunds) -> Grant:
+        args = [time.time()]
+        for capacity, rate in zip(capacities, rates):
+            args += [capacity, rate]
+        args += [*needs, *wants, *refunds, 120]
+        granted_requests, granted_tokens, requests_left, tokens_left, retry_after, limited = await self.client.eval(
+            _TAKE_SCRIPT, 2, *keys, *args
+        )
+        return Grant(
+            int(granted_requests), int(granted_tokens), float(requests_left), float(tokens_left), float(retry_after), int(limited)
+        )
+
+class TokenBudgetLimiter:
+    # Per-client budgets of rate_limit_per_minute requests and rate_limit_tokens_per_minute
+    # estimated LLM tokens, shared across processes through Redis. Each process leases a
+    # small slice of a client's budget and serves requests from it locally until the slice
+    # runs out or expires, so most requests skip the Redis round trip.
+    def __init__(self, store):
+        self.store = store
+        self._leases: Dict[str, Lease] = {}
+
+    @property
+    def request_capacity(self) -> int:
+        return settings.rate_limit_per_minute
+
+    @property
+    def token_capacity(self) -> int:
+        return settings.rate_limit_tokens_per_minute
+
+    @staticmethod
+    def _reset_seconds(capacity: int, remaining: float) -> int:
+        # Time for the bucket to refill completely at capacity per minute; a zero budget never does.
+        if capacity <= 0:
+            return 0
+        return math.ceil(max(0.0, capacity - remaining) / (capacity / 60))
+
+    def _tokens_result(self, remaining: float) -> RateLimitResult:
+        remaining = int(remaining)
+        return RateLimitResult(True, "tokens", self.token_capacity, remaining, self._reset_seconds(self.token_capacity, remaining))
+
+    async def check(self, client_id: str, cost: int) -> RateLimitResult:
+        # One request and `cost` estimated tokens.
+        now = time.monotonic()
+        lease = self._leases.get(client_id)
+        if lease and lease.expires_at > now and lease.requests >= 1 and lease.tokens >= cost:
+            lease.requests -= 1
+            lease.tokens -= cost
+            return self._tokens_result(lease.remaining_tokens + lease.tokens)
+
+        refunds = (lease.requests, lease.tokens) if lease else (0, 0)
+        self._leases.pop(client_id, None)
+        grant = await self.store.take(
+            (f"{KEY_PREFIX}:{client_id}:requests", f"{KEY_PREFIX}:{client_id}:tokens"),
+            (self.request_capacity, self.token_capacity),
+            (self.request_capacity / 60, self.token_capacity / 60),
+            (1, cost),
+            (max(1, settings.rate_limit_lease_requests), max(cost, settings.rate_limit_lease_tokens)),
+            refunds,
+        )
+        if grant.retry_after != 0:
+            retry_after = None if grant.retry_after < 0 else max(1, math.ceil(grant.retry_after))
+            if grant.limited == 1:
+                resource, capacity, remaining = "requests", self.request_capacity, grant.remaining_requests
+            else:
+                resource, capacity, remaining = "tokens", self.token_capacity, grant.remaining_tokens
+            remaining = int(remaining)
+            return RateLimitResult(False, resource, capacity, remaining, self._reset_seconds(capacity, remaining), retry_after)
+        if grant.requests > 1 or grant.tokens > cost:
+            self._leases[client_id] = Lease(
+                grant.requests - 1,
+                grant.tokens - cost,
+                grant.remaining_requests,
+                grant.remaining_tokens,
+                now + settings.rate_limit_lease_seconds,
+            )
+        return self._tokens_result(grant.remaining_tokens + grant.tokens - cost)
+
+def client_identity(request: Request) -> str:
+    # Budgets follow the API key when one is sent, otherwise the client address. Keys are
+    # hashed so they never appear in Redis.
+    api_key = request.headers.get("X-API-Key")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:24]
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+def estimate_tokens(prompt_text: str, completion_tokens: int = None) -> int:
+    # Prompt plus the completion budget the provider may spend on it.
+    if completion_tokens is None:
+        completion_tokens = settings.generation_max_tokens
+    return PROMPT_OVERHEAD_TOKENS + len(prompt_text) // CHARS_PER_TOKEN + completion_tokens
+
+async def enforce_rate_limit(request: Request, response: Response, prompt_text: str, completion_tokens: int = None):
+    await _enforce(request, response, estimate_tokens(prompt_text, completion_tokens))
+
+async def enforce_request_limit(request: Request, response: Response):
+    # A request served without a provider call: counted against the request budget only.
+    await _enforce(request, response, 0)
+
+async def enforce_batch_rate_limit(request: Request, response: Response, items: Iterable[Tuple[str, int]]):
+    # A batch is one request whose token cost is the sum of its (prompt text, completion
+    # tokens) items, so batching cannot get around the token budget.
+    await _enforce(request, response, sum(estimate_tokens(prompt_text, completion_tokens) for prompt_text, completion_tokens in items))
+
+async def _enforce(request: Request, response: Response, cost: int):
+    if not settings.rate_limit_enabled:
+        return
+    result = await limiter.check(client_identity(request), cost)
+    headers = {
+        "X-RateLimit-Limit": str(result.limit),
+        "X-RateLimit-Remaining": str(max(0, result.remaining)),
+        "X-RateLimit-Reset": str(result.reset_seconds),
+        "X-RateLimit-Resource": result.resource,
+    }
+    if result.allowed:
+        response.headers.update(headers)
+        return
+    if result.retry_after is None:
+        raise HTTPException(
+            status_code=429,
+            detail="Request exceeds the per-minute token budget; shorten the input or split the batch.",
+            headers=headers,
+        )
+    headers["Retry-After"] = str(result.retry_after)
+    raise HTTPException(status_code=429, detail="Rate limit exceeded, retry later.", headers=headers)
 
 # Create a single limiter instance to be shared.
-limiter = Limiter(key_func=get_remote_address)
+limiter = TokenBudgetLimiter(RedisBucketStore(async_redis_client) if redis_available else MemoryBucketStore())
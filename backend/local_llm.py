@@ -0,0 +1,150 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+from langchain.llms.base import LLM
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+class LocalModelRunner:
+    # Owns one transformers model per worker process and serves concurrent callers by grouping
+    # their prompts into dynamic batches: the first request opens a window of local_max_wait_ms,
+    # and everything that arrives within it (up to local_max_batch_size) shares one generate().
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.model = None
+        self.tokenizer = None
+        self.is_encoder_decoder = False
+        self._requests: "queue.Queue[Tuple[str, int, float, Future]]" = queue.Queue()
+        self._load_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self.stats = {"requests": 0, "batches": 0, "max_batch": 0}
+
+    def load(self):
+        with self._load_lock:
+            if self.model is not None:
+                return
+            import torch
+            from transformers import AutoConfig, AutoModelForCausalLM, AutoModelForSeq2SeqLM, AutoTokenizer
+            started = time.perf_counter()
+            if settings.local_num_threads:
+                torch.set_num_threads(settings.local_num_threads)
+            config = AutoConfig.from_pretrained(self.model_name)
+            self.is_encoder_decoder = bool(getattr(config, "is_encoder_decoder", False))
+            model_class = AutoModelForSeq2SeqLM if self.is_encoder_decoder else AutoModelForCausalLM
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            if not self.is_encoder_decoder:
+                # Decoder-only models generate after the prompt, so pad on the left.
+                tokenizer.padding_side = "left"
+                if tokenizer.pad_token is None:
+                    tokenizer.pad_token = tokenizer.eos_token
+            model = model_class.from_pretrained(self.model_name)
+            model.eval()
+            if settings.local_quantize_int8:
+                # Dynamic int8 quantization of Linear layers: ~4x smaller weights, faster CPU matmuls.
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.tokenizer = tokenizer
+            self.model = model
+            self._worker = threading.Thread(target=self._serve, name=f"local-llm-{self.model_name}", daemon=True)
+            self._worker.start()
+            logger.info(
+                "Loaded local model %s in %.1fs (int8=%s)",
+                self.model_name, time.perf_counter() - started, settings.local_quantize_int8,
+            )
+
+    def submit(self, prompt: str, max_new_tokens: int, temperature: float) -> Future:
+        self.load()
+        future: Future = Future()
+        self._requests.put((prompt, min(max_new_tokens, settings.local_max_new_tokens), temperature, future))
+        return future
+
+    def _collect(self) -> List[Tuple[str, int, float, Future]]:
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + settings.local_max_wait_ms / 1000
+        while len(batch) < settings.local_max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _serve(self):
+        while True:
+            batch = [item for item in self._collect() if item[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                outputs = self._generate_batch(batch)
+            except Exception as e:
+                logger.exception("Local batch generation failed")
+                for *_, future in batch:
+                    future.set_exception(e)
+                continue
+            for (*_, future), text in zip(batch, outputs):
+                future.set_result(text)
+
+    def _generate_batch(self, batch: List[Tuple[str, int, float, Future]]) -> List[str]:
+        import torch
+        prompts = [prompt for prompt, *_ in batch]
+        max_new_tokens = max(tokens for _, tokens, _, _ in batch)
+        temperature = batch[0][2]
+        encoded = self.tokenizer(
+            prompts,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=settings.local_max_input_tokens,
+        )
+        # Truncated inputs plus a capped completion bound the KV cache per sequence.
+        with torch.inference_mode():
+            generated = self.model.generate(
+                **encoded,
+                max_new_tokens=max_new_tokens,
+                do_sample=temperature > 0,
+                temperature=temperature if temperature > 0 else None,
+                pad_token_id=self.tokenizer.pad_token_id,
+                use_cache=True,
+            )
+        if not self.is_encoder_decoder:
+            generated = generated[:, encoded["input_ids"].shape[1]:]
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+        return self.tokenizer.batch_decode(generated, skip_special_tokens=True)
+
+_runners: Dict[str, LocalModelRunner] = {}
+_runners_lock = threading.Lock()
+
+def get_local_runner(model_name: str) -> LocalModelRunner:
+    with _runners_lock:
+        runner = _runners.get(model_name)
+        if runner is None:
+            runner = _runners[model_name] = LocalModelRunner(model_name)
+    return runner
+
+class LocalBatchedLLM(LLM):
+    # LangChain adapter so ArchitectureGenerator can treat the local model like any other provider.
+    model_name: str
+    max_new_tokens: int = 512
+    temperature: float = 0.4
+    request_timeout: float = 300
+
+    @property
+    def _llm_type(self) -> str:
+        return "local_batched"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "max_new_tokens": self.max_new_tokens, "temperature": self.temperature}
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        runner = get_local_runner(self.model_name)
+        max_new_tokens = kwargs.get("max_new_tokens", self.max_new_tokens)
+        return runner.submit(prompt, max_new_tokens, self.temperature).result(timeout=self.request_timeout)
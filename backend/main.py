@@ -1,19 +1,40 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi.middleware import SlowAPIMiddleware
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager, suppress
 import os
+import asyncio
 import logging
-from backend.api import router
-from backend.limiter import limiter  # Import shared limiter
+import time
+from backend.api import router, scheduler
+from backend.job_store import job_store
+from backend import compression, job_compactor, lifecycle, metrics, precompute_job
 
 logging.basicConfig(level=logging.DEBUG)
 
-# Initialize the limiter first and attach to app state.
-app = FastAPI(title="ArchiGenie API")
-app.state.limiter = limiter
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    lifecycle.startup()
+    await scheduler.start()
+    # Clients are built and providers/Redis verified in parallel while /healthz already answers;
+    # /readyz turns 200 when this finishes.
+    background = [
+        asyncio.create_task(lifecycle.warm_up()),
+        asyncio.create_task(precompute_job.maintain()),
+        asyncio.create_task(job_compactor.maintain()),
+    ]
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        await scheduler.stop()
+        await job_store.close()
 
-# Add SlowAPI middleware
-app.add_middleware(SlowAPIMiddleware)
+# Rate limits are enforced per generation endpoint (backend/limiter.py), not as middleware.
+app = FastAPI(title="ArchiGenie API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +46,36 @@ app.add_middleware(
 
 app.include_router(router)
 
+@app.middleware("http")
+async def compress_responses(request: Request, call_next):
+    # JSON responses get an ETag and gzip/br per Accept-Encoding (backend/compression.py).
+    return await compression.compress_response(request, await call_next(request))
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Every request gets a trace ID (client-supplied X-Trace-ID or a new one); job endpoints
+    # copy it into the job record so slow jobs can be traced after the fact.
+    trace_id = request.headers.get("X-Trace-ID") or metrics.new_trace_id()
+    metrics.trace_id_var.set(trace_id)
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.HTTP_SECONDS.labels(
+        request.method, route.path if route else "unmatched", str(response.status_code)
+    ).observe(time.perf_counter() - started)
+    response.headers["X-Trace-ID"] = trace_id
+    return response
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    # Liveness: the process is up and its event loop responds.
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    ready, body = await lifecycle.ready()
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("backend.main:app", host="0.0.0.0", port=8000)
@@ -0,0 +1,125 @@
+import functools
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Per-stage latency histograms plus the counters behind /metrics. Stage timings observed while
+# a job's collect_timings() scope is active are also summed into that job's record, so a slow
+# job can be explained after the fact from GET /jobs/{id}.
+
+STAGES = (
+    "request_parse",
+    "prompt_build",
+    "generator_init",
+    "provider_ttft",
+    "provider_total",
+    "sanitize",
+    "validate",
+    "job_store_read",
+    "job_store_write",
+    "queue_wait",
+)
+_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram("archigenie_stage_seconds", "Latency of each request/generation stage", ["stage"], buckets=_BUCKETS)
+HTTP_SECONDS = Histogram("archigenie_http_request_seconds", "HTTP request latency", ["method", "route", "status"], buckets=_BUCKETS)
+GENERATION_ATTEMPTS = Histogram("archigenie_generation_attempts", "Provider attempts per generation", buckets=(1, 2, 3, 4, 6, 8))
+GENERATION_RETRIES = Counter("archigenie_generation_retries_total", "Generation attempts beyond the first")
+CACHE_REQUESTS = Counter("archigenie_cache_requests_total", "Result cache lookups", ["result"])
+CACHE_HIT_RATIO = Gauge("archigenie_cache_hit_ratio", "Result cache hits / lookups since start")
+JOBS_IN_FLIGHT = Gauge("archigenie_jobs_in_flight", "Jobs currently being processed by this process")
+JOBS_TOTAL = Counter("archigenie_jobs_total", "Finished jobs", ["status"])
+LLM_TOKENS = Counter("archigenie_llm_tokens_total", "Provider prompt and completion tokens", ["kind"])
+PROVIDER_ERRORS = Counter("archigenie_provider_errors_total", "Provider call failures by exception class", ["provider", "error"])
+BREAKER_STATE = Gauge("archigenie_provider_breaker_state", "Breaker state per provider target (0 closed, 1 half-open, 2 open)", ["target"])
+FAILOVERS = Counter("archigenie_provider_failovers_total", "Generations served by a later provider target", ["from_target", "to_target"])
+PRECOMPUTE_REQUESTS = Counter("archigenie_precompute_requests_total", "Precomputed index lookups", ["result"])
+RESULT_BYTES = Counter("archigenie_result_bytes_total", "Job result bytes before (raw) and after (stored) compression", ["kind"])
+RESPONSE_BYTES = Counter("archigenie_response_bytes_total", "JSON response bytes before (raw) and after (sent) compression/304s", ["kind"])
+NOT_MODIFIED = Counter("archigenie_not_modified_total", "Responses answered 304 from If-None-Match")
+JOBS_REDELIVERED = Counter("archigenie_jobs_redelivered_total", "Claimed jobs reaped after their worker stopped renewing them", ["outcome"])
+JOBS_COMPACTED = Counter("archigenie_jobs_compacted_total", "Job records touched by retention compaction", ["action"])
+
+trace_id_var: ContextVar[str] = ContextVar("archigenie_trace_id", default="")
+_timings_var: ContextVar[Optional[Dict[str, float]]] = ContextVar("archigenie_timings", default=None)
+_cache_counts = {"hit": 0, "miss": 0}
+# Token accounting shares the timings scope; jobs split these keys out as "usage".
+USAGE_KEYS = ("prompt_tokens", "completion_tokens", "max_tokens")
+
+for _stage in STAGES:
+    STAGE_SECONDS.labels(_stage)  # Export every stage from the first scrape
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+def observe(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _timings_var.get()
+    if timings is not None:
+        key = f"{stage}_ms"
+        timings[key] = round(timings.get(key, 0.0) + seconds * 1000, 2)
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+def timed_async(stage: str):
+    # Decorator form of timed() for coroutine methods (job store operations).
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with timed(stage):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def collect_timings():
+    # Stage timings (and attempt counts) recorded inside this scope, including worker threads
+    # started through asyncio.to_thread, accumulate into the yielded dict.
+    timings: Dict[str, float] = {}
+    token = _timings_var.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings_var.reset(token)
+
+def record_attempts(attempts: int):
+    GENERATION_ATTEMPTS.observe(attempts)
+    if attempts > 1:
+        GENERATION_RETRIES.inc(attempts - 1)
+    timings = _timings_var.get()
+    if timings is not None:
+        timings["attempts"] = timings.get("attempts", 0) + attempts
+
+def record_tokens(prompt_tokens: int, completion_tokens: int):
+    LLM_TOKENS.labels("prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels("completion").inc(completion_tokens)
+    timings = _timings_var.get()
+    if timings is not None:
+        timings["prompt_tokens"] = timings.get("prompt_tokens", 0) + prompt_tokens
+        timings["completion_tokens"] = timings.get("completion_tokens", 0) + completion_tokens
+
+def record_max_tokens(max_tokens: int):
+    timings = _timings_var.get()
+    if timings is not None:
+        timings["max_tokens"] = max_tokens
+
+def record_cache(hit: bool):
+    result = "hit" if hit else "miss"
+    CACHE_REQUESTS.labels(result).inc()
+    _cache_counts[result] += 1
+    CACHE_HIT_RATIO.set(_cache_counts["hit"] / (_cache_counts["hit"] + _cache_counts["miss"]))
+
+def record_provider_error(provider: str, error: Exception):
+    PROVIDER_ERRORS.labels(provider, type(error).__name__).inc()
+
+def render() -> bytes:
+    return generate_latest()
@@ -1,12 +1,22 @@
 from enum import Enum
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class JobStatus(str, Enum):
     PENDING = "pending"
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"  # DELETE /jobs/{id}
+    EXPIRED = "expired"  # Ran out of its X-Request-Timeout budget
+
+# No further updates are applied to a job in one of these.
+TERMINAL_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED, JobStatus.EXPIRED)
+
+class JobPriority(str, Enum):
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
 
 class ArchitectureRequest(BaseModel):
     functional_requirement: Optional[str] = Field(
@@ -41,6 +51,23 @@ class ArchitectureRequest(BaseModel):
 class ArchitectureResponse(BaseModel):
     architecture: str
 
+class RevisionRequest(BaseModel):
+    request: ArchitectureRequest
+    base_job_id: Optional[str] = Field(None, description="Completed /generate-prompt/jobs job to revise")
+    base_request: Optional[ArchitectureRequest] = Field(None, description="Request that produced base_architecture")
+    base_architecture: Optional[str] = Field(None, description="Previously generated plan to revise")
+
+class RevisionResponse(BaseModel):
+    job_id: str = Field(..., description="Completed job holding this revision; usable as the next base_job_id")
+    architecture: str
+    changed_fields: List[str]
+    regenerated: List[str] = Field(..., description="Plan sections generated for this revision")
+    reused: List[str] = Field(..., description="Plan sections copied verbatim from the base plan")
+
+class BatchGenerateRequest(BaseModel):
+    requests: List[ArchitectureRequest] = Field(..., min_length=1, max_length=1000)
+    concurrency: Optional[int] = Field(None, ge=1, description="Lower the server's batch concurrency for this batch")
+
 class InvokeRequest(BaseModel):
     prompt: str = Field(..., min_length=50, max_length=5000)
 
@@ -55,3 +82,10 @@ class JobStatusResponse(BaseModel):
     result: Optional[str]
     error: Optional[str]
     progress: int
+    queue_position: Optional[int] = None
+    trace_id: Optional[str] = None
+    timings: Optional[Dict[str, float]] = Field(None, description="Per-stage milliseconds and attempt count")
+    usage: Optional[Dict[str, int]] = Field(None, description="prompt_tokens, completion_tokens and the max_tokens budget")
+
+class JobStatusBatchRequest(BaseModel):
+    job_ids: List[str] = Field(..., min_length=1, max_length=500)
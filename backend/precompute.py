@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+from backend.config import settings
+from backend import metrics
+from backend.redis_client import redis_client, redis_available
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+INDEX_KEY = "archigenie:precompute"
+
+# Architectures generated ahead of time for popular requests (see backend/precompute_job.py),
+# keyed by the canonical request alone. Each entry records the prompt version and model that
+# produced it; generate_prompt only serves entries that match the current ones, and the next
+# precompute pass regenerates the rest. Lookups read an in-process mirror and never leave the
+# process; the shared copy lives in one Redis hash and is re-read every precompute_sync_seconds.
+
+def request_id(mode: str, canonical: dict) -> str:
+    material = json.dumps({"mode": mode, "request": canonical}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(material.encode()).hexdigest()[:32]
+
+@dataclass
+class PrecomputedEntry:
+    mode: str
+    request: dict  # Canonical form
+    architecture: str
+    prompt_version: str
+    provider: str
+    model: str
+    generated_at: float
+    popularity: int = 0  # Requests seen when it was selected (0 for listed combinations)
+
+    def is_fresh(self, prompt_version: str, provider: str, model: str, now: float = None) -> bool:
+        if (self.prompt_version, self.provider, self.model) != (prompt_version, provider, model):
+            return False
+        max_age = settings.precompute_max_age_seconds
+        return not max_age or (now or time.time()) - self.generated_at < max_age
+
+class PrecomputeIndex:
+    def __init__(self, client=None):
+        self.client = client
+        self.synced_at: Optional[float] = None
+        self._entries: Dict[str, PrecomputedEntry] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, mode: str, canonical: dict, prompt_version: str, provider: str, model: str) -> Optional[str]:
+        entry = self._entries.get(request_id(mode, canonical))
+        if entry is None:
+            metrics.PRECOMPUTE_REQUESTS.labels("miss").inc()
+            return None
+        if not entry.is_fresh(prompt_version, provider, model):
+            metrics.PRECOMPUTE_REQUESTS.labels("stale").inc()
+            return None
+        metrics.PRECOMPUTE_REQUESTS.labels("hit").inc()
+        return entry.architecture
+
+    def get(self, entry_id: str) -> Optional[PrecomputedEntry]:
+        return self._entries.get(entry_id)
+
+    def entries(self) -> List[PrecomputedEntry]:
+        return list(self._entries.values())
+
+    def put(self, entry: PrecomputedEntry):
+        entry_id = request_id(entry.mode, entry.request)
+        if self.client is not None:
+            self.client.hset(INDEX_KEY, entry_id, json.dumps(asdict(entry)))
+        with self._lock:
+            self._entries[entry_id] = entry
+
+    def remove(self, entry_id: str):
+        if self.client is not None:
+            self.client.hdel(INDEX_KEY, entry_id)
+        with self._lock:
+            self._entries.pop(entry_id, None)
+
+    def sync(self):
+        # Replaces the mirror with the shared index (entries written by other processes or by
+        # an offline run). A no-op without Redis, where the mirror is the index.
+        if self.client is None:
+            return
+        entries = {}
+        for entry_id, raw in self.client.hgetall(INDEX_KEY).items():
+            try:
+                entries[entry_id] = PrecomputedEntry(**json.loads(raw))
+            except (TypeError, ValueError) as e:
+                logger.warning("Skipping unreadable precomputed entry %s: %s", entry_id, e)
+        with self._lock:
+            self._entries = entries
+        self.synced_at = time.time()
+
+    def stats(self, prompt_version: str, provider: str, model: str) -> dict:
+        now = time.time()
+        entries = self.entries()
+        fresh = sum(1 for entry in entries if entry.is_fresh(prompt_version, provider, model, now))
+        return {
+            "entries": len(entries),
+            "fresh": fresh,
+            "stale": len(entries) - fresh,
+            "synced_at": self.synced_at,
+            "prompt_version": prompt_version,
+            "target": f"{provider}/{model}",
+        }
+
+precompute_index = PrecomputeIndex(redis_client if redis_available else None)
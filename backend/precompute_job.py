@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from backend.cache import canonicalize_request
+from backend.config import settings, validate_settings
+from backend.job_store import job_store
+from backend.models import ArchitectureRequest
+from backend.precompute import PrecomputedEntry, precompute_index, request_id
+from backend.prompt_generator import PROMPT_VERSION, generate_prompt, get_generator, primary_target
+from backend.redis_client import redis_client, redis_available
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Precompute passes for popular requests: candidates come from PRECOMPUTE_REQUESTS_PATH and/or
+# the most requested combinations in the job records; each candidate without a fresh entry
+# (and every stale entry already in the index) is generated and stored in the precompute index.
+# Passes run off-peak from the API process (PRECOMPUTE_ENABLED) or on demand:
+#   python -m backend.precompute_job --requests popular.jsonl --top 50
+
+LOCK_KEY = "archigenie:precompute:lock"
+LOCK_TTL_SECONDS = 3600
+
+Candidate = Tuple[str, dict, int]  # (mode, canonical request, popularity)
+
+def _mode(inputs: dict) -> Optional[str]:
+    if (inputs.get("functional_requirement") or "").strip():
+        return "functional"
+    if inputs.get("architecture"):
+        return "guided"
+    return None
+
+def load_requests(path: str) -> List[Candidate]:
+    # A JSON list or JSONL file of ArchitectureRequest payloads.
+    with open(path, encoding="utf-8") as source:
+        text = source.read()
+    stripped = text.lstrip()
+    payloads = json.loads(text) if stripped.startswith("[") else [json.loads(line) for line in text.splitlines() if line.strip()]
+    candidates = []
+    for number, payload in enumerate(payloads, start=1):
+        inputs = ArchitectureRequest(**payload).dict()
+        mode = _mode(inputs)
+        if mode is None:
+            logger.warning("Skipping precompute request %d: insufficient input", number)
+            continue
+        candidates.append((mode, canonicalize_request(mode, inputs), 0))
+    return candidates
+
+async def mine_requests(top_n: int, min_requests: int) -> List[Candidate]:
+    # The most requested combinations among live job records that kept their request.
+    counts: Counter = Counter()
+    requests: Dict[str, Tuple[str, dict]] = {}
+    async for _, job in job_store.iter_jobs():
+        mode, inputs = job.get("mode"), job.get("inputs")
+        if not mode or not inputs:
+            continue
+        canonical = canonicalize_request(mode, inputs)
+        entry_id = request_id(mode, canonical)
+        counts[entry_id] += 1
+        requests.setdefault(entry_id, (mode, canonical))
+    return [
+        (*requests[entry_id], count)
+        for entry_id, count in counts.most_common(top_n)
+        if count >= min_requests
+    ]
+
+def _generate(mode: str, canonical: dict, popularity: int) -> bool:
+    provider, model = primary_target()
+    architecture = generate_prompt(mode, canonical)
+    if not get_generator(provider, model)._is_valid_output(architecture):
+        logger.warning("Precomputed architecture for %s failed validation; not stored", request_id(mode, canonical))
+        return False
+    precompute_index.put(
+        PrecomputedEntry(mode, canonical, architecture, PROMPT_VERSION, provider, model, time.time(), popularity)
+    )
+    return True
+
+def _is_fresh(entry_id: str, provider: str, model: str) -> bool:
+    entry = precompute_index.get(entry_id)
+    return entry is not None and entry.is_fresh(PROMPT_VERSION, provider, model)
+
+async def refresh(candidates: List[Candidate]) -> dict:
+    # Generates every candidate, plus every indexed entry, that is not fresh for the current
+    # PROMPT_VERSION and primary model.
+    provider, model = primary_target()
+    work: Dict[str, Candidate] = {}
+    for entry in precompute_index.entries():
+        work[request_id(entry.mode, entry.request)] = (entry.mode, entry.request, entry.popularity)
+    for mode, canonical, popularity in candidates:
+        work[request_id(mode, canonical)] = (mode, canonical, popularity)
+    todo = [candidate for entry_id, candidate in work.items() if not _is_fresh(entry_id, provider, model)]
+    semaphore = asyncio.Semaphore(max(1, settings.precompute_concurrency))
+    results = {"candidates": len(work), "generated": 0, "failed": 0, "fresh": len(work) - len(todo)}
+
+    async def run(candidate: Candidate):
+        async with semaphore:
+            try:
+                stored = await asyncio.to_thread(_generate, *candidate)
+            except Exception as e:
+                logger.warning("Precompute of %s failed: %s", request_id(*candidate[:2]), e)
+                stored = False
+            results["generated" if stored else "failed"] += 1
+
+    await asyncio.gather(*(run(candidate) for candidate in todo))
+    return results
+
+class _PassLock:
+    # One pass at a time across replicas (Redis) or within this process.
+    def __init__(self):
+        self.token = uuid.uuid4().hex
+        self.local_busy = False
+
+    def acquire(self) -> bool:
+        if redis_available:
+            return bool(redis_client.set(LOCK_KEY, self.token, nx=True, ex=LOCK_TTL_SECONDS))
+        if self.local_busy:
+            return False
+        self.local_busy = True
+        return True
+
+    def release(self):
+        if redis_available:
+            if redis_client.get(LOCK_KEY) == self.token:
+                redis_client.delete(LOCK_KEY)
+        self.local_busy = False
+
+_pass_lock = _PassLock()
+_last_pass: dict = {}
+_requested_pass: Optional[asyncio.Task] = None
+
+async def run_pass(requests_path: str = None, mine: bool = None, top_n: int = None) -> dict:
+    if not await asyncio.to_thread(_pass_lock.acquire):
+        return {"status": "skipped", "reason": "another precompute pass is running"}
+    started = time.time()
+    try:
+        await asyncio.to_thread(precompute_index.sync)
+        candidates: List[Candidate] = []
+        requests_path = settings.precompute_requests_path if requests_path is None else requests_path
+        if requests_path:
+            candidates += load_requests(requests_path)
+        if settings.precompute_mine_jobs if mine is None else mine:
+            candidates += await mine_requests(top_n or settings.precompute_top_n, settings.precompute_min_requests)
+        results = await refresh(candidates)
+    finally:
+        await asyncio.to_thread(_pass_lock.release)
+    results.update(status="completed", started_at=started, duration_s=round(time.time() - started, 3))
+    _last_pass.clear()
+    _last_pass.update(results)
+    logger.info("Precompute pass: %s", results)
+    return results
+
+def last_pass() -> dict:
+    return dict(_last_pass)
+
+def start_pass() -> bool:
+    # Starts a pass in the background now, whatever the off-peak window; False if one is running.
+    global _requested_pass
+    if _requested_pass is not None and not _requested_pass.done():
+        return False
+    _requested_pass = asyncio.create_task(run_pass())
+    return True
+
+def in_off_peak_window(hour: int = None) -> bool:
+    # PRECOMPUTE_HOURS "start-end" in UTC; the window may wrap midnight.
+    if not settings.precompute_hours.strip():
+        return True
+    start, _, end = settings.precompute_hours.partition("-")
+    start, end = int(start), int(end)
+    hour = time.gmtime().tm_hour if hour is None else hour
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+async def maintain():
+    # Keeps this process's copy of the index current and, with PRECOMPUTE_ENABLED, runs a pass
+    # whenever the off-peak window is open and the previous one is old enough.
+    last_started = 0.0
+    while True:
+        try:
+            await asyncio.to_thread(precompute_index.sync)
+            due = time.time() - last_started >= settings.precompute_interval_seconds
+            if settings.precompute_enabled and due and in_off_peak_window():
+                last_started = time.time()
+                await run_pass()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Precompute maintenance failed: %s", e)
+        await asyncio.sleep(settings.precompute_sync_seconds)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Precompute architectures for popular requests")
+    parser.add_argument("--requests", help="JSON/JSONL file of ArchitectureRequest payloads (default: PRECOMPUTE_REQUESTS_PATH)")
+    parser.add_argument("--no-mine", action="store_true", help="Skip mining job records")
+    parser.add_argument("--top", type=int, help="Mined combinations to keep (default: PRECOMPUTE_TOP_N)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    validate_settings()
+    if not redis_available:
+        logger.warning("Redis is disabled: precomputed entries only live as long as this process.")
+    results = asyncio.run(run_pass(args.requests, mine=False if args.no_mine else None, top_n=args.top))
+    print(json.dumps(results, indent=2))
+    return 0 if results.get("status") == "completed" and not results.get("failed") else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+from backend.config import settings
+from backend.validation import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Compact encoding of every populated ArchitectureRequest field, token counting for the
+# configured model, and a per-model context budget that sizes max_tokens to the request.
+
+PLAN_INSTRUCTION = "Provide a clear and detailed production-ready architecture plan."
+TRUNCATION_NOTE = " [truncated]"
+
+# (label, multiselect/value field, free-text field) in prompt order.
+FIELD_GROUPS: Tuple[Tuple[str, str, Optional[str]], ...] = (
+    ("Core Architecture Pattern", "architecture", "custom_arch"),
+    ("Business Services", "services", "custom_service"),
+    ("Integration", "integration", "custom_integration"),
+    ("Data Storage", "data_storage", "custom_storage"),
+    ("Caching", "caching", None),
+    ("Data Processing", "data_processing", None),
+    ("Security", "security", "custom_security"),
+    ("Compliance", "compliance", None),
+    ("Deployment", "deployment", "custom_deployment"),
+    ("Scaling", "scaling", None),
+    ("Monitoring", "monitoring", None),
+    ("Resilience", "resilience", "custom_resilience"),
+    ("Advanced Features", "advanced_features", "custom_advanced"),
+)
+FREE_TEXT_FIELDS = ("functional_requirement",) + tuple(free for _, _, free in FIELD_GROUPS if free)
+
+# Total context (prompt + completion) by model-name substring; first match wins.
+MODEL_CONTEXT_WINDOWS = (
+    ("gpt-4o", 128000),
+    ("gpt-4-turbo", 128000),
+    ("gpt-4-1106", 128000),
+    ("gpt-4-0125", 128000),
+    ("gpt-4-32k", 32768),
+    ("gpt-4", 8192),
+    ("gpt-3.5-turbo", 16385),
+    ("falcon", 2048),
+    ("mistral", 8192),
+    ("llama-2", 4096),
+    ("flan-t5", 512),
+)
+# Encoder-decoder models budget the input alone; the completion has its own length.
+ENCODER_DECODER_HINTS = ("t5", "bart")
+DEFAULT_CONTEXT_WINDOW = 4096
+
+class PromptBudgetError(ValueError):
+    pass
+
+@dataclass
+class PromptBudget:
+    requirement: str
+    prompt_tokens: int
+    max_tokens: int
+    context_window: int
+    truncated: bool = False
+
+def encode_requirement(mode: str, inputs: dict) -> str:
+    if mode == "functional":
+        return f"FUNCTIONAL REQUIREMENT: {inputs.get('functional_requirement', '')}\n\n{PLAN_INSTRUCTION}"
+    lines = []
+    for label, field, free_field in FIELD_GROUPS:
+        value = inputs.get(field)
+        parts = [", ".join(value) if isinstance(value, (list, tuple)) else value] if value else []
+        if free_field and inputs.get(free_field):
+            parts.append(f"also {inputs[free_field]}")
+        if parts:
+            lines.append(f"{label}: {'; '.join(parts)}")
+    targets = [
+        f"{name} {inputs[field]}{unit}"
+        for name, field, unit in (
+            ("concurrency", "expected_concurrency", ""),
+            ("latency", "latency", "ms"),
+            ("throughput", "throughput", " req/sec"),
+        )
+        if inputs.get(field)
+    ]
+    if targets:
+        lines.append(f"Performance Targets: {', '.join(targets)}")
+    return "\n".join(lines) + f"\n\n{PLAN_INSTRUCTION}"
+
+def desired_completion_tokens(mode: str, inputs: dict) -> int:
+    # Plans grow with the number of decisions requested: a floor for the fixed sections, plus
+    # a share per selected item and per token of free text, clamped to the configured range.
+    items = 0
+    for field, value in inputs.items():
+        if field in FREE_TEXT_FIELDS or field == "provider" or not value:
+            continue
+        items += len(value) if isinstance(value, (list, tuple)) else 1
+    free_text_tokens = sum(len(inputs.get(field) or "") for field in FREE_TEXT_FIELDS) // CHARS_PER_TOKEN
+    desired = 600 + 45 * items + 2 * free_text_tokens
+    return max(settings.min_completion_tokens, min(settings.generation_max_tokens, desired))
+
+def _estimate(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def token_counter(provider: str, model_name: str, tokenizer=None) -> Callable[[str], int]:
+    # Exact counts where the tokenizer is available offline, otherwise the chars/token estimate.
+    if tokenizer is not None:
+        return lambda text: len(tokenizer.encode(text))
+    if provider == "openai":
+        try:
+            import tiktoken
+            encoding = tiktoken.encoding_for_model(model_name)
+            return lambda text: len(encoding.encode(text))
+        except Exception as e:
+            logger.warning("No tiktoken encoding for %s (%s); estimating token counts", model_name, e)
+    return _estimate
+
+def context_window(provider: str, model_name: str) -> Tuple[int, bool]:
+    # (window, shared): shared windows hold prompt and completion together; otherwise the
+    # window bounds the prompt alone.
+    lowered = model_name.lower()
+    shared = not any(hint in lowered for hint in ENCODER_DECODER_HINTS)
+    if settings.model_context_window:
+        return settings.model_context_window, shared
+    if provider == "local":
+        # LocalModelRunner truncates inputs and caps new tokens separately.
+        return settings.local_max_input_tokens, False
+    for name, window in MODEL_CONTEXT_WINDOWS:
+        if name in lowered:
+            return window, shared
+    return DEFAULT_CONTEXT_WINDOW, shared
+
+def fit_prompt(
+    template: str,
+    requirement: str,
+    desired_tokens: int,
+    count_tokens: Callable[[str], int],
+    window: int,
+    shared: bool,
+) -> PromptBudget:
+    overhead = count_tokens(template.replace("{raw_requirement}", ""))
+    completion_floor = settings.min_completion_tokens if shared else 0
+    input_budget = window - overhead - completion_floor
+    if input_budget <= 0:
+        raise PromptBudgetError(
+            f"The {window}-token context window has no room for the requirement after the prompt template "
+            f"and a {completion_floor}-token completion."
+        )
+    truncated = False
+    requirement_tokens = count_tokens(requirement)
+    if requirement_tokens > input_budget:
+        # Keep the head of the encoding (core pattern and the first field groups) that fits.
+        keep = int(len(requirement) * input_budget / requirement_tokens * 0.95)
+        requirement = requirement[:keep].rstrip() + TRUNCATION_NOTE
+        requirement_tokens = count_tokens(requirement)
+        truncated = True
+        logger.warning("Requirement truncated to fit a %d-token context window", window)
+    prompt_tokens = overhead + requirement_tokens
+    max_tokens = min(desired_tokens, window - prompt_tokens) if shared else desired_tokens
+    if max_tokens < min(completion_floor, desired_tokens):
+        raise PromptBudgetError(f"Request does not fit the {window}-token context window.")
+    return PromptBudget(requirement, prompt_tokens, max_tokens, window, truncated)
@@ -1,30 +1,108 @@
+import contextvars
+import hashlib
 import logging
 import re
-from langchain.prompts import PromptTemplate
-from langchain_community.chat_models import ChatOpenAI
-from langchain_community.cache import SQLiteCache
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
 from backend.config import settings
-import langchain
-
-# Use SQLiteCache from langchain_community to cache responses.
-langchain.llm_cache = SQLiteCache(database_path="./.demo_cache.db")
+from backend import deadlines, metrics
+from backend.cache import cache_key, canonicalize_request, prompt_key, result_cache
+from backend.precompute import precompute_index
+from backend.singleflight import single_flight
+from backend.failover import ProviderRouter, failover_configured
+from backend.hedging import AttemptCancelled, LatencyWindow, hedge_stats, run_hedged
+from backend.validation import AttemptAborted, StreamValidator, record_abort, validation_stats
+from backend.prompt_builder import PromptBudget, context_window, desired_completion_tokens, encode_requirement, fit_prompt, token_counter
+from backend.sections import (
+    ALL_SECTIONS, OUTLINE, SECTION_UNAVAILABLE, SECTIONS, Section, affected_sections, is_valid_section, render_section, split_sections
+)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-PROMPT_VERSION = "v2.3-technical-arch"
+PROMPT_VERSION = "v2.4-compact-fields"
 MARKER = "<<<ARCHITECTURE_START>>>"
 
+DEFAULT_OPENAI_MODEL = "gpt-4"
+SUPPORTED_PROVIDERS = ("openai", "huggingface", "local", "fake")
+MAX_ATTEMPTS = 3
+
+# LangChain and the provider SDKs are imported when the first generator is built, not when this
+# module is imported, so API processes start (and answer /healthz) before they are loaded.
+_llm_cache_lock = threading.Lock()
+_llm_cache_ready = False
+
+def _configure_llm_cache():
+    # Use SQLiteCache from langchain_community to cache responses.
+    global _llm_cache_ready
+    with _llm_cache_lock:
+        if _llm_cache_ready:
+            return
+        import langchain
+        from langchain_community.cache import SQLiteCache
+        langchain.llm_cache = SQLiteCache(database_path="./.demo_cache.db")
+        _llm_cache_ready = True
+
+# Section attempts from all concurrent requests share this pool.
+_section_executor = ThreadPoolExecutor(max_workers=settings.section_workers, thread_name_prefix="section")
+
+class MarkerStripper:
+    # Incremental counterpart of the marker handling in _sanitize_output: drops streamed text up
+    # to and including an echoed MARKER. The prompt already ends with MARKER, so most models
+    # never repeat it; text is held back only while it could still be the start of an echo, so
+    # the first visible token is delayed by at most len(MARKER) chars.
+    def __init__(self):
+        self._buffer = ""
+        self._passthrough = False
+        self._after_marker = False  # Whitespace right after an echoed marker is dropped too
+
+    def feed(self, chunk: str) -> str:
+        if self._passthrough:
+            if self._after_marker:
+                chunk = chunk.lstrip()
+                self._after_marker = not chunk
+            return chunk
+        self._buffer += chunk
+        index = self._buffer.find(MARKER)
+        if index != -1:
+            output = self._buffer[index + len(MARKER):].lstrip()
+            self._after_marker = not output
+        elif len(self._buffer) <= len(MARKER) or self._ends_in_partial_marker():
+            return ""
+        else:
+            output = self._buffer
+        self._buffer = ""
+        self._passthrough = True
+        return output
+
+    def _ends_in_partial_marker(self) -> bool:
+        return any(self._buffer.endswith(MARKER[:length]) for length in range(1, len(MARKER)))
+
+    def flush(self) -> str:
+        output, self._buffer = self._buffer, ""
+        return output
+
+def _resolve_model_name(provider: str, model_name: Optional[str] = None) -> str:
+    model_name = model_name or settings.model_name
+    # MODEL_NAME usually points at a HuggingFace repo; OpenAI keeps its GPT default.
+    if provider == "openai" and "gpt" not in model_name.lower():
+        return DEFAULT_OPENAI_MODEL
+    return model_name
+
 class ArchitectureGenerator:
-    def __init__(self, provider: str = None):
+    def __init__(self, provider: str = None, model_name: str = None):
         self.provider = (provider or settings.ai_provider).lower().strip()
         logger.debug("Using provider: %s", self.provider)
-        if self.provider not in ("openai", "huggingface"):
-            raise ValueError("Unsupported provider. Use 'openai' or 'huggingface'.")
+        if self.provider not in SUPPORTED_PROVIDERS:
+            raise ValueError("Unsupported provider. Use 'openai', 'huggingface', 'local' or 'fake'.")
+        self.model_name = _resolve_model_name(self.provider, model_name)
         self.llm = self._init_llm()
+        self.latencies = LatencyWindow()
         logger.debug("ArchitectureGenerator initialized with provider: %s", self.provider)
         # Update prompt template to include a unique marker.
-        if "falcon" in settings.model_name.lower():
+        if "falcon" in self.model_name.lower():
             template = (
                 f"[{PROMPT_VERSION}] Generate a detailed production-ready architecture specification for the following requirement:\n"
                 "{raw_requirement}\n\n"
@@ -38,98 +116,613 @@ class ArchitectureGenerator:
                 f"Your response must start with the marker {MARKER} and then include only the final architecture details (with headings, sub-headings, etc.). Do not include any of the above instructions or prompt text.\n"
                 f"{MARKER}"
             )
+        from langchain.prompts import PromptTemplate
         self.architecture_template = PromptTemplate(
             input_variables=["raw_requirement"],
             template=template
         )
+        tokenizer = None
+        if self.provider == "local":
+            from backend.local_llm import get_local_runner
+            tokenizer = get_local_runner(self.model_name).tokenizer
+        self.count_tokens = token_counter(self.provider, self.model_name, tokenizer)
+        self.context_window, self.shared_context = context_window(self.provider, self.model_name)
+        self.section_template = (
+            f"[{PROMPT_VERSION}] You are writing one section of a production-ready architecture plan for the following requirement:\n"
+            "{raw_requirement}\n\n"
+            f"The plan has these sections: {OUTLINE}.\n"
+            "Write only section {number}, {title}: {focus} "
+            f"Keep it under {settings.section_max_tokens * 3 // 4} words. Your response must start with the marker {MARKER} and then include only the section body, without its heading. Do not include any of the above instructions or prompt text.\n"
+            f"{MARKER}"
+        )
+        self._section_budget_template: Optional[str] = None
+        # Instruction lines a degenerate completion tends to parrot back.
+        self._echo_phrases = [
+            fragment.strip()
+            for line in (template + "\n" + self.section_template).splitlines()
+            if "{" not in line
+            for fragment in line.split(MARKER)
+        ]
 
     def _init_llm(self):
         if self.provider == "huggingface":
             from langchain_community.llms import HuggingFaceHub
             try:
                 return HuggingFaceHub(
-                    repo_id=settings.model_name,  # e.g., "tiiuae/falcon-7b-instruct" or "google/flan-t5-xl"
-                    model_kwargs={"temperature": 0.4, "max_length": 2048},
+                    repo_id=self.model_name,  # e.g., "tiiuae/falcon-7b-instruct" or "google/flan-t5-xl"
+                    model_kwargs={"temperature": 0.4, "max_length": settings.generation_max_tokens},
                     huggingfacehub_api_token=settings.huggingfacehub_api_token
                 )
             except Exception as e:
                 logger.error(f"Model loading failed: {str(e)}")
                 raise ValueError(f"Failed to load model: {str(e)}")
         elif self.provider == "openai":
-            logger.info("Initializing OpenAI Chat model with GPT-4")
+            import httpx
+            from langchain_community.chat_models import ChatOpenAI
+            logger.info("Initializing OpenAI Chat model with %s", self.model_name)
+            # A dedicated keep-alive pool per client so warm generators reuse TLS connections.
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=settings.llm_pool_max_connections,
+                    max_keepalive_connections=settings.llm_pool_max_connections,
+                    keepalive_expiry=settings.llm_pool_keepalive_expiry,
+                ),
+                timeout=settings.provider_request_timeout,
+            )
             return ChatOpenAI(
-                model_name="gpt-4",
+                model_name=self.model_name,
+                http_client=http_client,
                 temperature=0.3,
-                max_retries=3,
-                request_timeout=30,
+                # SDK retries would hide an outage from the breaker and eat the failover budget.
+                max_retries=0 if failover_configured() else 3,
+                request_timeout=settings.provider_request_timeout,
                 openai_api_key=settings.openai_api_key,
-                max_tokens=2048,
+                max_tokens=settings.generation_max_tokens,
                 frequency_penalty=0.7
             )
+        elif self.provider == "local":
+            from backend.local_llm import LocalBatchedLLM, get_local_runner
+            logger.info("Loading local model %s", self.model_name)
+            try:
+                # Loads weights once per worker process; later generators share the runner.
+                get_local_runner(self.model_name).load()
+            except Exception as e:
+                logger.error(f"Model loading failed: {str(e)}")
+                raise ValueError(f"Failed to load model: {str(e)}")
+            return LocalBatchedLLM(
+                model_name=self.model_name,
+                max_new_tokens=min(settings.generation_max_tokens, settings.local_max_new_tokens),
+                temperature=0.4,
+            )
+        elif self.provider == "fake":
+            from backend.fake_llm import FakeStreamingLLM
+            logger.info("Using fake provider (seed %d)", settings.fake_seed)
+            return FakeStreamingLLM(seed=settings.fake_seed)
         else:
-            raise ValueError("Unsupported provider. Use 'openai' or 'huggingface'.")
+            raise ValueError("Unsupported provider. Use 'openai', 'huggingface', 'local' or 'fake'.")
+
+    def check_connectivity(self, timeout: float):
+        # One cheap authenticated call that proves the provider is reachable with our
+        # credentials; raises otherwise. Local and fake models are ready once built.
+        if self.provider == "openai":
+            from openai import OpenAI
+            OpenAI(api_key=settings.openai_api_key, timeout=timeout, max_retries=0).models.retrieve(self.model_name)
+        elif self.provider == "huggingface":
+            from huggingface_hub import model_info
+            model_info(self.model_name, token=settings.huggingfacehub_api_token, timeout=timeout)
 
     def _sanitize_output(self, text: str) -> str:
-        # Remove extraneous artifacts.
-        cleaned = text.replace("--- Begin Detailed Architecture Plan ---", "").replace("Answer:", "")
-        cleaned = re.sub(r'^#+\s*', '', cleaned, flags=re.MULTILINE)
-        cleaned = cleaned.strip()
-        # Extract only the text after the marker.
-        if MARKER in cleaned:
-            parts = cleaned.split(MARKER, 1)
-            return parts[1].strip()
-        return cleaned
+        with metrics.timed("sanitize"):
+            # Remove extraneous artifacts.
+            cleaned = text.replace("--- Begin Detailed Architecture Plan ---", "").replace("Answer:", "")
+            cleaned = re.sub(r'^#+\s*', '', cleaned, flags=re.MULTILINE)
+            cleaned = cleaned.strip()
+            # Extract only the text after the marker.
+            if MARKER in cleaned:
+                parts = cleaned.split(MARKER, 1)
+                return parts[1].strip()
+            return cleaned
 
     def _is_valid_output(self, text: str) -> bool:
-        return (
-            len(text) > 500 and 
-            "scalability" in text.lower() and 
-            "security" in text.lower() and 
-            "technology" in text.lower()
+        with metrics.timed("validate"):
+            return (
+                len(text) > 500 and 
+                "scalability" in text.lower() and 
+                "security" in text.lower() and 
+                "technology" in text.lower() and
+                SECTION_UNAVAILABLE not in text
+            )
+
+    def budget(self, raw_requirement: str, desired_tokens: int, sections: bool = None) -> PromptBudget:
+        # Fits the requirement into this model's context window and sizes max_tokens, against
+        # the prompt that is actually sent: the plan template, or in sections mode the longest
+        # section prompt.
+        if sections is None:
+            sections = settings.generation_mode == "sections"
+        budget = fit_prompt(
+            self._longest_section_template() if sections else self.architecture_template.template,
+            raw_requirement,
+            desired_tokens,
+            self.count_tokens,
+            self.context_window,
+            self.shared_context,
         )
+        metrics.record_max_tokens(budget.max_tokens)
+        return budget
 
-    def _generate(self, raw_requirement: str) -> str:
+    def _longest_section_template(self) -> str:
+        # Section prompts differ only in number, title and focus; keep {raw_requirement} open.
+        if self._section_budget_template is None:
+            self._section_budget_template = max(
+                (
+                    self.section_template.format(raw_requirement="{raw_requirement}", number=number, title=section.title, focus=section.focus)
+                    for number, section in enumerate(SECTIONS, start=1)
+                ),
+                key=self.count_tokens,
+            )
+        return self._section_budget_template
+
+    def _limits(self, max_tokens: Optional[int]) -> dict:
+        # Per-call completion limit under the provider's parameter name, plus (OpenAI) a request
+        # timeout that never outlives the request's budget.
+        limits = {}
+        budget = deadlines.current()
+        if self.provider == "openai" and budget.deadline is not None:
+            limits["timeout"] = budget.timeout(settings.provider_request_timeout)
+        if not max_tokens or self.provider == "fake":
+            return limits
+        name = {"openai": "max_tokens", "huggingface": "max_length", "local": "max_new_tokens"}[self.provider]
+        limits[name] = max_tokens
+        return limits
+
+    def _generate(self, raw_requirement: str, max_tokens: int = None) -> str:
         from langchain.schema import HumanMessage
         prompt_text = self.architecture_template.format(raw_requirement=raw_requirement)
-        result = self.llm.predict_messages([HumanMessage(content=prompt_text)]).content
+        deadlines.current().check()
+        try:
+            with metrics.timed("provider_total"):
+                result = self.llm.predict_messages([HumanMessage(content=prompt_text)], **self._limits(max_tokens)).content
+        except Exception as e:
+            metrics.record_provider_error(self.provider, e)
+            raise
+        metrics.record_tokens(self.count_tokens(prompt_text), self.count_tokens(result))
         return result.strip()
 
-    def generate_architecture(self, raw_requirement: str) -> str:
+    def _stream_chunks(self, prompt_text: str, max_tokens: int = None) -> Iterator[str]:
+        from langchain.schema import HumanMessage
+        if self.provider == "local":
+            # Batched local generation completes as a whole; it arrives as one chunk.
+            yield self.llm.invoke(prompt_text, **self._limits(max_tokens))
+            return
+        if self.provider == "fake":
+            yield from self.llm.stream(prompt_text)
+            return
+        if self.provider == "huggingface":
+            if self.llm.task != "text-generation":
+                # Only text-generation endpoints stream; other tasks return in one chunk.
+                yield self.llm.invoke(prompt_text, **self._limits(max_tokens))
+                return
+            model_kwargs = dict(self.llm.model_kwargs or {})
+            yield from self.llm.client.text_generation(
+                prompt_text,
+                stream=True,
+                max_new_tokens=max_tokens or model_kwargs.get("max_length", settings.generation_max_tokens),
+                temperature=model_kwargs.get("temperature"),
+            )
+            return
+        for chunk in self.llm.stream([HumanMessage(content=prompt_text)], **self._limits(max_tokens)):
+            yield chunk.content
+
+    def _stream(
+        self,
+        raw_requirement: str,
+        on_token: Callable[[str], None] = None,
+        cancel: threading.Event = None,
+        prompt_text: str = None,
+        max_tokens: int = None,
+    ) -> str:
+        if prompt_text is None:
+            prompt_text = self.architecture_template.format(raw_requirement=raw_requirement)
+        stripper = MarkerStripper()
+        validator = None
+        if settings.stream_validation:
+            validator = StreamValidator(MARKER, self._echo_phrases, max_tokens)
+        parts = []
+        budget = deadlines.current()
+        budget.check()
+        chunks = self._stream_chunks(prompt_text, max_tokens)
+        started = time.perf_counter()
+        try:
+            for chunk in chunks:
+                if cancel is not None and cancel.is_set():
+                    raise AttemptCancelled()
+                budget.check()
+                if not chunk:
+                    continue
+                if not parts:
+                    metrics.observe("provider_ttft", time.perf_counter() - started)
+                if validator is not None:
+                    validator.feed(chunk)
+                parts.append(chunk)
+                visible = stripper.feed(chunk)
+                if visible and on_token:
+                    on_token(visible)
+        except (AttemptAborted, AttemptCancelled, deadlines.GenerationStopped):
+            raise
+        except Exception as e:
+            metrics.record_provider_error(self.provider, e)
+            raise
+        finally:
+            # Closing the generator closes the provider's HTTP stream.
+            chunks.close()
+            metrics.observe("provider_total", time.perf_counter() - started)
+            # Aborted and cancelled attempts are billed for what they produced, too.
+            metrics.record_tokens(self.count_tokens(prompt_text), self.count_tokens("".join(parts)))
+        remainder = stripper.flush()
+        if remainder and on_token:
+            on_token(remainder)
+        return "".join(parts).strip()
+
+    def _hedged_attempt(self, raw_requirement: str, max_tokens: int = None):
+        def attempt(on_token: Optional[Callable[[str], None]], cancel: threading.Event) -> str:
+            try:
+                return self._sanitize_output(self._stream(raw_requirement, on_token, cancel, max_tokens=max_tokens))
+            except AttemptAborted as e:
+                record_abort(e, "hedged attempt")
+                # Hand back the partial text; it fails validation and gets replaced.
+                return self._sanitize_output(e.partial)
+        return attempt
+
+    def generate_architecture(
+        self,
+        raw_requirement: str,
+        on_token: Callable[[str], None] = None,
+        on_reset: Callable[[], None] = None,
+        max_tokens: int = None,
+    ) -> str:
         logger.info("Generating architecture details...")
-        for attempt in range(3):
-            result = self._generate(raw_requirement)
-            sanitized = self._sanitize_output(result)
-            if self._is_valid_output(sanitized):
-                logger.info("Valid output generated on attempt %d", attempt + 1)
-                return sanitized
-            else:
-                logger.warning("Output not valid on attempt %d; retrying...", attempt + 1)
-                logger.debug("Attempt %d output: %s", attempt + 1, sanitized)
-        logger.error("Failed to generate valid output after 3 attempts")
+        if settings.generation_mode == "sections":
+            return self.generate_sections(raw_requirement, on_token=on_token, max_tokens=max_tokens)
+        if settings.hedge_mode in ("parallel", "delayed"):
+            return run_hedged(
+                self._hedged_attempt(raw_requirement, max_tokens),
+                self._is_valid_output,
+                self.latencies,
+                MAX_ATTEMPTS,
+                on_token=on_token,
+                on_reset=on_reset,
+            )
+        attempts = 0
+        budget = deadlines.current()
+        attempt_seconds = 0.0
+        try:
+            for attempt in range(MAX_ATTEMPTS):
+                if attempt and not budget.fits(attempt_seconds):
+                    # Another attempt would outlive the request; settle for what we have.
+                    logger.warning("Remaining budget cannot fit attempt %d; stopping retries", attempt + 1)
+                    break
+                attempts += 1
+                started = time.perf_counter()
+                if attempt and on_token and on_reset:
+                    on_reset()  # Streamed text from the rejected attempt is discarded.
+                try:
+                    if on_token or settings.stream_validation:
+                        # Streaming lets the validator stop a doomed attempt mid-generation.
+                        result = self._stream(raw_requirement, on_token, max_tokens=max_tokens)
+                    else:
+                        result = self._generate(raw_requirement, max_tokens)
+                except AttemptAborted as e:
+                    record_abort(e, f"attempt {attempt + 1}")
+                    sanitized = self._sanitize_output(e.partial)
+                    continue
+                finally:
+                    attempt_seconds = time.perf_counter() - started
+                sanitized = self._sanitize_output(result)
+                if self._is_valid_output(sanitized):
+                    logger.info("Valid output generated on attempt %d", attempt + 1)
+                    return sanitized
+                else:
+                    logger.warning("Output not valid on attempt %d (%d chars); retrying...", attempt + 1, len(sanitized))
+        finally:
+            metrics.record_attempts(attempts)
+        logger.error("Failed to generate valid output after %d attempts", attempts)
         return sanitized
 
-def generate_architecture_details(prompt: str, provider: str = None) -> str:
-    generator = ArchitectureGenerator(provider=provider)
-    return generator.generate_architecture(prompt)
-
-def generate_prompt(mode: str, inputs: dict) -> str:
-    if mode == "functional":
-        raw_requirement = (
-            f"FUNCTIONAL REQUIREMENT: {inputs.get('functional_requirement', '')}\n\n"
-            "Provide a clear and detailed production-ready architecture plan."
+    def _generate_section(self, raw_requirement: str, number: int, section: Section, max_tokens: int) -> Optional[str]:
+        # Retries only this section; returns None if no attempt validated.
+        prompt_text = self.section_template.format(
+            raw_requirement=raw_requirement, number=number, title=section.title, focus=section.focus
         )
+        attempts = 0
+        budget = deadlines.current()
+        attempt_seconds = 0.0
+        try:
+            for attempt in range(MAX_ATTEMPTS):
+                if attempt and not budget.fits(attempt_seconds):
+                    logger.warning("Remaining budget cannot fit section %s attempt %d", section.key, attempt + 1)
+                    break
+                attempts += 1
+                started = time.perf_counter()
+                try:
+                    output = self._stream(raw_requirement, prompt_text=prompt_text, max_tokens=max_tokens)
+                except AttemptAborted as e:
+                    record_abort(e, f"{section.key} section attempt {attempt + 1}")
+                    continue
+                finally:
+                    attempt_seconds = time.perf_counter() - started
+                sanitized = self._sanitize_output(output)
+                if is_valid_section(section, sanitized):
+                    return sanitized
+                logger.warning("Section %s not valid on attempt %d (%d chars); retrying...", section.key, attempt + 1, len(sanitized))
+        finally:
+            metrics.record_attempts(attempts)
+        logger.error("Failed to generate section %s after %d attempts", section.key, attempts)
+        return None
+
+    def generate_sections(
+        self,
+        raw_requirement: str,
+        on_token: Callable[[str], None] = None,
+        reuse: Dict[str, str] = None,
+        max_tokens: int = None,
+    ) -> str:
+        # All sections run concurrently, so latency tracks the slowest section rather than the
+        # sum. Sections are merged (and streamed to on_token) in plan order as they complete.
+        # Bodies in `reuse` are merged verbatim instead of being generated.
+        section_tokens = min(settings.section_max_tokens, max_tokens or settings.section_max_tokens)
+        futures = []
+        for number, section in enumerate(SECTIONS, start=1):
+            if reuse and section.key in reuse:
+                future = Future()
+                future.set_result(reuse[section.key])
+            else:
+                future = _section_executor.submit(
+                    contextvars.copy_context().run, self._generate_section, raw_requirement, number, section, section_tokens
+                )
+            futures.append(future)
+        parts = []
+        try:
+            for number, (section, future) in enumerate(zip(SECTIONS, futures), start=1):
+                part = render_section(number, section, future.result())
+                if on_token:
+                    on_token(part + "\n\n" if number < len(SECTIONS) else part)
+                parts.append(part)
+        finally:
+            for future in futures:
+                future.cancel()
+        return "\n\n".join(parts)
+
+# Process-wide generator registry keyed by (provider, model_name). Generators hold no
+# per-request state, so a single instance is shared across asyncio.to_thread workers.
+_generators: Dict[Tuple[str, str], ArchitectureGenerator] = {}
+_generators_lock = threading.Lock()
+_init_locks: Dict[Tuple[str, str], threading.Lock] = {}  # Different targets build concurrently
+_registry_stats = {"created": 0, "reused": 0, "init_seconds": 0.0}
+
+def get_generator(provider: str = None, model_name: str = None) -> ArchitectureGenerator:
+    provider = (provider or settings.ai_provider).lower().strip()
+    key = (provider, _resolve_model_name(provider, model_name))
+    generator = _generators.get(key)
+    if generator is None:
+        with _generators_lock:
+            init_lock = _init_locks.setdefault(key, threading.Lock())
+        with init_lock:
+            generator = _generators.get(key)
+            if generator is None:
+                started = time.perf_counter()
+                _configure_llm_cache()
+                generator = ArchitectureGenerator(provider=key[0], model_name=key[1])
+                elapsed = time.perf_counter() - started
+                metrics.observe("generator_init", elapsed)
+                with _generators_lock:
+                    _generators[key] = generator
+                    _registry_stats["created"] += 1
+                    _registry_stats["init_seconds"] += elapsed
+                logger.info("Initialized generator %s/%s in %.1f ms", key[0], key[1], elapsed * 1000)
+                return generator
+    with _generators_lock:
+        _registry_stats["reused"] += 1
+    return generator
+
+# Breakers and failover across the PROVIDER_ORDER targets (see backend/failover.py).
+provider_router = ProviderRouter(get_generator, _resolve_model_name)
+
+def primary_target() -> Tuple[str, str]:
+    # Results are cached and coalesced under the first configured target, whichever target
+    # ends up serving them.
+    return provider_router.targets()[0]
+
+def _run_generation(
+    call: Callable[[ArchitectureGenerator], str],
+    provider: str = None,
+    model_name: str = None,
+    on_reset: Callable[[], None] = None,
+) -> Tuple[str, ArchitectureGenerator]:
+    # An explicit provider pins the call; otherwise it goes through the failover router.
+    if provider:
+        generator = get_generator(provider=provider, model_name=model_name)
+        return call(generator), generator
+    return provider_router.run(call, on_reset=on_reset)
+
+def warm_generators(
+    targets: Iterable[Tuple[str, Optional[str]]] = None,
+    check: bool = False,
+    timeout: float = None,
+) -> Dict[str, Optional[str]]:
+    # Builds (and with check=True, pings) every target concurrently. Returns the error per
+    # "provider/model", None for targets that are ready; targets still going after `timeout`
+    # are reported as timed out and finish in the background.
+    targets = list(targets or provider_router.targets())
+
+    def warm(provider: str, model_name: Optional[str]):
+        generator = get_generator(provider, model_name)
+        if check:
+            generator.check_connectivity(timeout or settings.startup_timeout_seconds)
+
+    names = [f"{provider}/{_resolve_model_name(provider, model_name)}" for provider, model_name in targets]
+    executor = ThreadPoolExecutor(max_workers=max(1, len(targets)), thread_name_prefix="warm")
+    futures = [executor.submit(warm, provider, model_name) for provider, model_name in targets]
+    executor.shutdown(wait=False)
+    wait(futures, timeout=timeout)
+    results: Dict[str, Optional[str]] = {}
+    for name, future in zip(names, futures):
+        if not future.done():
+            results[name] = f"not ready after {timeout}s"
+        elif future.exception() is not None:
+            results[name] = f"{type(future.exception()).__name__}: {future.exception()}"
+        else:
+            results[name] = None
+        if results[name]:
+            logger.warning("Failed to warm generator %s: %s", name, results[name])
+    return results
+
+def registry_stats() -> dict:
+    with _generators_lock:
+        stats = dict(_registry_stats)
+        stats["generators"] = [f"{provider}/{model}" for provider, model in _generators]
+    avg_init = stats["init_seconds"] / stats["created"] if stats["created"] else 0.0
+    stats["avg_init_ms"] = round(avg_init * 1000, 3)
+    # Every reuse skips one client/template construction.
+    stats["setup_ms_saved"] = round(avg_init * stats["reused"] * 1000, 3)
+    stats["init_seconds"] = round(stats["init_seconds"], 6)
+    stats["hedging"] = hedge_stats()
+    stats["validation"] = validation_stats()
+    stats["providers"] = provider_router.health()
+    return stats
+
+def generate_architecture_details(
+    prompt: str,
+    provider: str = None,
+    model_name: str = None,
+    on_token: Callable[[str], None] = None,
+    on_reset: Callable[[], None] = None,
+) -> str:
+    if provider:
+        provider = provider.lower().strip()
+        key = prompt_key(prompt, provider, _resolve_model_name(provider, model_name), PROMPT_VERSION)
     else:
-        raw_requirement = (
-            f"Core Architecture Pattern: {inputs.get('architecture', '')}\n"
-            f"Business Services: {', '.join(inputs.get('services', []))}\n"
-            f"Integration Strategy: {', '.join(inputs.get('integration', []))}\n"
-            f"Data Storage: {', '.join(inputs.get('data_storage', []))}\n"
-            f"Security Measures: {', '.join(inputs.get('security', []))}\n"
-            f"Deployment Environment: {inputs.get('deployment', '')}\n"
-            f"Scaling Strategies: {', '.join(inputs.get('scaling', []))}\n"
-            f"Performance Targets: Expected Concurrency: {inputs.get('expected_concurrency', 'N/A')}, "
-            f"Latency: {inputs.get('latency', 'N/A')}ms, Throughput: {inputs.get('throughput', 'N/A')} req/sec\n"
-            f"Advanced Features: {', '.join(inputs.get('advanced_features', []))}\n\n"
-            "Provide a clear and detailed production-ready architecture plan."
+        key = prompt_key(prompt, *primary_target(), PROMPT_VERSION)
+
+    def attempt(generator: ArchitectureGenerator) -> str:
+        with metrics.timed("prompt_build"):
+            budget = generator.budget(prompt, desired_completion_tokens("functional", {"functional_requirement": prompt}))
+        return generator.generate_architecture(
+            budget.requirement, on_token=on_token, on_reset=on_reset, max_tokens=budget.max_tokens
         )
-    return generate_architecture_details(raw_requirement, provider=settings.ai_provider)
+
+    def generate() -> str:
+        return _run_generation(attempt, provider, model_name, on_reset)[0]
+
+    # Identical in-flight prompts share one provider call; only the leader streams tokens.
+    return single_flight.do(key, generate)
+
+def build_requirement(mode: str, inputs: dict) -> str:
+    # Every populated field, compactly encoded (see backend/prompt_builder.py).
+    return encode_requirement(mode, inputs)
+
+def request_key(mode: str, inputs: dict) -> str:
+    # Cache/coalescing key of a request under the primary provider and model.
+    canonical = canonicalize_request(mode, inputs)
+    return cache_key(mode, canonical, *primary_target(), PROMPT_VERSION)
+
+def cached_architecture(mode: str, inputs: dict) -> Optional[str]:
+    # The precomputed or cached result generate_prompt would serve without a provider call.
+    canonical = canonicalize_request(mode, inputs)
+    target = primary_target()
+    precomputed = precompute_index.lookup(mode, canonical, PROMPT_VERSION, *target)
+    if precomputed is not None:
+        return precomputed
+    return result_cache.get(cache_key(mode, canonical, *target, PROMPT_VERSION))
+
+def generate_prompt(
+    mode: str,
+    inputs: dict,
+    on_token: Callable[[str], None] = None,
+    on_reset: Callable[[], None] = None,
+) -> str:
+    canonical = canonicalize_request(mode, inputs)
+    target = primary_target()
+    # Popular combinations generated off-peak by backend/precompute_job.py: a dict lookup.
+    precomputed = precompute_index.lookup(mode, canonical, PROMPT_VERSION, *target)
+    if precomputed is not None:
+        return precomputed
+    key = cache_key(mode, canonical, *target, PROMPT_VERSION)
+    cached = result_cache.get(key)
+    metrics.record_cache(cached is not None)
+    if cached is not None:
+        logger.info("Serving architecture from cache.")
+        return cached
+
+    def generate() -> str:
+        # A previous leader may have filled the cache while this call was waiting.
+        cached = result_cache.get(key)
+        if cached is not None:
+            return cached
+        def attempt(generator: ArchitectureGenerator) -> str:
+            with metrics.timed("prompt_build"):
+                budget = generator.budget(build_requirement(mode, canonical), desired_completion_tokens(mode, canonical))
+            return generator.generate_architecture(
+                budget.requirement, on_token=on_token, on_reset=on_reset, max_tokens=budget.max_tokens
+            )
+
+        result, generator = _run_generation(attempt, on_reset=on_reset)
+        # Never pin an output that failed validation.
+        if generator._is_valid_output(result):
+            result_cache.set(key, result)
+        return result
+
+    return single_flight.do(key, generate)
+
+def revise_prompt(
+    mode: str,
+    inputs: dict,
+    base_mode: str,
+    base_inputs: dict,
+    base_architecture: str,
+    on_token: Callable[[str], None] = None,
+) -> dict:
+    # Regenerates only the sections of base_architecture that the edited fields affect and
+    # reuses the rest verbatim. A base that is not a sectioned plan is regenerated in full.
+    plan = revision_plan(mode, inputs, base_mode, base_inputs, base_architecture)
+    canonical = canonicalize_request(mode, inputs)
+    key = cache_key(mode, canonical, *primary_target(), PROMPT_VERSION)
+    base_sections = split_sections(base_architecture) or {}
+    reuse = {section: base_sections[section] for section in plan["reused"]}
+
+    def attempt(generator: ArchitectureGenerator) -> str:
+        with metrics.timed("prompt_build"):
+            budget = generator.budget(build_requirement(mode, canonical), desired_completion_tokens(mode, canonical), sections=True)
+        return generator.generate_sections(budget.requirement, on_token=on_token, reuse=reuse, max_tokens=budget.max_tokens)
+
+    def generate() -> str:
+        result, generator = _run_generation(attempt)
+        if generator._is_valid_output(result):
+            result_cache.set(key, result)
+        return result
+
+    if plan["regenerated"]:
+        # Reused sections come from the base, so only revisions of the same base may coalesce.
+        base_digest = hashlib.sha256(base_architecture.encode()).hexdigest()[:16]
+        architecture = single_flight.do(f"{key}:revise:{base_digest}:{','.join(plan['regenerated'])}", generate)
+    else:
+        logger.info("Revision changes no sections; reusing the base plan.")
+        architecture = base_architecture
+    return {"architecture": architecture, **plan}
+
+def revision_plan(mode: str, inputs: dict, base_mode: str, base_inputs: dict, base_architecture: str) -> dict:
+    canonical = canonicalize_request(mode, inputs)
+    base_canonical = canonicalize_request(base_mode, base_inputs)
+    changed = sorted(
+        field for field in set(canonical) | set(base_canonical) if canonical.get(field) != base_canonical.get(field)
+    )
+    base_sections = split_sections(base_architecture)
+    if base_sections is None or mode != base_mode:
+        regenerated = list(ALL_SECTIONS)
+    else:
+        stale = [key for key, body in base_sections.items() if SECTION_UNAVAILABLE in body]
+        regenerated = [key for key in ALL_SECTIONS if key in affected_sections(changed) or key in stale]
+    return {
+        "changed_fields": changed,
+        "regenerated": regenerated,
+        "reused": [key for key in ALL_SECTIONS if key not in regenerated],
+    }
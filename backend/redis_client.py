@@ -0,0 +1,42 @@
+import logging
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Shared Redis clients; callers fall back to in-memory stores when Redis is disabled. Creating
+# the pools does no I/O: connectivity is verified by the app lifespan and /readyz (ping_redis).
+try:
+    if not settings.redis_enabled:
+        raise RuntimeError("disabled by REDIS_ENABLED=false")
+    import redis
+    import redis.asyncio as aioredis
+    # Worker threads use the blocking client; async endpoints must only use the asyncio pool.
+    redis_client = redis.Redis(
+        connection_pool=redis.ConnectionPool(
+            host=settings.redis_host,
+            port=settings.redis_port,
+            max_connections=settings.redis_max_connections,
+            socket_connect_timeout=settings.redis_connect_timeout,
+            decode_responses=True,
+        )
+    )
+    async_redis_pool = aioredis.ConnectionPool(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        max_connections=settings.redis_max_connections,
+        socket_connect_timeout=settings.redis_connect_timeout,
+        decode_responses=True,
+    )
+    async_redis_client = aioredis.Redis(connection_pool=async_redis_pool)
+    redis_available = True
+except Exception as e:
+    logger.warning("Redis not available, using in-memory stores. Error: %s", e)
+    redis_client = None
+    async_redis_pool = None
+    async_redis_client = None
+    redis_available = False
+
+async def ping_redis() -> None:
+    # Raises when Redis is configured but unreachable; a no-op for the in-memory stores.
+    if redis_available:
+        await async_redis_client.ping()
@@ -0,0 +1,336 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+from backend import metrics
+from backend.config import settings
+from backend.models import JobPriority
+from backend.redis_client import async_redis_client, redis_available
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+QUEUE_KEY = "archigenie:queue"
+PAYLOADS_KEY = "archigenie:queue:payloads"
+PROCESSING_KEY = "archigenie:queue:processing"  # Claimed job id -> visibility deadline (epoch s)
+DELIVERIES_KEY = "archigenie:queue:deliveries"  # Claimed job id -> times claimed
+WAKEUP_KEY = "archigenie:queue:wakeup"  # One entry per enqueue, so idle workers block instead of polling
+CLAIM_WAIT_SECONDS = 1  # Longest an idle worker waits before looking at the queue again
+# Lanes are served strictly in this order.
+LANES = (JobPriority.HIGH, JobPriority.NORMAL, JobPriority.LOW)
+
+JobHandler = Callable[..., Awaitable[None]]
+AbandonedHandler = Callable[[str], Awaitable[None]]
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Generation queue is full")
+        self.retry_after = retry_after
+
+class JobScheduler:
+    # Fixed pool of generation workers fed from a bounded, prioritized in-process queue.
+    def __init__(self, handler: JobHandler, workers: int, max_pending: int):
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.running = 0
+        self.avg_job_seconds = 30.0  # EWMA seed until real jobs have completed
+        self._tasks: List[asyncio.Task] = []
+        self._lanes: Dict[JobPriority, deque] = {lane: deque() for lane in LANES}
+        self._available: Optional[asyncio.Condition] = None
+
+    async def start(self):
+        self._available = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker(index)) for index in range(self.workers)]
+        logger.info("Started %d generation workers", self.workers)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def retry_after(self, pending: int) -> int:
+        # Rough time until a slot frees up: queued work spread across the worker pool.
+        return max(1, math.ceil(self.avg_job_seconds * (pending / max(self.workers, 1))))
+
+    async def pending_count(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    async def submit(self, job_id: str, payload: dict, priority: JobPriority = JobPriority.NORMAL) -> int:
+        pending = await self.pending_count()
+        if pending >= self.max_pending:
+            raise QueueFullError(self.retry_after(pending))
+        async with self._available:
+            self._lanes[priority].append((job_id, payload))
+            self._available.notify()
+        return await self.position(job_id)
+
+    async def position(self, job_id: str) -> Optional[int]:
+        # 1-based position across lanes; None once a worker has picked the job up.
+        offset = 0
+        for lane in LANES:
+            for index, (queued_id, _) in enumerate(self._lanes[lane]):
+                if queued_id == job_id:
+                    return offset + index + 1
+            offset += len(self._lanes[lane])
+        return None
+
+    async def cancel(self, job_id: str) -> bool:
+        # Drops a queued job; False if no worker queue holds it (already picked up or gone).
+        for lane in LANES:
+            for entry in self._lanes[lane]:
+                if entry[0] == job_id:
+                    self._lanes[lane].remove(entry)
+                    return True
+        return False
+
+    async def _next(self):
+        async with self._available:
+            await self._available.wait_for(lambda: any(self._lanes.values()))
+            for lane in LANES:
+                if self._lanes[lane]:
+                    return self._lanes[lane].popleft()
+
+    async def _worker(self, index: int):
+        while True:
+            job_id, payload = await self._next()
+            await self._run(job_id, payload)
+
+    async def _run(self, job_id: str, payload: dict):
+        self.running += 1
+        started = time.perf_counter()
+        try:
+            await self.handler(job_id, **payload)
+        except Exception:
+            logger.exception("Worker failed to process job %s", job_id)
+        finally:
+            self.running -= 1
+            elapsed = time.perf_counter() - started
+            self.avg_job_seconds = 0.8 * self.avg_job_seconds + 0.2 * elapsed
+
+    async def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "workers": self.workers,
+            "running": self.running,
+            "pending": await self.pending_count(),
+            "max_pending": self.max_pending,
+            "avg_job_seconds": round(self.avg_job_seconds, 3),
+        }
+
+# Atomically enforces the queue bound while enqueueing.
+_ENQUEUE_SCRIPT = """
+if redis.call('zcard', KEYS[1]) >= tonumber(ARGV[1]) then
+    return -1
+end
+redis.call('hset', KEYS[2], ARGV[2], ARGV[4])
+redis.call('zadd', KEYS[1], ARGV[3], ARGV[2])
+redis.call('rpush', KEYS[3], '1')
+redis.call('ltrim', KEYS[3], -tonumber(ARGV[1]), -1)
+return redis.call('zrank', KEYS[1], ARGV[2])
+"""
+
+# Moves the next queued job to the processing set until ARGV[1], in one step, so a worker
+# dying right after the pop cannot lose it. The payload stays until the job is acked.
+_CLAIM_SCRIPT = """
+local popped = redis.call('zpopmin', KEYS[1])
+if #popped == 0 then
+    return false
+end
+local job_id = popped[1]
+local payload = redis.call('hget', KEYS[3], job_id)
+if not payload then
+    return {job_id}
+end
+redis.call('zadd', KEYS[2], ARGV[1], job_id)
+redis.call('hincrby', KEYS[4], job_id, 1)
+return {job_id, payload}
+"""
+
+# Claimed jobs past their visibility deadline (ARGV[1]) go back to the head of the queue,
+# unless they have been claimed ARGV[2] times already or were cancelled meanwhile: those are
+# returned as abandoned.
+_REAP_SCRIPT = """
+local requeued, abandoned = {}, {}
+for _, job_id in ipairs(redis.call('zrangebyscore', KEYS[2], '-inf', ARGV[1])) do
+    redis.call('zrem', KEYS[2], job_id)
+    local deliveries = tonumber(redis.call('hget', KEYS[4], job_id) or '0')
+    if deliveries >= tonumber(ARGV[2]) or redis.call('hexists', KEYS[3], job_id) == 0 then
+        redis.call('hdel', KEYS[3], job_id)
+        redis.call('hdel', KEYS[4], job_id)
+        abandoned[#abandoned + 1] = job_id
+    else
+        redis.call('zadd', KEYS[1], 0, job_id)
+        redis.call('rpush', KEYS[5], '1')
+        requeued[#requeued + 1] = job_id
+    end
+end
+return {requeued, abandoned}
+"""
+
+class RedisJobScheduler(JobScheduler):
+    # Same contract backed by a Redis sorted set, so workers can run in separate processes
+    # (python -m backend.worker) and API latency stays independent of generation load.
+    # Delivery is at least once: a claimed job sits in PROCESSING_KEY while its worker renews
+    # the job's visibility deadline, and is acked when the handler returns. If the worker dies,
+    # the deadline lapses and a reaper in any worker process re-enqueues the job; after
+    # job_max_deliveries claims it is handed to on_abandoned (which fails it) instead.
+    def __init__(
+        self,
+        handler: JobHandler,
+        workers: int,
+        max_pending: int,
+        run_workers: bool = True,
+        on_abandoned: AbandonedHandler = None,
+    ):
+        super().__init__(handler, workers, max_pending)
+        self.run_workers = run_workers
+        self.on_abandoned = on_abandoned
+        self.client = async_redis_client
+
+    async def start(self):
+        if self.run_workers:
+            self._tasks = [asyncio.create_task(self._worker(index)) for index in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._reaper()))
+            logger.info("Started %d Redis-backed generation workers", self.workers)
+
+    @staticmethod
+    def _score(priority: JobPriority) -> float:
+        # Lane first, then FIFO by enqueue time in ms (fits below 1e13 for centuries).
+        return LANES.index(priority) * 1e13 + time.time() * 1000
+
+    async def pending_count(self) -> int:
+        return await self.client.zcard(QUEUE_KEY)
+
+    async def submit(self, job_id: str, payload: dict, priority: JobPriority = JobPriority.NORMAL) -> int:
+        rank = await self.client.eval(
+            _ENQUEUE_SCRIPT, 3, QUEUE_KEY, PAYLOADS_KEY, WAKEUP_KEY,
+            self.max_pending, job_id, self._score(priority), json.dumps(payload),
+        )
+        if rank < 0:
+            raise QueueFullError(self.retry_after(self.max_pending))
+        return rank + 1
+
+    async def position(self, job_id: str) -> Optional[int]:
+        rank = await self.client.zrank(QUEUE_KEY, job_id)
+        return None if rank is None else rank + 1
+
+    async def cancel(self, job_id: str) -> bool:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zrem(QUEUE_KEY, job_id)
+            pipe.hdel(PAYLOADS_KEY, job_id)
+            removed, _ = await pipe.execute()
+        return bool(removed)
+
+    async def claim(self) -> Optional[tuple]:
+        # The next queued (job id, payload), now in the processing set; None when the queue is empty.
+        while True:
+            claimed = await self.client.eval(
+                _CLAIM_SCRIPT, 4, QUEUE_KEY, PROCESSING_KEY, PAYLOADS_KEY, DELIVERIES_KEY,
+                time.time() + settings.job_visibility_seconds,
+            )
+            if not claimed:
+                return None
+            if len(claimed) == 1:
+                logger.warning("Dropping queued job %s without payload", claimed[0])
+                continue
+            return claimed[0], json.loads(claimed[1])
+
+    async def ack(self, job_id: str):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zrem(PROCESSING_KEY, job_id)
+            pipe.hdel(PAYLOADS_KEY, job_id)
+            pipe.hdel(DELIVERIES_KEY, job_id)
+            await pipe.execute()
+
+    async def release(self, job_id: str):
+        # Hands a claimed job straight back to the queue (e.g. on shutdown) instead of letting
+        # its visibility deadline run out.
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zrem(PROCESSING_KEY, job_id)
+            pipe.zadd(QUEUE_KEY, {job_id: 0})
+            pipe.hincrby(DELIVERIES_KEY, job_id, -1)
+            pipe.rpush(WAKEUP_KEY, "1")
+            await pipe.execute()
+
+    async def reap(self, now: float = None) -> Dict[str, List[str]]:
+        requeued, abandoned = await self.client.eval(
+            _REAP_SCRIPT, 5, QUEUE_KEY, PROCESSING_KEY, PAYLOADS_KEY, DELIVERIES_KEY, WAKEUP_KEY,
+            now or time.time(), max(1, settings.job_max_deliveries),
+        )
+        if requeued:
+            logger.warning("Re-enqueued jobs whose worker stopped renewing them: %s", requeued)
+            metrics.JOBS_REDELIVERED.labels("requeued").inc(len(requeued))
+        for job_id in abandoned:
+            logger.error("Abandoning job %s after %d deliveries", job_id, settings.job_max_deliveries)
+            metrics.JOBS_REDELIVERED.labels("abandoned").inc()
+            if self.on_abandoned is not None:
+                await self.on_abandoned(job_id)
+        return {"requeued": requeued, "abandoned": abandoned}
+
+    async def _reaper(self):
+        # Runs once at startup, which recovers the jobs of workers that died before it, then
+        # at half the visibility timeout.
+        while True:
+            try:
+                await self.reap()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Queue reaper failed: %s", e)
+            await asyncio.sleep(max(1, settings.job_visibility_seconds / 2))
+
+    async def _next(self):
+        while True:
+            claimed = await self.claim()
+            if claimed is not None:
+                return claimed
+            await self.client.blpop(WAKEUP_KEY, timeout=CLAIM_WAIT_SECONDS)
+
+    async def _run(self, job_id: str, payload: dict):
+        heartbeat = asyncio.create_task(self._renew(job_id))
+        try:
+            await super()._run(job_id, payload)
+        except asyncio.CancelledError:
+            await asyncio.shield(self.release(job_id))
+            raise
+        else:
+            try:
+                await self.ack(job_id)
+            except Exception as e:
+                logger.warning("Could not ack job %s, it may run again: %s", job_id, e)
+        finally:
+            heartbeat.cancel()
+
+    async def _renew(self, job_id: str):
+        # Keeps the claim visible to this worker while the handler runs.
+        while True:
+            await asyncio.sleep(max(1, settings.job_visibility_seconds / 3))
+            try:
+                await self.client.zadd(PROCESSING_KEY, {job_id: time.time() + settings.job_visibility_seconds}, xx=True)
+            except Exception as e:
+                logger.warning("Could not renew claim on job %s: %s", job_id, e)
+
+    async def run_forever(self):
+        await asyncio.gather(self._reaper(), *(self._worker(index) for index in range(self.workers)))
+
+    async def stats(self) -> dict:
+        stats = await super().stats()
+        stats["backend"] = "redis"
+        stats["workers"] = self.workers if self.run_workers else 0
+        stats["processing"] = await self.client.zcard(PROCESSING_KEY)
+        return stats
+
+def create_scheduler(handler: JobHandler, run_workers: bool = None, on_abandoned: AbandonedHandler = None) -> JobScheduler:
+    run_workers = settings.job_workers_in_api if run_workers is None else run_workers
+    if settings.job_queue_backend == "redis":
+        if redis_available:
+            return RedisJobScheduler(
+                handler, settings.generation_workers, settings.max_pending_jobs, run_workers, on_abandoned
+            )
+        logger.warning("Redis queue requested but Redis is not available; using in-process queue.")
+    return JobScheduler(handler, settings.generation_workers, settings.max_pending_jobs)
@@ -0,0 +1,110 @@
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Independent parts of an architecture plan for GENERATION_MODE=sections. Every section prompt
+# shares the requirement and the outline as a common prefix; only the closing instruction
+# differs, so sections can be generated concurrently (and retried alone) without overlapping.
+
+SECTION_UNAVAILABLE = "[Section unavailable]"
+SECTION_MIN_CHARS = 150
+
+class Section(NamedTuple):
+    key: str
+    title: str
+    focus: str
+    required_terms: Tuple[str, ...] = ()
+
+SECTIONS = (
+    Section(
+        "overview", "Overview",
+        "summarize the system's purpose, its main components and how requests flow between them.",
+    ),
+    Section(
+        "technology", "Technology Stack",
+        "choose the languages, frameworks, managed services and infrastructure technology, with a one-line justification for each.",
+        ("technology",),
+    ),
+    Section(
+        "data", "Data Architecture",
+        "describe the data stores, high-level data model, caching layers and data processing pipelines.",
+    ),
+    Section(
+        "security", "Security and Compliance",
+        "cover authentication, authorization, encryption, secrets management and the compliance standards that apply.",
+        ("security",),
+    ),
+    Section(
+        "scalability", "Scalability and Resilience",
+        "explain the scaling strategy, how the performance targets are met, fault tolerance and disaster recovery.",
+        ("scalability",),
+    ),
+    Section(
+        "deployment", "Deployment and Monitoring",
+        "describe the deployment environment, CI/CD pipeline, observability and day-2 operations.",
+    ),
+)
+
+ALL_SECTIONS = tuple(section.key for section in SECTIONS)
+
+# Which sections an edited ArchitectureRequest field can change. Fields not listed here
+# (the core pattern, the functional requirement) invalidate the whole plan.
+FIELD_SECTIONS: Dict[str, Tuple[str, ...]] = {
+    "services": ("overview", "data"),
+    "custom_service": ("overview", "data"),
+    "integration": ("overview", "technology"),
+    "custom_integration": ("overview", "technology"),
+    "data_storage": ("technology", "data"),
+    "caching": ("technology", "data"),
+    "data_processing": ("technology", "data"),
+    "custom_storage": ("technology", "data"),
+    "security": ("security",),
+    "compliance": ("security",),
+    "custom_security": ("security",),
+    "deployment": ("technology", "deployment"),
+    "monitoring": ("deployment",),
+    "custom_deployment": ("deployment",),
+    "scaling": ("scalability",),
+    "expected_concurrency": ("scalability",),
+    "latency": ("scalability",),
+    "throughput": ("scalability",),
+    "resilience": ("scalability",),
+    "custom_resilience": ("scalability",),
+    "advanced_features": ("overview", "technology"),
+    "custom_advanced": ("overview", "technology"),
+}
+
+OUTLINE = ", ".join(f"{number}. {section.title}" for number, section in enumerate(SECTIONS, start=1))
+
+def is_valid_section(section: Section, text: str) -> bool:
+    lowered = text.lower()
+    return len(text) >= SECTION_MIN_CHARS and all(term in lowered for term in section.required_terms)
+
+def render_section(number: int, section: Section, body: Optional[str]) -> str:
+    # A section that never validated is rendered as a notice, which also fails _is_valid_output
+    # so the merged plan is not cached.
+    if body is None:
+        body = f"{SECTION_UNAVAILABLE} This section could not be generated; regenerate the plan to fill it in."
+    return f"{number}. {section.title}\n{body.strip()}"
+
+def affected_sections(changed_fields: Iterable[str]) -> List[str]:
+    affected = set()
+    for field in changed_fields:
+        affected.update(FIELD_SECTIONS.get(field, ALL_SECTIONS))
+    return [key for key in ALL_SECTIONS if key in affected]
+
+def split_sections(text: str) -> Optional[Dict[str, str]]:
+    # Inverse of the merge in generate_sections: section bodies keyed by section, or None if the
+    # text is not a sectioned plan (e.g. it came from single-call generation).
+    starts = []
+    position = 0
+    for number, section in enumerate(SECTIONS, start=1):
+        match = re.compile(rf"^{number}\. {re.escape(section.title)}\n", re.MULTILINE).search(text, position)
+        if match is None:
+            return None
+        starts.append((section.key, match.start(), match.end()))
+        position = match.end()
+    bodies = {}
+    for index, (key, _, body_start) in enumerate(starts):
+        body_end = starts[index + 1][1] if index + 1 < len(starts) else len(text)
+        bodies[key] = text[body_start:body_end].strip()
+    return bodies
@@ -0,0 +1,152 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict
+from backend.config import settings
+from backend.deadlines import GenerationStopped, current as current_budget
+from backend.redis_client import redis_client, redis_available
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+INFLIGHT_PREFIX = "archigenie:inflight"
+BUDGET_POLL_SECONDS = 0.25  # How often a waiting follower re-checks its own budget
+
+# Deletes the ownership key only if this worker still holds it.
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class SingleFlight:
+    # Collapses concurrent calls for the same key into one execution. Within a process callers
+    # share a Future; across workers the Redis ownership key elects one leader and the others
+    # wait for its published result.
+    def __init__(self, client=None):
+        self.client = client
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "local_followers": 0, "remote_followers": 0}
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def do(self, key: str, fn: Callable[[], str]) -> str:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self._stats["local_followers"] += 1
+        if not leader:
+            logger.debug("Attaching to in-flight generation %s", key)
+            try:
+                return self._follow(future)
+            except GenerationStopped:
+                # The leader's own request was cancelled or ran out of time, not this one.
+                current_budget().check()
+                return self.do(key, fn)
+        try:
+            result = self._do_distributed(key, fn) if self.client is not None else self._lead(fn)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    @staticmethod
+    def _follow(future: Future) -> str:
+        # Waits on the leader for no longer than this caller's own budget allows.
+        budget = current_budget()
+        while True:
+            budget.check()
+            try:
+                return future.result(timeout=budget.timeout(BUDGET_POLL_SECONDS))
+            except FutureTimeoutError:
+                continue
+
+    def _lead(self, fn: Callable[[], str]) -> str:
+        self._count("leaders")
+        return fn()
+
+    def _do_distributed(self, key: str, fn: Callable[[], str]) -> str:
+        lock_key = f"{INFLIGHT_PREFIX}:lock:{key}"
+        result_key = f"{INFLIGHT_PREFIX}:result:{key}"
+        channel = f"{INFLIGHT_PREFIX}:done:{key}"
+        deadline = time.monotonic() + settings.singleflight_wait_seconds
+        while time.monotonic() < deadline:
+            token = uuid.uuid4().hex
+            if self.client.set(lock_key, token, nx=True, ex=settings.singleflight_lock_ttl_seconds):
+                return self._lead_distributed(fn, lock_key, result_key, channel, token)
+            outcome = self._wait_for_owner(lock_key, result_key, channel, deadline)
+            if outcome is not None:
+                self._count("remote_followers")
+                if "error" in outcome:
+                    raise RuntimeError(outcome["error"])
+                return outcome["result"]
+            # The owner released the key without publishing a result; compete again.
+        current_budget().check()
+        logger.warning("Timed out waiting for in-flight generation %s; generating locally", key)
+        return self._lead(fn)
+
+    def _lead_distributed(self, fn, lock_key: str, result_key: str, channel: str, token: str) -> str:
+        outcome = {"error": "In-flight generation was aborted"}
+        try:
+            result = self._lead(fn)
+            outcome = {"result": result}
+            return result
+        except GenerationStopped:
+            outcome = None  # Followers compete for the key again instead of failing
+            raise
+        except Exception as e:
+            outcome = {"error": str(e)}
+            raise
+        finally:
+            try:
+                with self.client.pipeline() as pipe:
+                    if outcome is not None:
+                        pipe.setex(result_key, settings.singleflight_result_ttl_seconds, json.dumps(outcome))
+                    pipe.publish(channel, "1")
+                    pipe.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+                    pipe.execute()
+            except Exception as e:
+                logger.warning("Failed to publish in-flight result: %s", e)
+
+    def _wait_for_owner(self, lock_key: str, result_key: str, channel: str, deadline: float):
+        budget = current_budget()
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel)
+        try:
+            while time.monotonic() < deadline:
+                budget.check()
+                # Check after subscribing so a result published in between is not missed.
+                payload = self.client.get(result_key)
+                if payload:
+                    return json.loads(payload)
+                if not self.client.exists(lock_key):
+                    payload = self.client.get(result_key)
+                    return json.loads(payload) if payload else None
+                pubsub.get_message(timeout=budget.timeout(BUDGET_POLL_SECONDS))
+            return None
+        finally:
+            pubsub.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+single_flight = SingleFlight(redis_client if redis_available else None)
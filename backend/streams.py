@@ -0,0 +1,121 @@
+import asyncio
+import json
+import logging
+import threading
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from backend.redis_client import redis_client, async_redis_client, redis_available
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+STREAM_TTL_SECONDS = 3600
+HEARTBEAT_SECONDS = 15
+TERMINAL_EVENTS = ("done", "error")
+
+def _stream_key(job_id: str) -> str:
+    return f"archigenie:stream:{job_id}"
+
+class _Channel:
+    # In-memory event log for one job. Producers run on worker threads, consumers on the event loop.
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.events: List[Tuple[str, str]] = []
+        self.lock = threading.Lock()
+        self.condition = asyncio.Condition()
+
+    async def _notify(self):
+        async with self.condition:
+            self.condition.notify_all()
+
+    def append(self, event: str, data: str):
+        with self.lock:
+            self.events.append((event, data))
+        asyncio.run_coroutine_threadsafe(self._notify(), self.loop)
+
+_channels: Dict[str, _Channel] = {}
+
+def open_stream(job_id: str):
+    # Must be called from the event loop, before the job is scheduled.
+    if not redis_available:
+        _channels[job_id] = _Channel(asyncio.get_running_loop())
+
+async def close_stream(job_id: str):
+    # Discards a stream whose job was never scheduled.
+    if redis_available:
+        await async_redis_client.delete(_stream_key(job_id))
+    else:
+        _channels.pop(job_id, None)
+
+def publish(job_id: str, event: str, payload: dict):
+    # Blocking variant for generation worker threads.
+    data = json.dumps(payload)
+    if redis_available:
+        key = _stream_key(job_id)
+        with redis_client.pipeline() as pipe:
+            pipe.xadd(key, {"event": event, "data": data})
+            pipe.expire(key, STREAM_TTL_SECONDS)
+            pipe.execute()
+        return
+    channel = _channels.get(job_id)
+    if channel is None:
+        return
+    channel.append(event, data)
+    if event in TERMINAL_EVENTS:
+        channel.loop.call_soon_threadsafe(channel.loop.call_later, STREAM_TTL_SECONDS, _channels.pop, job_id, None)
+
+async def publish_async(job_id: str, event: str, payload: dict):
+    if not redis_available:
+        publish(job_id, event, payload)
+        return
+    key = _stream_key(job_id)
+    async with async_redis_client.pipeline(transaction=False) as pipe:
+        pipe.xadd(key, {"event": event, "data": json.dumps(payload)})
+        pipe.expire(key, STREAM_TTL_SECONDS)
+        await pipe.execute()
+
+async def has_stream(job_id: str) -> bool:
+    if redis_available:
+        return bool(await async_redis_client.exists(_stream_key(job_id)))
+    return job_id in _channels
+
+async def subscribe(job_id: str) -> AsyncIterator[Tuple[Optional[str], Optional[str]]]:
+    # Yields (event, data) from the start of the job's stream; (None, None) marks an idle heartbeat.
+    if redis_available:
+        async for item in _subscribe_redis(job_id):
+            yield item
+        return
+    channel = _channels.get(job_id)
+    if channel is None:
+        return
+    index = 0
+    while True:
+        async with channel.condition:
+            try:
+                await asyncio.wait_for(
+                    channel.condition.wait_for(lambda: len(channel.events) > index), HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield None, None
+                continue
+        with channel.lock:
+            pending = channel.events[index:]
+        index += len(pending)
+        for event, data in pending:
+            yield event, data
+            if event in TERMINAL_EVENTS:
+                return
+
+async def _subscribe_redis(job_id: str) -> AsyncIterator[Tuple[Optional[str], Optional[str]]]:
+    key = _stream_key(job_id)
+    last_id = "0-0"
+    while True:
+        response = await async_redis_client.xread({key: last_id}, block=HEARTBEAT_SECONDS * 1000)
+        if not response:
+            yield None, None
+            continue
+        for _, entries in response:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                yield fields["event"], fields["data"]
+                if fields["event"] in TERMINAL_EVENTS:
+                    return
@@ -0,0 +1,104 @@
+import logging
+import re
+import threading
+from typing import Dict, Iterable
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+CHARS_PER_TOKEN = 4  # Rough estimate; good enough to place the checkpoints
+REQUIRED_TERMS = ("scalability", "security", "technology")
+ECHO_PROBE_CHARS = 48
+# Repetition only counts as a loop in prose: diagrams, rules and tables repeat connector and
+# border characters legitimately, so repeated blocks and lines need this many words.
+LOOP_MIN_WORDS = 3
+LOOP_LINES = 8
+_WORD = re.compile(r"[^\W\d_]{2,}")
+
+class AttemptAborted(Exception):
+    def __init__(self, reason: str, partial: str, tokens: int, max_tokens: int):
+        super().__init__(f"Generation aborted: {reason}")
+        self.reason = reason
+        self.partial = partial
+        self.tokens = tokens
+        self.max_tokens = max_tokens  # Completion budget of the aborted attempt
+
+class StreamValidator:
+    # Runs cheap checks on the partial output of a streamed attempt and raises AttemptAborted
+    # as soon as the attempt is doomed, so the provider call can be closed early. The final
+    # _is_valid_output check still applies to attempts that run to completion.
+    def __init__(self, marker: str, echo_phrases: Iterable[str], max_tokens: int = None):
+        self.marker = marker
+        self.max_tokens = max_tokens or settings.generation_max_tokens
+        self._echo_probes = [phrase[:ECHO_PROBE_CHARS].lower() for phrase in echo_phrases if len(phrase) >= 20]
+        self._text = ""
+        self._checked_at = 0
+
+    @property
+    def tokens(self) -> int:
+        return len(self._text) // CHARS_PER_TOKEN
+
+    def feed(self, chunk: str):
+        self._text += chunk
+        # Checks scan the tail of the output; run them every few hundred chars rather than per token.
+        if len(self._text) - self._checked_at < settings.validation_check_interval_chars:
+            return
+        self._checked_at = len(self._text)
+        reason = self._check()
+        if reason:
+            raise AttemptAborted(reason, self._text, self.tokens, self.max_tokens)
+
+    def _body(self) -> str:
+        if self.marker in self._text:
+            return self._text.split(self.marker, 1)[1]
+        return self._text
+
+    def _check(self) -> str:
+        body = self._body().lower()
+        tokens = self.tokens
+        if any(probe in body for probe in self._echo_probes):
+            return "prompt_echo"
+        if self._is_looping(body):
+            return "repetition_loop"
+        if settings.validation_marker_tokens and tokens >= settings.validation_marker_tokens and self.marker not in self._text:
+            return "missing_marker"
+        if tokens >= settings.validation_section_tokens and not all(term in body for term in REQUIRED_TERMS):
+            return "missing_sections"
+        return ""
+
+    @staticmethod
+    def _is_prose(text: str) -> bool:
+        return len(_WORD.findall(text)) >= LOOP_MIN_WORDS
+
+    @classmethod
+    def _is_looping(cls, body: str) -> bool:
+        # The tail ends in the same block of prose three times over (degenerate decoding).
+        tail = body[-3 * settings.validation_max_loop_chars:]
+        for period in range(settings.validation_min_loop_chars, len(tail) // 3 + 1):
+            block = tail[-period:]
+            if tail[-2 * period:-period] == block and tail[-3 * period:-2 * period] == block and cls._is_prose(block):
+                return True
+        # Or its last lines of prose alternate between one or two sentences.
+        lines = [line.strip() for line in body.splitlines()]
+        lines = [line for line in lines if len(line) >= settings.validation_min_loop_chars and cls._is_prose(line)][-LOOP_LINES:]
+        return len(lines) == LOOP_LINES and len(set(lines)) <= 2
+
+_stats: Dict[str, int] = {"aborted_attempts": 0, "tokens_saved": 0}
+_abort_reasons: Dict[str, int] = {}
+_stats_lock = threading.Lock()
+
+def record_abort(error: AttemptAborted, attempt: str):
+    saved = max(0, error.max_tokens - error.tokens)
+    with _stats_lock:
+        _stats["aborted_attempts"] += 1
+        _stats["tokens_saved"] += saved
+        _abort_reasons[error.reason] = _abort_reasons.get(error.reason, 0) + 1
+    logger.warning(
+        "Aborted %s early (%s) after ~%d tokens; ~%d tokens saved",
+        attempt, error.reason, error.tokens, saved,
+    )
+
+def validation_stats() -> dict:
+    with _stats_lock:
+        return {**_stats, "abort_reasons": dict(_abort_reasons)}
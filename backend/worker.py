@@ -0,0 +1,23 @@
+import asyncio
+import logging
+from backend.api import fail_abandoned_job, process_architecture_generation
+from backend.config import settings, validate_settings
+from backend.prompt_generator import warm_generators
+from backend.scheduler import RedisJobScheduler, create_scheduler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Standalone generation worker: python -m backend.worker
+# Requires JOB_QUEUE_BACKEND=redis; pair it with JOB_WORKERS_IN_API=false on the API pods.
+async def main():
+    validate_settings()
+    scheduler = create_scheduler(process_architecture_generation, run_workers=True, on_abandoned=fail_abandoned_job)
+    if not isinstance(scheduler, RedisJobScheduler):
+        raise SystemExit("backend.worker requires JOB_QUEUE_BACKEND=redis and a reachable Redis.")
+    await asyncio.to_thread(warm_generators)
+    logger.info("Generation worker running with %d slots", settings.generation_workers)
+    await scheduler.run_forever()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,34 +1,82 @@
 import os
+import json
+import hashlib
 import requests
-from typing import Dict
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterator, Tuple
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+REQUEST_TIMEOUT = 30
+# How long a queued generation may take end to end before the backend gives up on it.
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT_SECONDS", "300"))
+POLL_WAIT_SECONDS = 20  # Long-poll window for GET /jobs/{id}?wait=
 
 class APIError(Exception):
     def __init__(self, message: str, status_code: int):
         super().__init__(message)
         self.status_code = status_code
 
-def call_api(endpoint: str, payload: Dict) -> Dict:
-    url = f"{BACKEND_URL}{endpoint}"
+# One keep-alive pool for every Streamlit session in this process; reruns and polls reuse
+# open connections instead of reconnecting per call.
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_maxsize=int(os.getenv("BACKEND_POOL_SIZE", "20"))))
+_session.mount("https://", HTTPAdapter(pool_maxsize=int(os.getenv("BACKEND_POOL_SIZE", "20"))))
+
+def _api_error(e: requests.exceptions.RequestException) -> APIError:
+    if isinstance(e, requests.exceptions.HTTPError):
+        try:
+            error_detail = e.response.json().get("detail", str(e))
+        except ValueError:
+            error_detail = str(e)
+        return APIError(f"API Error [{e.response.status_code}]: {error_detail}", e.response.status_code)
+    return APIError(f"Network error: {str(e)}", 503)
+
+def _request(method: str, endpoint: str, timeout: float = REQUEST_TIMEOUT, **kwargs) -> Dict:
     try:
-        response = requests.post(url, json=payload, timeout=30)
+        response = _session.request(method, f"{BACKEND_URL}{endpoint}", timeout=timeout, **kwargs)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.HTTPError as e:
-        error_detail = e.response.json().get("detail", str(e))
-        raise APIError(f"API Error [{e.response.status_code}]: {error_detail}", e.response.status_code)
     except requests.exceptions.RequestException as e:
-        raise APIError(f"Network error: {str(e)}", 503)
+        raise _api_error(e)
+
+def call_api(endpoint: str, payload: Dict, budget: float = None) -> Dict:
+    # `budget` is sent as X-Request-Timeout. For synchronous endpoints it defaults to a little
+    # under our own timeout, so the backend stops generating (and answers 504) before we give up.
+    headers = {"X-Request-Timeout": str(budget or REQUEST_TIMEOUT - 2)}
+    return _request("POST", endpoint, json=payload, headers=headers)
 
 def call_api_get(endpoint: str) -> Dict:
-    url = f"{BACKEND_URL}{endpoint}"
+    return _request("GET", endpoint)
+
+def get_job(job_id: str, wait: float = 0) -> Dict:
+    # With wait > 0 the backend answers as soon as the job changes status.
+    return _request("GET", f"/jobs/{job_id}", timeout=REQUEST_TIMEOUT + wait, params={"wait": wait})
+
+def cancel_job(job_id: str) -> Dict:
+    return _request("DELETE", f"/jobs/{job_id}")
+
+def request_key(payload: Dict) -> str:
+    # Same key for payloads that differ only in empty fields, whitespace or selection order.
+    def normalize(value):
+        if isinstance(value, str):
+            return " ".join(value.split())
+        if isinstance(value, list):
+            return sorted(normalize(item) for item in value)
+        return value
+    canonical = {field: normalize(value) for field, value in payload.items() if value not in (None, "", [])}
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+def stream_job(job_id: str) -> Iterator[Tuple[str, Dict]]:
+    # Yields (event, data) pairs from the job's Server-Sent-Events stream.
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as e:
-        error_detail = e.response.json().get("detail", str(e))
-        raise APIError(f"API Error [{e.response.status_code}]: {error_detail}", e.response.status_code)
+        with _session.get(f"{BACKEND_URL}/jobs/{job_id}/stream", stream=True, timeout=(5, 60)) as response:
+            response.raise_for_status()
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:") and event:
+                    yield event, json.loads(line[len("data:"):].strip())
+                    event = None
     except requests.exceptions.RequestException as e:
-        raise APIError(f"Network error: {str(e)}", 503)
+        raise _api_error(e)
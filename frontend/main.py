@@ -1,5 +1,5 @@
 import streamlit as st
-from frontend.api_client import call_api, APIError
+from frontend.api_client import JOB_TIMEOUT, POLL_WAIT_SECONDS, call_api, cancel_job, get_job, request_key, stream_job, APIError
 from frontend.ui_components import render_header, remove_footer, render_toggle, render_progress, display_error
 
 def main():
@@ -11,8 +11,14 @@ def main():
     remove_footer()
     render_header()
 
-    if 'architecture' not in st.session_state:
-        st.session_state.architecture = None
+    # Results are memoized per canonical payload, and in-flight jobs are tracked the same way,
+    # so reruns and identical resubmits reattach or re-render without calling the backend.
+    if 'results' not in st.session_state:
+        st.session_state.results = {}
+    if 'jobs' not in st.session_state:
+        st.session_state.jobs = {}
+    if 'current' not in st.session_state:
+        st.session_state.current = None
 
     provider_selection = st.selectbox(
         "Select AI Provider",
@@ -119,30 +125,109 @@ def handle_functional_submission(requirement):
     if not requirement.strip():
         st.warning("⚠️ Please enter a functional requirement")
         return
+    submit({
+        "functional_requirement": requirement,
+        "provider": st.session_state.provider
+    }, "🧠 Analyzing requirements...")
+
+def handle_guided_submission(**kwargs):
+    payload = kwargs
+    payload["provider"] = st.session_state.provider
+    submit(payload, "🔨 Building architecture blueprint...")
+
+def submit(payload, spinner_text):
+    key = request_key(payload)
+    st.session_state.current = key
+    if key in st.session_state.results or key in st.session_state.jobs:
+        return  # Already generated or still generating
+    # A new request replaces the one on screen; stop generating the abandoned one.
+    for abandoned in list(st.session_state.jobs):
+        try:
+            cancel_job(st.session_state.jobs.pop(abandoned))
+        except APIError:
+            pass  # Already finished
     try:
-        with st.spinner("🧠 Analyzing requirements..."):
-            result = call_api("/generate-prompt", {
-                "functional_requirement": requirement,
-                "provider": st.session_state.provider
-            })
-            st.session_state.architecture = result.get("architecture")
+        with st.spinner(spinner_text):
+            result = call_api("/generate-prompt/jobs", payload, budget=JOB_TIMEOUT)
+        st.session_state.jobs[key] = result["job_id"]
     except APIError as e:
         display_error(e)
 
-def handle_guided_submission(**kwargs):
+def display_results():
+    key = st.session_state.current
+    if key is None:
+        return
+    st.subheader("Final Architecture Design")
+    if key in st.session_state.results:
+        st.markdown(st.session_state.results[key])
+        return
+    job_id = st.session_state.jobs.get(key)
+    if job_id is None:
+        return
+    if st.button("⏹️ Stop generation"):
+        st.session_state.jobs.pop(key, None)
+        try:
+            cancel_job(job_id)
+            st.info("Generation stopped.")
+        except APIError as e:
+            display_error(e)
+        return
     try:
-        payload = kwargs
-        payload["provider"] = st.session_state.provider
-        with st.spinner("🔨 Building architecture blueprint..."):
-            result = call_api("/generate-prompt", payload)
-            st.session_state.architecture = result.get("architecture")
+        architecture = follow_job(job_id)
     except APIError as e:
+        st.session_state.jobs.pop(key, None)
         display_error(e)
+        return
+    st.session_state.jobs.pop(key, None)
+    st.session_state.results[key] = architecture
 
-def display_results():
-    if st.session_state.architecture:
-        st.subheader("Final Architecture Design")
-        st.markdown(st.session_state.architecture)
+def follow_job(job_id):
+    # Long-polls while the job is queued, then streams tokens; falls back to polling if the
+    # stream drops. Returns the architecture or raises APIError.
+    progress = st.empty()
+    placeholder = st.empty()
+    job = get_job(job_id)
+    while job["status"] == "pending":
+        with progress.container():
+            render_progress(job.get("progress", 0))
+            if job.get("queue_position"):
+                st.caption(f"Queued at position {job['queue_position']}")
+        job = get_job(job_id, wait=POLL_WAIT_SECONDS)
+    with progress.container():
+        render_progress(job.get("progress", 0))
+    if job["status"] == "processing":
+        try:
+            return render_stream(job_id, progress, placeholder)
+        except APIError as e:
+            if e.status_code != 503:
+                raise
+            placeholder.info("🔄 Connection interrupted; waiting for the result...")
+        while job["status"] in ("pending", "processing"):
+            job = get_job(job_id, wait=POLL_WAIT_SECONDS)
+    progress.empty()
+    if job["status"] != "completed":
+        raise APIError(job.get("error") or f"Job {job['status']}", 500)
+    placeholder.markdown(job["result"])
+    return job["result"]
+
+def render_stream(job_id, progress, placeholder):
+    text = ""
+    for event, data in stream_job(job_id):
+        if event == "token":
+            text += data["text"]
+            placeholder.markdown(text + "▌")
+        elif event == "reset":
+            text = ""
+            placeholder.info("🔁 Retrying for a more complete architecture...")
+        elif event == "done":
+            progress.empty()
+            placeholder.markdown(data["result"])
+            return data["result"]
+        elif event == "error":
+            progress.empty()
+            placeholder.empty()
+            raise APIError(data["error"], 500)
+    raise APIError("Stream ended before the job finished", 503)
 
 if __name__ == "__main__":
     main()
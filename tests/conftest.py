@@ -0,0 +1,9 @@
+import os
+
+# Offline and self-contained: in-memory stores and the fake provider, whatever .env says.
+os.environ.update(
+    REDIS_ENABLED="false",
+    AI_PROVIDER="fake",
+    WARM_GENERATORS_ON_STARTUP="false",
+    STARTUP_CHECK_PROVIDERS="false",
+)
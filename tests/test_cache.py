@@ -0,0 +1,34 @@
+import time
+import pytest
+from backend import cache
+from backend.cache import LRUTier, RedisTier, ResultCache
+
+def test_lru_entries_expire():
+    lru = LRUTier(max_bytes=1024, ttl_seconds=0.05)
+    lru.set("v1:key", "plan")
+    assert lru.get("v1:key") == "plan"
+    time.sleep(0.1)
+    assert lru.get("v1:key") is None
+    assert lru.stats()["entries"] == 0
+
+def test_lru_copy_expires_with_the_redis_entry():
+    fakeredis = pytest.importorskip("fakeredis")
+    result_cache = ResultCache()
+    result_cache.redis = RedisTier(fakeredis.FakeRedis(decode_responses=True), ttl_seconds=1)
+    result_cache.redis.set("v1:key", "plan")
+    assert result_cache.get("v1:key") == "plan"  # Promoted into the LRU
+    time.sleep(1.1)
+    assert result_cache.get("v1:key") is None
+
+def test_invalidation_reaches_other_processes(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    monkeypatch.setattr(cache, "GENERATION_CHECK_SECONDS", 0.0)
+    server = fakeredis.FakeServer()
+    workers = [ResultCache(), ResultCache()]
+    for worker in workers:
+        worker.redis = RedisTier(fakeredis.FakeRedis(server=server, decode_responses=True), ttl_seconds=60)
+    workers[0].set("v1:key", "plan")
+    assert workers[1].get("v1:key") == "plan"  # Now in both LRUs
+    workers[0].invalidate_version("v1")
+    assert workers[1].get("v1:key") is None
+    assert workers[0].get("v1:key") is None
@@ -0,0 +1,8 @@
+from fastapi.testclient import TestClient
+from backend.main import app
+
+def test_dictionary_training_needs_redis():
+    with TestClient(app) as client:
+        response = client.post("/admin/compression/dictionary")
+    assert response.status_code == 409
+    assert "Redis" in response.json()["detail"]
@@ -0,0 +1,46 @@
+import pytest
+from backend.config import settings
+from backend.failover import OPEN, ProviderRouter, ProvidersUnavailableError, failover_configured, is_availability_error
+
+def _hf_error(status_code: int) -> Exception:
+    httpx = pytest.importorskip("httpx")
+    errors = pytest.importorskip("huggingface_hub.errors")
+    request = httpx.Request("POST", "https://api-inference.huggingface.co/models/tiiuae/falcon-7b-instruct")
+    return errors.HfHubHTTPError(f"{status_code} error", response=httpx.Response(status_code, request=request))
+
+def _router() -> ProviderRouter:
+    return ProviderRouter(lambda provider, model: provider, lambda provider, model: model or "default")
+
+def test_hf_http_errors_are_classified_by_status():
+    assert is_availability_error(_hf_error(503))
+    assert is_availability_error(_hf_error(429))
+    assert not is_availability_error(_hf_error(400))
+
+def test_langchain_wrapped_hf_errors():
+    assert is_availability_error(ValueError("Error raised by inference API: Model tiiuae/falcon-7b-instruct is currently loading"))
+    assert not is_availability_error(ValueError("Error raised by inference API: Input validation error"))
+
+def test_hf_503_opens_the_breaker_and_fails_over(monkeypatch):
+    monkeypatch.setattr(settings, "provider_order", "huggingface:tiiuae/falcon-7b-instruct,fake")
+    monkeypatch.setattr(settings, "breaker_failure_threshold", 2)
+    router = _router()
+
+    def call(provider):
+        if provider == "huggingface":
+            raise _hf_error(503)
+        return "plan"
+
+    for _ in range(2):
+        assert router.run(call) == ("plan", "fake")
+    assert router.breaker(("huggingface", "tiiuae/falcon-7b-instruct")).state == OPEN
+
+def test_hf_503_without_fallback_reports_unavailable(monkeypatch):
+    monkeypatch.setattr(settings, "provider_order", "huggingface:tiiuae/falcon-7b-instruct")
+    with pytest.raises(ProvidersUnavailableError):
+        _router().run(lambda provider: (_ for _ in ()).throw(_hf_error(503)))
+
+def test_sdk_retries_are_left_to_failover(monkeypatch):
+    monkeypatch.setattr(settings, "provider_order", "")
+    assert not failover_configured()
+    monkeypatch.setattr(settings, "provider_order", "openai:gpt-4,huggingface:tiiuae/falcon-7b-instruct")
+    assert failover_configured()
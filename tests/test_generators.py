@@ -0,0 +1,50 @@
+import threading
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+from backend import prompt_generator
+from backend.main import app
+from backend.prompt_generator import get_generator
+
+@pytest.fixture
+def registry(monkeypatch):
+    # An empty registry whose generators take a while to build, counting every build.
+    builds = []
+    lock = threading.Lock()
+
+    class SlowGenerator:
+        def __init__(self, provider, model_name):
+            time.sleep(0.05)
+            self.provider, self.model_name = provider, model_name
+            with lock:
+                builds.append((provider, model_name))
+
+    monkeypatch.setattr(prompt_generator, "ArchitectureGenerator", SlowGenerator)
+    monkeypatch.setattr(prompt_generator, "_generators", {})
+    monkeypatch.setattr(prompt_generator, "_init_locks", {})
+    monkeypatch.setattr(prompt_generator, "_registry_stats", {"created": 0, "reused": 0, "init_seconds": 0.0})
+    return builds
+
+def test_each_target_is_built_once_and_reused(registry):
+    first = get_generator("fake", "model-a")
+    assert get_generator(" FAKE ", "model-a") is first
+    assert get_generator("fake", "model-b") is not first
+    assert registry == [("fake", "model-a"), ("fake", "model-b")]
+    stats = prompt_generator.registry_stats()
+    assert (stats["created"], stats["reused"]) == (2, 1)
+    assert sorted(stats["generators"]) == ["fake/model-a", "fake/model-b"]
+    assert stats["setup_ms_saved"] > 0
+
+def test_concurrent_first_calls_share_one_build(registry):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        generators = list(executor.map(lambda _: get_generator("fake", "model-a"), range(8)))
+    assert registry == [("fake", "model-a")]
+    assert all(generator is generators[0] for generator in generators)
+
+def test_admin_endpoint_reports_the_registry():
+    with TestClient(app) as client:
+        client.post("/generate-prompt", json={"functional_requirement": "A booking system for community sports halls"})
+        stats = client.get("/admin/generators").json()
+    assert stats["created"] >= 1
+    assert any(name.startswith("fake/") for name in stats["generators"])
@@ -0,0 +1,98 @@
+import asyncio
+import time
+import pytest
+from backend.config import settings
+from backend.job_store import COMPACTED_KEY, DIMENSIONS_KEY, INDEX_PREFIX, InMemoryJobStore, JobStore, RedisJobStore, _index_keys, index_member
+from backend.models import JobStatus
+
+DAY = 86400
+
+@pytest.fixture
+def store():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return RedisJobStore(fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+def _job(created_at: float, status=JobStatus.PENDING, client="ip:1.2.3.4") -> dict:
+    return {
+        "status": status, "client": client, "provider": "fake/fake-model", "created_at": created_at,
+        "result": None, "inputs": {"functional_requirement": "orders"},
+    }
+
+async def _indexes(store) -> dict:
+    # Every index key with its members.
+    return {key: await store.client.zrange(key, 0, -1) async for key in store.client.scan_iter(f"{INDEX_PREFIX}*")}
+
+def test_status_change_moves_the_job_across_every_index(store):
+    async def run():
+        job = _job(time.time())
+        await store.create("a", job)
+        member = index_member(job["created_at"], "a")
+        pending = _index_keys(job)
+        assert len(pending) == 8
+        assert await store.update("a", status=JobStatus.PROCESSING)
+        running = _index_keys({**job, "status": JobStatus.PROCESSING})
+        indexes = await _indexes(store)
+        assert set(indexes) == set(running)
+        assert all(members == [member] for members in indexes.values())
+        # Four indexes ignore the status, so only the other four changed.
+        assert len(set(pending) & set(running)) == 4
+        jobs, _ = await store.list_jobs({"client": "ip:1.2.3.4", "status": "processing"})
+        assert [summary["job_id"] for summary in jobs] == ["a"]
+    asyncio.run(run())
+
+def test_delete_removes_the_job_from_every_index(store):
+    async def run():
+        now = time.time()
+        await store.create("a", _job(now))
+        await store.create("b", _job(now, client="ip:5.6.7.8"))
+        await store.update("a", status=JobStatus.COMPLETED)
+        await store.delete("a")
+        kept = index_member(now, "b")
+        indexes = await _indexes(store)
+        assert set(indexes) == set(_index_keys(_job(now, client="ip:5.6.7.8")))
+        assert all(members == [kept] for members in indexes.values())
+        assert await store.client.hkeys(DIMENSIONS_KEY) == [kept]
+    asyncio.run(run())
+
+def test_compaction_prunes_each_result_once_behind_a_watermark(store):
+    async def run():
+        now = time.time()
+        for index in range(5):
+            await store.create(f"old-{index}", _job(now - 2 * DAY + index, status=JobStatus.COMPLETED))
+        await store.create("new", _job(now, status=JobStatus.COMPLETED))
+        assert await store.compact(now, batch_size=2) == {"pruned": 5, "deleted": 0}
+        assert await store.client.get(COMPACTED_KEY) == index_member(now - 2 * DAY + 4, "old-4")
+        assert (await store.get("old-0"))["inputs"] is None
+        assert (await store.get("new"))["inputs"] is not None
+        # Already pruned jobs are not read again; newly aged ones are picked up after the watermark.
+        assert await store.compact(now, batch_size=2) == {"pruned": 0, "deleted": 0}
+        assert await store.compact(now + 2 * DAY, batch_size=2) == {"pruned": 1, "deleted": 0}
+    asyncio.run(run())
+
+def test_compaction_drops_jobs_whose_hash_already_expired(store):
+    async def run():
+        now = time.time()
+        created_at = now - settings.job_retention_seconds - DAY
+        await store.create("gone", _job(created_at))
+        await store.update("gone", status=JobStatus.FAILED)
+        await store.create("kept", _job(now))
+        await store.client.delete(store._key("gone"))  # Expired before compaction got to it
+        await store.compact(now)
+        kept = index_member(now, "kept")
+        indexes = await _indexes(store)
+        assert all(members == [kept] for members in indexes.values())
+        assert await store.client.hkeys(DIMENSIONS_KEY) == [kept]
+    asyncio.run(run())
+
+def test_stores_must_implement_every_operation():
+    class PartialStore(JobStore):
+        async def create(self, job_id, job):
+            pass
+
+        async def get(self, job_id):
+            return None
+
+    with pytest.raises(TypeError, match="list_jobs"):
+        PartialStore()
+    InMemoryJobStore()
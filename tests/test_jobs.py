@@ -0,0 +1,13 @@
+from fastapi.testclient import TestClient
+from backend import api, streams
+from backend.main import app
+
+BODY = {"functional_requirement": "A system to manage orders and inventory for independent shops"}
+
+def test_rejected_job_leaves_no_stream(monkeypatch):
+    with TestClient(app) as client:
+        monkeypatch.setattr(api.scheduler, "max_pending", 0)
+        before = set(streams._channels)
+        response = client.post("/generate-prompt/jobs", json=BODY)
+    assert response.status_code == 503
+    assert set(streams._channels) == before
@@ -0,0 +1,114 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from backend import limiter as limiter_module
+from backend.config import settings
+from backend.limiter import MemoryBucketStore, RedisBucketStore, TokenBudgetLimiter, estimate_tokens
+from backend.main import app
+from backend.models import ArchitectureRequest
+from backend.prompt_builder import desired_completion_tokens
+from backend.prompt_generator import build_requirement
+
+REQUIREMENT = "A system to manage orders and inventory for independent shops, item %d"
+
+@pytest.fixture
+def fresh_limiter(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(limiter_module, "limiter", TokenBudgetLimiter(MemoryBucketStore()))
+    return limiter_module.limiter
+
+def test_batch_over_token_budget_is_rejected(fresh_limiter, monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_tokens_per_minute", 5000)
+    batch = {"requests": [{"functional_requirement": REQUIREMENT % index} for index in range(10)]}
+    with TestClient(app) as client:
+        response = client.post("/generate-batch", json=batch)
+    assert response.status_code == 429
+    assert response.headers["X-RateLimit-Resource"] == "tokens"
+    assert response.headers["X-RateLimit-Limit"] == "5000"
+
+def test_duplicate_batch_items_are_charged_once(fresh_limiter, monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_tokens_per_minute", 5000)
+    batch = {"requests": [{"functional_requirement": REQUIREMENT % 0}] * 10}
+    with TestClient(app) as client:
+        response = client.post("/generate-batch", json=batch)
+    assert response.status_code == 200
+    assert int(response.headers["X-RateLimit-Remaining"]) > 2000
+
+def test_headers_report_the_request_bucket_when_it_refuses(fresh_limiter, monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_per_minute", 2)
+    monkeypatch.setattr(settings, "rate_limit_lease_requests", 1)
+    body = {"functional_requirement": REQUIREMENT % 0}
+    with TestClient(app) as client:
+        statuses = [client.post("/generate-prompt/jobs", json=body) for _ in range(3)]
+    assert [response.status_code for response in statuses] == [200, 200, 429]
+    rejected = statuses[-1]
+    assert rejected.headers["X-RateLimit-Resource"] == "requests"
+    assert rejected.headers["X-RateLimit-Limit"] == "2"
+    assert rejected.headers["X-RateLimit-Remaining"] == "0"
+    assert "Retry-After" in rejected.headers
+
+def test_cached_results_are_not_charged_their_completion_budget(fresh_limiter, monkeypatch):
+    body = {"functional_requirement": REQUIREMENT % 42}
+    mode, inputs = "functional", ArchitectureRequest(**body).dict()
+    cost = estimate_tokens(build_requirement(mode, inputs), desired_completion_tokens(mode, inputs))
+    # Room for one generation, not two.
+    monkeypatch.setattr(settings, "rate_limit_tokens_per_minute", cost + cost // 2)
+    with TestClient(app) as client:
+        first = client.post("/generate-prompt", json=body)
+        second = client.post("/generate-prompt", json=body)
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.json() == first.json()
+
+def test_zero_token_budget_refuses_without_error(fresh_limiter, monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_tokens_per_minute", 0)
+    result = asyncio.run(fresh_limiter.check("client", 100))
+    assert not result.allowed
+    assert (result.resource, result.reset_seconds, result.retry_after) == ("tokens", 0, None)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+# (seconds elapsed, needs, wants, refunds), under a budget of 5 requests and 1000 tokens per minute.
+TAKES = [
+    (0, (1, 300), (2, 400), (0, 0)),
+    (0, (1, 300), (1, 300), (1, 100)),
+    (0, (1, 500), (1, 500), (0, 0)),
+    (3, (1, 200), (3, 600), (0, 0)),
+    (0, (1, 1500), (1, 1500), (0, 0)),
+    (0, (1, 100), (1, 100), (2, 400)),
+    (0, (1, 100), (1, 100), (0, 0)),
+    (0, (1, 100), (1, 100), (0, 0)),
+    (0, (1, 100), (1, 100), (0, 0)),
+    (60, (1, 900), (5, 1000), (0, 0)),
+]
+
+def _replay(store, clock):
+    async def run():
+        grants = []
+        for elapsed, needs, wants, refunds in TAKES:
+            clock.now += elapsed
+            grants.append(await store.take(("client:requests", "client:tokens"), (5, 1000), (5 / 60, 1000 / 60), needs, wants, refunds))
+        return grants
+    return asyncio.run(run())
+
+def test_redis_script_matches_memory_store(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    clock = FakeClock()
+    monkeypatch.setattr(limiter_module.time, "time", clock.time)
+    memory = _replay(MemoryBucketStore(), clock)
+    clock.now = 1_700_000_000.0
+    redis = _replay(RedisBucketStore(fakeredis.aioredis.FakeRedis(decode_responses=True)), clock)
+    # Every branch: leases, refunds, waits on either bucket, and a need over capacity.
+    assert [grant.limited for grant in memory] == [0, 0, 2, 0, 2, 0, 0, 1, 1, 0]
+    assert memory[4].retry_after == -1
+    for expected, actual in zip(memory, redis):
+        assert (actual.requests, actual.tokens, actual.limited) == (expected.requests, expected.tokens, expected.limited)
+        assert actual.retry_after == pytest.approx(expected.retry_after)
+        assert actual.remaining_requests == pytest.approx(expected.remaining_requests)
+        assert actual.remaining_tokens == pytest.approx(expected.remaining_tokens)
@@ -0,0 +1,15 @@
+from backend.prompt_generator import get_generator, primary_target
+from backend.sections import SECTIONS
+
+REQUIREMENT = "A system to manage orders and inventory for independent shops."
+
+def test_section_budget_is_fitted_against_the_section_prompt():
+    generator = get_generator(*primary_target())
+    budget = generator.budget(REQUIREMENT, 600, sections=True)
+    sent = [
+        generator.section_template.format(raw_requirement=REQUIREMENT, number=number, title=section.title, focus=section.focus)
+        for number, section in enumerate(SECTIONS, start=1)
+    ]
+    # Template and requirement are counted separately, so the estimate may round up by a token.
+    assert 0 <= budget.prompt_tokens - max(generator.count_tokens(prompt) for prompt in sent) <= 1
+    assert budget.prompt_tokens > generator.budget(REQUIREMENT, 600, sections=False).prompt_tokens
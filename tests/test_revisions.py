@@ -0,0 +1,32 @@
+from fastapi.testclient import TestClient
+from backend import prompt_generator
+from backend.main import app
+from backend.prompt_generator import revise_prompt
+
+BASE = {"architecture": "Microservices", "security": ["OAuth2"], "scaling": ["Horizontal"]}
+
+def _sectioned(marker: str) -> str:
+    return "\n\n".join(
+        f"{number}. {section.title}\n{marker} body for {section.key}" for number, section in enumerate(prompt_generator.SECTIONS, start=1)
+    )
+
+def test_revisions_of_different_bases_do_not_coalesce(monkeypatch):
+    keys = []
+    monkeypatch.setattr(prompt_generator.single_flight, "do", lambda key, fn: keys.append(key) or _sectioned("new"))
+    edited = {**BASE, "security": ["mTLS"]}
+    for marker in ("first", "second"):
+        revise_prompt("guided", edited, "guided", BASE, _sectioned(marker))
+    assert len(set(keys)) == 2
+
+def test_revisions_are_stored_and_chain():
+    with TestClient(app) as client:
+        first = client.post("/generate-prompt/revisions", json={
+            "request": {**BASE, "security": ["mTLS"]}, "base_request": BASE, "base_architecture": "A single-call plan.",
+        }).json()
+        assert first["regenerated"] == list(prompt_generator.ALL_SECTIONS)  # Unsectioned base
+        assert client.get(f"/jobs/{first['job_id']}").json()["status"] == "completed"
+        second = client.post("/generate-prompt/revisions", json={
+            "request": {**BASE, "security": ["mTLS"], "scaling": ["Vertical"]}, "base_job_id": first["job_id"],
+        }).json()
+    assert second["regenerated"] == ["scalability"]
+    assert "security" in second["reused"]
@@ -0,0 +1,81 @@
+import asyncio
+import time
+import pytest
+from backend.config import settings
+from backend.models import JobPriority
+from backend.scheduler import DELIVERIES_KEY, PAYLOADS_KEY, PROCESSING_KEY, QUEUE_KEY, RedisJobScheduler
+
+@pytest.fixture
+def make_scheduler():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    server = fakeredis.FakeServer()
+
+    def make(handler=None, on_abandoned=None) -> RedisJobScheduler:
+        scheduler = RedisJobScheduler(handler, workers=1, max_pending=10, on_abandoned=on_abandoned)
+        scheduler.client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+        return scheduler
+    return make
+
+async def _empty(scheduler) -> bool:
+    keys = (QUEUE_KEY, PROCESSING_KEY, PAYLOADS_KEY, DELIVERIES_KEY)
+    return not any([await scheduler.client.exists(key) for key in keys])
+
+def test_job_of_a_dead_worker_is_requeued_ahead_of_new_work(make_scheduler):
+    async def run():
+        scheduler = make_scheduler()
+        await scheduler.submit("a", {"prompt": "orders"})
+        await scheduler.submit("b", {"prompt": "stock"})
+        job_id, payload = await scheduler.claim()  # The worker holding "a" then dies
+        assert (job_id, payload) == ("a", {"prompt": "orders"})
+        assert await scheduler.reap() == {"requeued": [], "abandoned": []}
+        assert await scheduler.reap(time.time() + settings.job_visibility_seconds + 1) == {"requeued": ["a"], "abandoned": []}
+        assert await scheduler.position("a") == 1
+        assert await scheduler.claim() == ("a", {"prompt": "orders"})
+        await scheduler.ack("a")
+        assert await scheduler.claim() == ("b", {"prompt": "stock"})
+        await scheduler.ack("b")
+        assert await _empty(scheduler)
+    asyncio.run(run())
+
+def test_job_is_abandoned_after_max_deliveries(make_scheduler, monkeypatch):
+    monkeypatch.setattr(settings, "job_max_deliveries", 2)
+    abandoned = []
+
+    async def on_abandoned(job_id):
+        abandoned.append(job_id)
+
+    async def run():
+        scheduler = make_scheduler(on_abandoned=on_abandoned)
+        await scheduler.submit("a", {"prompt": "orders"})
+        later = time.time() + settings.job_visibility_seconds + 1
+        await scheduler.claim()
+        assert (await scheduler.reap(later))["requeued"] == ["a"]
+        await scheduler.claim()
+        assert (await scheduler.reap(later))["abandoned"] == ["a"]
+        assert await scheduler.claim() is None
+        assert await _empty(scheduler)
+    asyncio.run(run())
+    assert abandoned == ["a"]
+
+def test_workers_ack_finished_jobs_and_release_interrupted_ones(make_scheduler):
+    done, started, block = [], asyncio.Event(), asyncio.Event()
+
+    async def handler(job_id, prompt):
+        if prompt == "slow":
+            started.set()
+            await block.wait()
+        done.append(job_id)
+
+    async def run():
+        scheduler = make_scheduler(handler)
+        await scheduler.start()
+        await scheduler.submit("a", {"prompt": "fast"}, JobPriority.HIGH)
+        await scheduler.submit("b", {"prompt": "slow"})
+        await asyncio.wait_for(started.wait(), 5)
+        assert done == ["a"]
+        assert await scheduler.client.zrange(PROCESSING_KEY, 0, -1) == ["b"]
+        await scheduler.stop()  # Shutdown mid-generation hands the job back at once
+        assert await scheduler.client.zrange(PROCESSING_KEY, 0, -1) == []
+        assert await scheduler.claim() == ("b", {"prompt": "slow"})
+    asyncio.run(run())
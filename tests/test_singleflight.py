@@ -0,0 +1,44 @@
+import threading
+import time
+import pytest
+from backend import deadlines
+from backend.singleflight import SingleFlight
+
+def _slow_leader(flight: SingleFlight, key: str, seconds: float) -> threading.Thread:
+    leader = threading.Thread(target=flight.do, args=(key, lambda: time.sleep(seconds) or "plan"))
+    leader.start()
+    time.sleep(0.1)
+    return leader
+
+def test_follower_stops_at_its_own_deadline():
+    flight = SingleFlight()
+    leader = _slow_leader(flight, "key", 1.5)
+    started = time.monotonic()
+    with deadlines.scope(deadlines.Budget(time.time() + 0.3)):
+        with pytest.raises(deadlines.DeadlineExceeded):
+            flight.do("key", lambda: "unused")
+    assert time.monotonic() - started < 1.0
+    leader.join()
+
+def test_follower_stops_when_cancelled():
+    flight = SingleFlight()
+    leader = _slow_leader(flight, "key", 1.5)
+    budget = deadlines.Budget()
+    threading.Timer(0.2, budget.cancel.set).start()
+    with deadlines.scope(budget):
+        with pytest.raises(deadlines.JobCancelled):
+            flight.do("key", lambda: "unused")
+    leader.join()
+
+def test_remote_follower_stops_at_its_own_deadline():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    owner = SingleFlight(fakeredis.FakeRedis(server=server, decode_responses=True))
+    follower = SingleFlight(fakeredis.FakeRedis(server=server, decode_responses=True))
+    leader = _slow_leader(owner, "key", 1.5)
+    started = time.monotonic()
+    with deadlines.scope(deadlines.Budget(time.time() + 0.3)):
+        with pytest.raises(deadlines.DeadlineExceeded):
+            follower.do("key", lambda: "unused")
+    assert time.monotonic() - started < 1.0
+    leader.join()
@@ -0,0 +1,27 @@
+from backend.prompt_generator import MARKER, MarkerStripper
+
+PLAN = "Overview\nThe system is split into an API gateway, an order service and an inventory service.\n" * 3
+
+def _chunks(text: str, size: int = 4):
+    return [text[start:start + size] for start in range(0, len(text), size)]
+
+def _stream(chunks):
+    stripper = MarkerStripper()
+    outputs = [stripper.feed(chunk) for chunk in chunks]
+    return outputs, "".join(outputs) + stripper.flush()
+
+def test_first_output_is_not_held_back():
+    chunks = _chunks(PLAN)
+    outputs, text = _stream(chunks)
+    first = next(index for index, output in enumerate(outputs) if output)
+    # Held back only until the buffer is longer than MARKER: 7 four-char chunks here.
+    assert first + 1 <= len(MARKER) // 4 + 1
+    assert text == PLAN
+
+def test_echoed_marker_is_stripped():
+    outputs, text = _stream(_chunks(MARKER + "\n" + PLAN))
+    assert text == PLAN
+
+def test_marker_after_short_preamble_is_stripped():
+    _, text = _stream(_chunks("Sure!\n" + MARKER + PLAN))
+    assert text == PLAN
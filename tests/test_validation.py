@@ -0,0 +1,50 @@
+from backend.validation import AttemptAborted, StreamValidator, record_abort, validation_stats
+
+DIAGRAM = """
++------------------+
+|   API Gateway    |
++------------------+
+         |
+         v
+         |
+         v
+         |
+         v
+         |
+         v
++------------------+
+|  Order Service   |
++------------------+
+         |
+         v
+         |
+         v
+         |
+         v
+         |
+         v
+"""
+
+def test_ascii_diagram_is_not_a_loop():
+    assert not StreamValidator._is_looping(DIAGRAM.lower())
+
+def test_horizontal_rule_is_not_a_loop():
+    body = "## scalability\nscale the api tier horizontally behind the gateway.\n" + "-" * 80 + "\n"
+    assert not StreamValidator._is_looping(body)
+
+def test_markdown_table_borders_are_not_a_loop():
+    rows = "".join(f"| component {index} | owner {index} |\n|---|---|\n" for index in range(10))
+    assert not StreamValidator._is_looping(rows)
+
+def test_repeated_sentence_is_a_loop():
+    body = "the system uses redis for caching. " * 20
+    assert StreamValidator._is_looping(body)
+
+def test_alternating_lines_are_a_loop():
+    body = "\n".join(["use kafka for the event streaming layer.", "use redis for the caching layer please."] * 4)
+    assert StreamValidator._is_looping(body)
+
+def test_savings_use_the_attempt_budget():
+    before = validation_stats()["tokens_saved"]
+    record_abort(AttemptAborted("repetition_loop", "", tokens=100, max_tokens=512), "attempt 1")
+    assert validation_stats()["tokens_saved"] - before == 412